@@ -0,0 +1,154 @@
+"""Production entry point: serves the app under uvicorn, an ASGI server.
+
+    python asgi.py                            # HOST, PORT and WEB_CONCURRENCY (worker processes) from the environment
+    uvicorn --factory asgi:create_app --workers 4
+
+Views written as coroutines (/chatbot, /get-guide/<topic>, the /generate-* resource guides
+and the /summarize-video/<job_id> long poll) are awaited on the server's event loop, so a
+request waiting on Gemini holds a coroutine rather than a thread and one process can keep
+hundreds of those waits open; raise LLM_MAX_CONCURRENT and LLM_MAX_WAITING to match. Their
+SQLite work runs on main.db_executor. Every other route is plain WSGI and runs on
+WSGI_THREADS threads through a2wsgi. (The Flask debug server and test client run coroutine
+views on main.view_loop instead.)
+"""
+import inspect
+import io
+import os
+
+from a2wsgi import WSGIMiddleware
+from a2wsgi.wsgi import build_environ
+from werkzeug.exceptions import HTTPException
+
+import main
+
+
+class AsyncFlask:
+    """ASGI application serving a Flask app: coroutine views are awaited on the event loop
+    inside a Flask request context, with the same hooks, error handlers and session handling
+    as Flask's own dispatch; everything else goes to the WSGI app on a thread pool."""
+
+    def __init__(self, app, wsgi_threads=16):
+        self.app = app
+        self.wsgi = WSGIMiddleware(app, workers=wsgi_threads)
+        self.async_endpoints = {endpoint for endpoint, view in app.view_functions.items() if inspect.iscoroutinefunction(view)}
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(receive, send)
+        if scope['type'] == 'http' and self._endpoint(scope) in self.async_endpoints:
+            return await self._serve(scope, receive, send)
+        return await self.wsgi(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                main.start_background_work()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                main.db_executor.shutdown(wait=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    # Function to find the endpoint a request is for; preflights, redirects, 404s and 405s are left to Flask
+    def _endpoint(self, scope):
+        if scope['method'] == 'OPTIONS':
+            return None
+        environ = build_environ(scope, io.BytesIO())
+        try:
+            endpoint, _ = self.app.url_map.bind_to_environ(environ).match()
+        except HTTPException:
+            return None
+        return endpoint
+
+    async def _read_body(self, receive):
+        # Read at most one byte past the limit, so Flask answers an oversized body with a 413
+        limit = self.app.config['MAX_CONTENT_LENGTH']
+        body = bytearray()
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return None
+            body += message.get('body', b'')
+            if not message.get('more_body') or (limit is not None and len(body) > limit):
+                return bytes(body)
+
+    async def _serve(self, scope, receive, send):
+        body = await self._read_body(receive)
+        if body is None:
+            return
+        environ = build_environ(scope, io.BytesIO(body))
+        environ['CONTENT_LENGTH'] = str(len(body))
+        response = await self._dispatch(environ)
+
+        app_iter, status, headers = response.get_wsgi_response(environ)
+        await send({
+            'type': 'http.response.start',
+            'status': int(status.split(' ', 1)[0]),
+            'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers],
+        })
+        try:
+            for chunk in app_iter:
+                if chunk:
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            # Closing the response closes its body and runs its call_on_close callbacks, as
+            # closing app_iter would under a WSGI server
+            response.close()
+
+    # Flask.wsgi_app, with the view awaited
+    async def _dispatch(self, environ):
+        app = self.app
+        ctx = app.request_context(environ)
+        error = None
+        try:
+            try:
+                ctx.push()
+                return await self._full_dispatch(ctx.request)
+            except Exception as e:
+                error = e
+                return app.handle_exception(e)
+            except BaseException as e:
+                error = e
+                raise
+        finally:
+            if error is not None and app.should_ignore_error(error):
+                error = None
+            ctx.pop(error)
+
+    # Flask.full_dispatch_request, with the view awaited
+    async def _full_dispatch(self, request):
+        app = self.app
+        try:
+            rv = app.preprocess_request()
+            if rv is None:
+                if request.routing_exception is not None:
+                    app.raise_routing_exception(request)
+                rv = await app.view_functions[request.url_rule.endpoint](**request.view_args)
+        except Exception as e:
+            rv = app.handle_user_exception(e)
+        return app.finalize_request(rv)
+
+
+# Function to build the ASGI app; uvicorn calls it once in each worker process
+def create_app(config=None):
+    app = main.create_app(config)
+    return AsyncFlask(app, wsgi_threads=app.config['WSGI_THREADS'])
+
+
+# Function to run the production server
+def serve():
+    import uvicorn
+    uvicorn.run(
+        'asgi:create_app',
+        factory=True,
+        host=os.getenv('HOST', '127.0.0.1'),
+        port=int(os.getenv('PORT', 5000)),
+        workers=int(os.getenv('WEB_CONCURRENCY', 1)),
+        proxy_headers=True,
+    )
+
+
+if __name__ == '__main__':
+    serve()
@@ -0,0 +1,178 @@
+import logging
+import multiprocessing
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+
+import database
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# bcrypt only reads the first 72 bytes of a password, so longer ones are refused rather than truncated
+MAX_PASSWORD_BYTES = 72
+
+
+class HasherBusy(Exception):
+    """Raised instead of queueing more password hashing; retry_after is in seconds."""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+# Function to hash a password; runs in the hashing process pool
+def _hash(password, rounds):
+    import bcrypt
+    started = time.time()
+    hashed = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=rounds)).decode('utf-8')
+    return hashed, started, time.time() - started
+
+
+# Function to check a password against its hash; runs in the hashing process pool
+def _check(hashed, password):
+    import bcrypt
+    started = time.time()
+    try:
+        matches = bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+    except ValueError:
+        # A password over 72 bytes, or a stored value that isn't a bcrypt hash, never matches
+        matches = False
+    return matches, started, time.time() - started
+
+
+# Function to read the cost (log2 of the rounds) a bcrypt hash was made with
+def hash_rounds(hashed):
+    try:
+        return int(hashed.split('$')[2])
+    except (IndexError, ValueError):
+        return None
+
+
+class PasswordHasher:
+    """Runs bcrypt in worker processes, so a burst of logins doesn't hold the GIL of the
+    process serving every other request.
+
+    At most max_pending hashes may be queued or running at once; beyond that callers get
+    HasherBusy, as they do if their hash isn't done within max_wait seconds. New hashes are
+    made with `rounds`, and hashes made with other rounds are redone after a successful login.
+    """
+
+    def __init__(self, database, rounds=12, max_workers=2, max_pending=32, max_wait=10):
+        self.database = database
+        self.rounds = rounds
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.max_wait = max_wait
+        self.pending = 0
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                # Spawn rather than fork: forking a multi-threaded web server can deadlock the child
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                     mp_context=multiprocessing.get_context('spawn'))
+            return self._executor
+
+    # Function to queue one hashing call, or raise HasherBusy if too many are waiting
+    def _submit(self, operation, fn, *args):
+        with self._lock:
+            if self.pending >= self.max_pending:
+                metrics.observe_password_hash_rejected(operation, 'busy')
+                raise HasherBusy("Too many sign-ins at once, please try again shortly", self.max_wait)
+            self.pending += 1
+            metrics.set_password_hashes_pending(self.pending)
+        submitted = time.time()
+        future = self._pool().submit(fn, *args)
+        future.add_done_callback(lambda done: self._finished(operation, submitted, done))
+        return future
+
+    def _finished(self, operation, submitted, future):
+        with self._lock:
+            self.pending -= 1
+            metrics.set_password_hashes_pending(self.pending)
+        if future.exception() is None:
+            _, started, seconds = future.result()
+            metrics.observe_password_hash(operation, max(0.0, started - submitted), seconds)
+
+    def _run(self, operation, fn, *args):
+        future = self._submit(operation, fn, *args)
+        try:
+            return future.result(timeout=self.max_wait)[0]
+        except FutureTimeout:
+            # The hash still finishes in its worker; the caller just stops waiting for it
+            metrics.observe_password_hash_rejected(operation, 'timeout')
+            raise HasherBusy("Signing in is taking too long, please try again shortly", self.max_wait) from None
+
+    def hash(self, password):
+        return self._run('hash', _hash, password, self.rounds)
+
+    def check(self, hashed, password):
+        return self._run('check', _check, hashed, password)
+
+    def needs_rehash(self, hashed):
+        return hash_rounds(hashed) not in (None, self.rounds)
+
+    def rehash(self, user_id, old_hash, password):
+        """Re-hash a password that just checked out with the current rounds, in the background.
+        Skipped when the pool is busy; the user's next login tries again."""
+        try:
+            future = self._submit('rehash', _hash, password, self.rounds)
+        except HasherBusy:
+            return None
+        future.add_done_callback(lambda done: self._store(user_id, old_hash, done))
+        return future
+
+    def _store(self, user_id, old_hash, future):
+        try:
+            new_hash = future.result()[0]
+        except Exception as e:
+            logger.warning("Could not rehash the password of user %s: %s", user_id, e)
+            return
+
+        # Only replace the hash that was checked, in case the password changed meanwhile
+        with database.connection(self.database) as db:
+            db.execute('UPDATE users SET password = ? WHERE id = ? AND password = ?', (new_hash, user_id, old_hash))
+        logger.info("Rehashed the password of user %s with %d rounds.", user_id, self.rounds)
+
+
+class PrincipalCache:
+    """Signed-in users known to exist, by id, so authenticated requests don't each look the
+    user up. An entry is checked against the users table again after `ttl` seconds; the
+    `max_entries` most recently used are kept."""
+
+    def __init__(self, ttl=300, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    # Function to get a user's principal, calling load(user_id) on a miss (None if there's no such user)
+    def get(self, user_id, load):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(user_id)
+                return entry[1]
+
+        principal = load(user_id)
+        if principal is None:
+            self.forget(user_id)
+        else:
+            self.put(principal)
+        return principal
+
+    def put(self, principal):
+        with self._lock:
+            self._entries[principal['id']] = (time.monotonic() + self.ttl, principal)
+            self._entries.move_to_end(principal['id'])
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def forget(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
@@ -0,0 +1,125 @@
+"""Concurrency benchmark of the ASGI server: how many model waits one process can hold.
+
+Starts asgi.py in a fresh process with the fake LLM backend and a temporary database,
+then for each --concurrency level sends that many /chatbot requests at once and waits
+for all of them. Each model call takes --llm-latency-ms, so with enough headroom every
+level should finish in about one model latency; the server's resident memory and thread
+count are sampled after each level to show they stay flat as the waits pile up, along
+with its CPU time so far: the client runs in this process, and on a small machine it
+can be the bottleneck rather than the server.
+Results are printed, and written with --output, as JSON:
+
+    python benchmarks/bench_asgi.py --concurrency 50 100 200 400 --output asgi.json
+"""
+import argparse
+import asyncio
+import http.cookiejar
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import common
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[50, 100, 200, 400], help='requests sent at once, per level')
+    parser.add_argument('--rounds', type=int, default=3, help='batches sent at each level')
+    parser.add_argument('--llm-latency-ms', type=float, default=1000, help='latency of a fake model call')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--output', help='also write the JSON results to this file')
+    return parser.parse_args()
+
+
+# Function to read a process's resident memory (MB), thread count and CPU time used so far from /proc
+def process_usage(pid):
+    usage = {}
+    with open(f'/proc/{pid}/status') as f:
+        for line in f:
+            name, _, value = line.partition(':')
+            if name == 'VmRSS':
+                usage['rss_mb'] = round(int(value.split()[0]) / 1024, 1)
+            elif name == 'Threads':
+                usage['threads'] = int(value)
+    with open(f'/proc/{pid}/stat') as f:
+        fields = f.read().rsplit(')', 1)[1].split()
+    usage['cpu_seconds'] = round((int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK'), 2)
+    return usage
+
+
+# Function to start the server in an empty directory, with the model gate opened wide enough for every level
+def start_server(args, directory):
+    most = str(max(args.concurrency) * 2)
+    env = dict(os.environ, PYTHONPATH=common.ROOT, PYTHONDONTWRITEBYTECODE='1', PORT=str(args.port),
+               LLM_BACKEND='fake', FAKE_LLM_LATENCY_MS=str(args.llm_latency_ms), FAKE_LLM_LATENCY_SIGMA='0',
+               LLM_MAX_CONCURRENT=most, LLM_MAX_WAITING=most, LOG_LEVEL='WARNING',
+               LLM_USER_RATE='1000000', LLM_USER_BURST='1000000', LLM_IP_RATE='1000000', LLM_IP_BURST='1000000')
+    init = 'import main; app = main.create_app()\nwith app.app_context(): main.init_db()'
+    subprocess.run([sys.executable, '-c', init], cwd=directory, env=env, check=True)
+    return subprocess.Popen([sys.executable, os.path.join(common.ROOT, 'asgi.py')], cwd=directory, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+async def wait_until_up(client, server):
+    for _ in range(100):
+        if server.poll() is not None:
+            raise RuntimeError("The server exited during startup")
+        try:
+            await client.get('/metrics')
+            return
+        except Exception:
+            await asyncio.sleep(0.1)
+    raise RuntimeError("The server did not start")
+
+
+async def chat(client, samples, errors, i):
+    started = time.perf_counter()
+    try:
+        response = await client.post('/chatbot', json={"message": f"Question {i}"})
+        if response.status_code != 200:
+            errors[response.status_code] = errors.get(response.status_code, 0) + 1
+            return
+    except Exception as e:
+        errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+        return
+    samples.append(time.perf_counter() - started)
+
+
+async def run(args, server):
+    import httpx
+    # A new connection per request: a reused one can reach the server just as its keep-alive timeout
+    # closes it, failing with a ReadError that isn't the server's doing
+    limits = httpx.Limits(max_connections=max(args.concurrency), max_keepalive_connections=0)
+    # Refusing the session cookie makes every chat a new conversation, rather than one ever longer history
+    cookies = http.cookiejar.CookieJar(http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+    async with httpx.AsyncClient(base_url=f'http://127.0.0.1:{args.port}', timeout=120, limits=limits, cookies=cookies) as client:
+        await wait_until_up(client, server)
+        results = {"idle": process_usage(server.pid), "levels": {}}
+        for concurrency in args.concurrency:
+            print(f"Running {concurrency} concurrent chats...", file=sys.stderr)
+            samples, errors = [], {}
+            started = time.perf_counter()
+            for _ in range(args.rounds):
+                await asyncio.gather(*[chat(client, samples, errors, i) for i in range(concurrency)])
+            elapsed = time.perf_counter() - started
+            results["levels"][concurrency] = dict(common.summarize(samples, elapsed), errors=errors, **process_usage(server.pid))
+        return results
+
+
+def main():
+    args = parse_args()
+    with tempfile.TemporaryDirectory(prefix='grow-bench-') as directory:
+        server = start_server(args, directory)
+        try:
+            results = asyncio.run(run(args, server))
+        finally:
+            server.terminate()
+            server.wait()
+
+    common.write_results({"environment": common.environment(), "config": vars(args), **results}, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,293 @@
+"""Load test of the main endpoints, run in-process against a temporary database.
+
+The app runs with the fake LLM backend, so the numbers measure the server's own overhead
+plus the simulated model latency (--llm-latency-ms, 0 to leave the model out entirely).
+Each scenario runs for --duration seconds on --workers threads, then a weighted mix of all
+of them runs the same way. Results are printed, and written with --output, as JSON:
+
+    python benchmarks/bench_endpoints.py --workers 8 --duration 10 --output endpoints.json
+"""
+import argparse
+import hashlib
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from io import BytesIO
+
+import common
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=8, help='concurrent client threads per scenario')
+    parser.add_argument('--duration', type=float, default=10, help='seconds each scenario runs')
+    parser.add_argument('--stories', type=int, default=300, help='approved stories with images to seed')
+    parser.add_argument('--llm-latency-ms', type=float, default=50, help='median latency of a fake model call')
+    parser.add_argument('--scenarios', nargs='*', help='only run these scenarios')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='also write the JSON results to this file')
+    return parser.parse_args()
+
+
+# Function to point the app at a throwaway working directory and the fake backend; must run before main is imported
+def configure(args):
+    os.chdir(tempfile.mkdtemp(prefix='grow-bench-'))
+    os.environ.update({
+        'LLM_BACKEND': 'fake',
+        'FAKE_LLM_LATENCY_MS': str(args.llm_latency_ms),
+        'FAKE_LLM_SEED': str(args.seed),
+        # The benchmark drives a handful of users from one address, far above the real limits
+        'LLM_USER_RATE': '1000000',
+        'LLM_USER_BURST': '1000000',
+        'LLM_IP_RATE': '1000000',
+        'LLM_IP_BURST': '1000000',
+    })
+
+
+# Function to make a test image; noise keeps it from compressing unrealistically well
+def make_image(rng, width=1600, height=1200):
+    from PIL import Image
+    image = Image.new('RGB', (width, height), tuple(rng.randrange(256) for _ in range(3)))
+    image.paste(Image.frombytes('RGB', (width // 4, height // 4), rng.randbytes(width // 4 * height // 4 * 3)).resize((width, height)))
+    output = BytesIO()
+    image.save(output, format='JPEG', quality=85)
+    return output.getvalue()
+
+
+# Function to seed approved stories that each carry an image and its resized variants
+def seed_stories(main, app, count, rng):
+    import story_images
+    # Resizing is the slow part, so a few distinct images are shared between the stories
+    variant_sets = [story_images.build_variants(make_image(rng)) for _ in range(8)]
+    with app.app_context():
+        db = main.get_db()
+        for number in range(count):
+            variants = variant_sets[number % len(variant_sets)]
+            mime_type, _, _, master = variants['master']
+            story_id = db.execute(
+                'INSERT INTO stories (name, email, story, image, mime_type, image_etag, approved) VALUES (?, ?, ?, ?, ?, ?, 1)',
+                (f'Storyteller {number}', f'story{number}@example.com', ' '.join(['An inspiring sentence.'] * rng.randrange(20, 120)),
+                 master, mime_type, hashlib.sha256(master).hexdigest())
+            ).lastrowid
+            db.executemany(
+                'INSERT INTO StoryImage (story_id, variant, mime_type, width, height, data, etag) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                [(story_id, variant, mime, width, height, data, hashlib.sha256(data).hexdigest())
+                 for variant, (mime, width, height, data) in variants.items()]
+            )
+        db.commit()
+
+
+class Recorder:
+    """Collects per-endpoint latencies and unexpected statuses from every worker thread."""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def request(self, client, method, label, path, expected=(200,), **kwargs):
+        start = time.perf_counter()
+        response = client.open(path, method=method, **kwargs)
+        response.get_data()  # Streamed bodies are only produced when read
+        response.close()  # Like a WSGI server would, which also finishes the request's metrics
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.samples[label].append(elapsed)
+            if response.status_code not in expected:
+                self.errors[label] += 1
+        return response
+
+
+class Worker:
+    """One simulated client: its own test client (and so its own session cookie) and RNG."""
+
+    _counter = 0
+    _counter_lock = threading.Lock()
+
+    def __init__(self, main, app, recorder, rng):
+        self.main = main
+        self.app = app
+        self.recorder = recorder
+        self.rng = rng
+        self.client = app.test_client()
+        self.user_id = self.new_user()
+        self.log_in(self.user_id)
+
+    @classmethod
+    def unique(cls):
+        with cls._counter_lock:
+            cls._counter += 1
+            return cls._counter
+
+    # Function to create a user directly, skipping bcrypt, for scenarios that don't measure signup
+    def new_user(self):
+        with self.app.app_context():
+            db = self.main.get_db()
+            user_id = db.execute('INSERT INTO users (email, password) VALUES (?, ?)',
+                                 (f'worker{self.unique()}@example.com', 'not-a-hash')).lastrowid
+            db.commit()
+        return user_id
+
+    def log_in(self, user_id):
+        with self.client.session_transaction() as session:
+            session['user_id'] = user_id
+
+    def request(self, method, label, path, **kwargs):
+        return self.recorder.request(self.client, method, label, path, **kwargs)
+
+
+def auth(worker):
+    email = f'bench{worker.unique()}@example.com'
+    worker.request('POST', 'POST /signup', '/signup', json={'email': email, 'password': 'benchmark'}, expected=(201,))
+    worker.request('POST', 'POST /login', '/login', json={'email': email, 'password': 'benchmark'})
+
+
+def guide_cold(worker):
+    # A fresh user has no guide yet: copied from the template pool, or generated while the pool fills
+    worker.log_in(worker.new_user())
+    worker.request('GET', 'GET /get-guide (cold)', f'/get-guide/{worker.rng.choice(worker.main.topics)}')
+    worker.log_in(worker.user_id)
+
+
+def guide_warm(worker):
+    worker.request('GET', 'GET /get-guide (warm)', f'/get-guide/{worker.main.topics[worker.user_id % len(worker.main.topics)]}')
+
+
+def progress_burst(worker):
+    topic = worker.main.topics[worker.user_id % len(worker.main.topics)]
+    for day in range(1, 22):
+        worker.request('POST', 'POST /update-day-completion', '/update-day-completion',
+                       json={'topic': topic, 'day': day, 'completed': worker.rng.random() < 0.8})
+
+
+def guide_progress(worker):
+    # The guide screen's single request for a guide and the progress on it
+    worker.request('GET', 'GET /get-guide/progress', f'/get-guide/{worker.main.topics[worker.user_id % len(worker.main.topics)]}/progress')
+
+
+def guide_revalidate(worker):
+    # A browser reloading the guide screen: it sends the ETag it has and usually gets a 304
+    path = f'/get-guide/{worker.main.topics[worker.user_id % len(worker.main.topics)]}/progress'
+    etag = worker.client.get(path).headers.get('ETag')
+    for _ in range(5):
+        worker.request('GET', 'GET /get-guide/progress (revalidate)', path, expected=(304,), headers={'If-None-Match': etag})
+
+
+def progress_batch(worker):
+    # The same 21 changes as progress_burst, sent the way the guide screen now sends them
+    topic = worker.main.topics[worker.user_id % len(worker.main.topics)]
+    updates = [{'topic': topic, 'day': day, 'completed': worker.rng.random() < 0.8} for day in range(1, 22)]
+    worker.request('POST', 'POST /update-progress', '/update-progress', json={'updates': updates})
+
+
+def stories(worker):
+    # Scroll through a few pages, loading the thumbnails the page shows
+    path = '/approved-stories?limit=9'
+    for _ in range(3):
+        page = worker.request('GET', 'GET /approved-stories', path).get_json()
+        for story in page['stories'][:3]:
+            if story['thumbnail']:
+                worker.request('GET', 'GET /story/<id>/image', story['thumbnail'], headers={'Accept': 'image/webp,*/*'})
+        if not page['next']:
+            break
+        path = f"/approved-stories?limit=9&after={page['next']}"
+
+
+def story_search(worker):
+    # A selective search for one storyteller, and a broad one that matches every seeded story
+    worker.request('GET', 'GET /stories/search (selective)', f'/stories/search?q=storyteller+{worker.rng.randrange(100)}&limit=9')
+    worker.request('GET', 'GET /stories/search (broad)', '/stories/search?q=inspiring&limit=9')
+
+
+def chatbot(worker):
+    # A short conversation on a fresh session
+    worker.client = worker.app.test_client()
+    worker.log_in(worker.user_id)
+    for message in ('Hi! I want to get into robotics.', 'Where do I start?', 'What if I fail?', 'Thanks!'):
+        worker.request('POST', 'POST /chatbot', '/chatbot', json={'message': message})
+
+
+SCENARIOS = {
+    'auth': auth,
+    'guide_cold': guide_cold,
+    'guide_warm': guide_warm,
+    'progress_burst': progress_burst,
+    'guide_progress': guide_progress,
+    'guide_revalidate': guide_revalidate,
+    'progress_batch': progress_batch,
+    'stories': stories,
+    'story_search': story_search,
+    'chatbot': chatbot,
+}
+
+# Relative frequency of each scenario in the mixed run
+MIX = {'auth': 1, 'guide_cold': 1, 'guide_progress': 4, 'progress_batch': 2, 'stories': 4, 'story_search': 1, 'chatbot': 2}
+
+
+# Function to run one scenario (or a weighted choice among several) on worker threads for a while
+def run(main, app, choose, workers, duration, seed):
+    recorder = Recorder()
+    operations = [0]
+    lock = threading.Lock()
+
+    # Give every worker's user a guide first, so warm reads are warm from the start
+    pool = [Worker(main, app, Recorder(), random.Random(seed * 1000 + number)) for number in range(workers)]
+    for worker in pool:
+        guide_warm(worker)
+        worker.recorder = recorder
+
+    def loop(worker):
+        while time.perf_counter() < deadline:
+            choose(worker.rng)(worker)
+            with lock:
+                operations[0] += 1
+
+    start = time.perf_counter()
+    deadline = start + duration
+    threads = [threading.Thread(target=loop, args=(worker,)) for worker in pool]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    return {
+        "elapsed_s": round(elapsed, 3),
+        "operations": operations[0],
+        "endpoints": {label: dict(common.summarize(samples, elapsed), errors=recorder.errors[label])
+                      for label, samples in sorted(recorder.samples.items())},
+    }
+
+
+def main():
+    args = parse_args()
+    configure(args)
+    import main as app_main
+    app = app_main.create_app()
+
+    with app.app_context():
+        app_main.init_db()
+    print(f"Seeding {args.stories} stories...", file=sys.stderr)
+    seed_stories(app_main, app, args.stories, random.Random(args.seed))
+
+    names = args.scenarios or list(SCENARIOS)
+    results = {"environment": common.environment(), "config": vars(args), "scenarios": {}}
+    for name in names:
+        print(f"Running {name}...", file=sys.stderr)
+        results["scenarios"][name] = run(app_main, app, lambda rng, name=name: SCENARIOS[name], args.workers, args.duration, args.seed)
+
+    if not args.scenarios:
+        print("Running mixed...", file=sys.stderr)
+        population, weights = zip(*MIX.items())
+        results["scenarios"]["mixed"] = run(app_main, app, lambda rng: SCENARIOS[rng.choices(population, weights)[0]],
+                                            args.workers, args.duration, args.seed)
+
+    common.write_results(results, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""Micro-benchmarks of hot helpers, timed with timeit.
+
+Covers story image encoding (the legacy base64 data URL against the current image URL),
+guide JSON decoding (model responses and stored GuideEntry rows) and the streaming day
+parser. Results are printed, and written with --output, as JSON:
+
+    python benchmarks/bench_micro.py --output micro.json
+"""
+import argparse
+import base64
+import json
+import os
+import random
+import tempfile
+import timeit
+
+import common
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=7, help='timing runs per benchmark; the samples are per-call times of each run')
+    parser.add_argument('--image-kb', type=int, default=300, help='size of the story image for the encoding benchmarks')
+    parser.add_argument('--output', help='also write the JSON results to this file')
+    return parser.parse_args()
+
+
+# Function to time fn, picking a loop count that makes each run take about 0.2 s
+def measure(fn, repeat):
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    number = max(1, number)
+    runs = timer.repeat(repeat=repeat, number=number)
+    return dict(common.summarize([run / number for run in runs], unit='us'), loops=number)
+
+
+def main():
+    args = parse_args()
+    os.chdir(tempfile.mkdtemp(prefix='grow-bench-'))
+    os.environ.setdefault('LLM_BACKEND', 'fake')
+    import main as app_main
+    import guide_generation
+    from streaming import GuideDayParser
+
+    rng = random.Random(1)
+    image = rng.randbytes(args.image_kb * 1024)
+    story = {'id': 42, 'image_etag': 'a' * 64}
+
+    guide = {"goal": app_main.topics[0], "guide": [
+        {"day": day, "title": f"Day {day} activity", "approaches": [f"Approach {n} for day {day}" for n in range(1, 5)]}
+        for day in range(1, 22)
+    ]}
+    guide_text = '```json\n' + json.dumps(guide, indent=2) + '\n```'
+    rows = [{"day": item["day"], "title": item["title"], "approaches": json.dumps(item["approaches"]), "completed": 0}
+            for item in guide["guide"]]
+    stream_chunks = [guide_text[i:i + 40] for i in range(0, len(guide_text), 40)]
+
+    def parse_stream():
+        parser = GuideDayParser()
+        for chunk in stream_chunks:
+            parser.feed(chunk)
+
+    benchmarks = {
+        # What /approved-stories did per story before images got their own URLs
+        "story_image_base64_data_url": lambda: "data:image/jpeg;base64," + base64.b64encode(image).decode('utf-8'),
+        "story_image_url": lambda: app_main.story_image_url(story, 'thumb'),
+        "guide_response_parse_json": lambda: guide_generation.parse_json(guide_text),
+        "guide_entries_format": lambda: [app_main.format_guide_entry(row) for row in rows],
+        "guide_stream_day_parser": parse_stream,
+    }
+
+    results = {"environment": common.environment(), "config": vars(args), "benchmarks": {}}
+    for name, fn in benchmarks.items():
+        results["benchmarks"][name] = measure(fn, args.repeat)
+
+    common.write_results(results, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""Startup benchmark: how long a fresh process takes to import and build the app.
+
+Each step runs in a new interpreter, the way a worker boot or a `flask init-db` does:
+importing main, building the app with create_app(), and building it and creating the
+schema in an empty database. With --importtime, the slowest imports (by cumulative
+time, from python -X importtime) are reported too, so a heavy import creeping back in
+at module level shows up by name. Results are printed, and written with --output, as JSON:
+
+    python benchmarks/bench_startup.py --output startup.json
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import common
+
+# Each step is timed from interpreter start to the end of its code
+STEPS = {
+    'import': 'import main',
+    'create_app': 'import main; main.create_app()',
+    'init_db': 'import main; app = main.create_app()\nwith app.app_context(): main.init_db()',
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=10, help='fresh processes started per step')
+    parser.add_argument('--importtime', type=int, default=15, metavar='N', help='report the N slowest imports (0 to skip)')
+    parser.add_argument('--output', help='also write the JSON results to this file')
+    return parser.parse_args()
+
+
+# Function to run code in a fresh interpreter inside an empty directory, with no API key
+def run_python(code, *flags):
+    env = dict(os.environ, PYTHONPATH=common.ROOT, PYTHONDONTWRITEBYTECODE='1')
+    env.pop('API_KEY', None)
+    env.setdefault('LLM_BACKEND', 'gemini')
+    with tempfile.TemporaryDirectory(prefix='grow-bench-') as directory:
+        return subprocess.run([sys.executable, *flags, '-c', code], cwd=directory, env=env,
+                              capture_output=True, text=True, check=True)
+
+
+# Function to time one step, minus the time an interpreter needs to start and exit
+def measure(code, repeat, baseline=0.0):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run_python(code)
+        samples.append(max(0.0, time.perf_counter() - started - baseline))
+    return samples
+
+
+# Function to list the slowest imports of main by cumulative time, in ms
+def slowest_imports(count):
+    imports = []
+    for line in run_python('import main', '-X', 'importtime').stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        imports.append((int(cumulative) / 1000, name.strip()))
+    imports.sort(reverse=True)
+    return [{"module": name, "cumulative_ms": round(ms, 1)} for ms, name in imports[:count]]
+
+
+def main():
+    args = parse_args()
+    # Interpreter startup is the same for every step; measure it once and subtract it
+    interpreter = measure('pass', args.repeat)
+    baseline = sorted(interpreter)[len(interpreter) // 2]
+
+    results = {"environment": common.environment(), "config": vars(args),
+               "interpreter": common.summarize(interpreter), "steps": {}}
+    for name, code in STEPS.items():
+        print(f"Running {name}...", file=sys.stderr)
+        results["steps"][name] = common.summarize(measure(code, args.repeat, baseline))
+    if args.importtime:
+        results["slowest_imports"] = slowest_imports(args.importtime)
+
+    common.write_results(results, args.output)
+
+
+if __name__ == '__main__':
+    main()
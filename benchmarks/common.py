@@ -0,0 +1,64 @@
+import json
+import os
+import platform
+import sqlite3
+import sys
+import time
+
+# Benchmarks import the app's modules from the repository root
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+# Function to pick the p-th percentile (0-100) of a list of samples, nearest-rank
+def percentile(samples, p):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    rank = max(1, -(-len(ordered) * p // 100))
+    return ordered[int(rank) - 1]
+
+
+# Units summaries can be reported in, as multiples of a second
+UNITS = {'ms': 1000, 'us': 1000000}
+
+
+# Function to summarize latency samples (in seconds) in ms, or another unit for very fast code
+def summarize(samples, elapsed=None, unit='ms'):
+    scale = UNITS[unit]
+
+    def convert(seconds):
+        return None if seconds is None else round(seconds * scale, 3)
+
+    summary = {
+        "count": len(samples),
+        f"mean_{unit}": convert(sum(samples) / len(samples) if samples else None),
+        f"p50_{unit}": convert(percentile(samples, 50)),
+        f"p95_{unit}": convert(percentile(samples, 95)),
+        f"p99_{unit}": convert(percentile(samples, 99)),
+        f"max_{unit}": convert(max(samples) if samples else None),
+    }
+    if elapsed:
+        summary["throughput_rps"] = round(len(samples) / elapsed, 2)
+    return summary
+
+
+# Function to describe the machine and interpreter a run was made on, so results can be compared
+def environment():
+    return {
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "timestamp": time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+    }
+
+
+# Function to print the results and optionally write them to a JSON file
+def write_results(results, output=None):
+    text = json.dumps(results, indent=2)
+    if output:
+        with open(output, 'w') as f:
+            f.write(text + "\n")
+    print(text)
@@ -0,0 +1,116 @@
+import logging
+import threading
+import time
+import uuid
+
+import database
+
+logger = logging.getLogger(__name__)
+
+# Rough characters-per-token ratio for English text; close enough for budgeting
+# without an extra count_tokens round trip per turn
+CHARS_PER_TOKEN = 4
+
+
+# Function to estimate how many tokens a piece of text costs
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+class ChatStore:
+    """Server-side chat histories, kept within a token budget by summarizing older turns.
+
+    Messages live in the ChatMessage table keyed by conversation id. Once the unsummarized
+    messages of a conversation pass ``token_budget``, the oldest ones are folded into the
+    conversation's running summary until about half the budget is left, so the history
+    sent to the model each turn stays roughly constant in size.
+    """
+
+    def __init__(self, database_path, token_budget=2000):
+        self.database_path = database_path
+        self.token_budget = token_budget
+        self._compacting = set()
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        return database.connection(self.database_path)
+
+    def create(self, user_id=None):
+        conversation_id = uuid.uuid4().hex
+        now = time.time()
+        with self._connect() as db:
+            db.execute('INSERT INTO Conversation (id, user_id, created_at, updated_at) VALUES (?, ?, ?, ?)',
+                       (conversation_id, user_id, now, now))
+        return conversation_id
+
+    def exists(self, conversation_id):
+        return self._connect().execute('SELECT 1 FROM Conversation WHERE id = ?', (conversation_id,)).fetchone() is not None
+
+    def history(self, conversation_id):
+        """Returns the conversation as Gemini chat history: the running summary (if any)
+        followed by the unsummarized turns."""
+        db = self._connect()
+        summary = db.execute('SELECT summary FROM Conversation WHERE id = ?', (conversation_id,)).fetchone()
+        messages = db.execute('SELECT role, content FROM ChatMessage WHERE conversation_id = ? ORDER BY id',
+                              (conversation_id,)).fetchall()
+
+        history = []
+        if summary and summary['summary']:
+            history.append({"role": "user", "parts": "Here is a summary of what we talked about earlier:\n" + summary['summary']})
+            history.append({"role": "model", "parts": "Thanks, I remember! Let's keep going."})
+        history.extend({"role": message['role'], "parts": message['content']} for message in messages)
+        return history
+
+    def append(self, conversation_id, messages):
+        """Stores (role, content) pairs at the end of the conversation."""
+        now = time.time()
+        with self._connect() as db:
+            db.executemany('INSERT INTO ChatMessage (conversation_id, role, content, tokens, created_at) VALUES (?, ?, ?, ?, ?)',
+                           [(conversation_id, role, content, estimate_tokens(content), now) for role, content in messages])
+            db.execute('UPDATE Conversation SET updated_at = ? WHERE id = ?', (now, conversation_id))
+
+    def compact(self, conversation_id, summarize):
+        """Folds the oldest turns into the running summary if the history is over budget.
+
+        ``summarize(previous_summary, turns)`` returns the new summary text, where turns is a
+        list of (role, content) pairs. Returns True if anything was summarized.
+        """
+        db = self._connect()
+        messages = db.execute('SELECT id, role, content, tokens FROM ChatMessage WHERE conversation_id = ? ORDER BY id',
+                              (conversation_id,)).fetchall()
+        total = sum(message['tokens'] for message in messages)
+        if total <= self.token_budget:
+            return False
+
+        # Summarize whole user/model turns from the oldest until half the budget remains
+        oldest = []
+        while messages and (total > self.token_budget // 2 or len(oldest) % 2):
+            message = messages.pop(0)
+            oldest.append(message)
+            total -= message['tokens']
+
+        previous = db.execute('SELECT summary FROM Conversation WHERE id = ?', (conversation_id,)).fetchone()['summary']
+        summary = summarize(previous, [(message['role'], message['content']) for message in oldest])
+
+        with db:
+            db.execute('UPDATE Conversation SET summary = ? WHERE id = ?', (summary, conversation_id))
+            db.execute('DELETE FROM ChatMessage WHERE conversation_id = ? AND id <= ?', (conversation_id, oldest[-1]['id']))
+        return True
+
+    def compact_in_background(self, conversation_id, summarize):
+        """Runs compact() on a background thread so the summarization call never delays a reply."""
+        with self._lock:
+            if conversation_id in self._compacting:
+                return
+            self._compacting.add(conversation_id)
+
+        def run():
+            try:
+                self.compact(conversation_id, summarize)
+            except Exception as e:
+                logger.warning("Could not summarize conversation %s: %s", conversation_id, e)
+            finally:
+                with self._lock:
+                    self._compacting.discard(conversation_id)
+
+        threading.Thread(target=run, daemon=True).start()
@@ -0,0 +1,324 @@
+import hashlib
+import sqlite3
+import threading
+import time
+
+# Wait this long for another writer's lock instead of failing with "database is locked"
+BUSY_TIMEOUT_MS = 5000
+
+# Read the database file through a memory map of up to this many bytes
+MMAP_SIZE = 256 * 1024 * 1024
+
+# Prepared statements kept per connection; connections are reused, so this cache stays warm
+CACHED_STATEMENTS = 256
+
+_local = threading.local()
+
+# Callbacks told the duration of every statement run through a connection's execute methods
+_query_observers = []
+
+
+# Function to register a callback(seconds) that is called after each statement
+def observe_queries(callback):
+    _query_observers.append(callback)
+
+
+class TimedConnection(sqlite3.Connection):
+    """Connection that reports how long each execute/executemany/executescript call took.
+
+    Only the call itself is timed; rows fetched afterwards are read lazily and not included.
+    """
+
+    def _timed(self, method, *args):
+        if not _query_observers:
+            return method(*args)
+        started = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            elapsed = time.perf_counter() - started
+            for callback in _query_observers:
+                callback(elapsed)
+
+    def execute(self, *args):
+        return self._timed(super().execute, *args)
+
+    def executemany(self, *args):
+        return self._timed(super().executemany, *args)
+
+    def executescript(self, *args):
+        return self._timed(super().executescript, *args)
+
+
+# Function to open a new connection with the pragmas every connection should have
+def connect(path):
+    db = sqlite3.connect(path, timeout=BUSY_TIMEOUT_MS / 1000, cached_statements=CACHED_STATEMENTS, factory=TimedConnection)
+    db.row_factory = sqlite3.Row
+    # WAL lets readers run alongside the single writer; NORMAL sync is safe with WAL and much cheaper
+    db.execute('PRAGMA journal_mode = WAL')
+    db.execute('PRAGMA synchronous = NORMAL')
+    db.execute(f'PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}')
+    db.execute(f'PRAGMA mmap_size = {MMAP_SIZE}')
+    return db
+
+
+# Function to get this thread's connection to a database, opening it on first use
+def connection(path):
+    """Returns a connection that is reused by every later call from the same thread.
+
+    Callers must not close it. Worker threads and request threads each get their own,
+    since sqlite3 connections can't be shared across threads.
+    """
+    connections = getattr(_local, 'connections', None)
+    if connections is None:
+        connections = _local.connections = {}
+    db = connections.get(path)
+    if db is None:
+        db = connections[path] = connect(path)
+    return db
+
+
+# Function to hand a reused connection back in a clean state
+def release(db):
+    if db.in_transaction:
+        db.rollback()
+
+
+def _columns(db, table):
+    return [column['name'] for column in db.execute(f'PRAGMA table_info({table})')]
+
+
+# Migration 1: the original tables
+def create_base_schema(db):
+    db.execute('''CREATE TABLE IF NOT EXISTS users (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    email TEXT NOT NULL UNIQUE,
+                    password TEXT NOT NULL)''')
+
+    db.execute('''CREATE TABLE IF NOT EXISTS stories (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    name TEXT NOT NULL,
+                    email TEXT NOT NULL,
+                    story TEXT NOT NULL,
+                    image BLOB,
+                    mime_type TEXT,
+                    approved BOOLEAN DEFAULT 0)''')
+
+    db.execute('''CREATE TABLE IF NOT EXISTS GuideEntry (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id INTEGER NOT NULL,
+                    topic TEXT NOT NULL,
+                    day INTEGER NOT NULL,
+                    title TEXT NOT NULL,
+                    approaches TEXT NOT NULL,
+                    completed INTEGER DEFAULT 0,
+                    FOREIGN KEY(user_id) REFERENCES users(id))''')
+
+    db.execute('''CREATE TABLE IF NOT EXISTS UserProgress (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id INTEGER NOT NULL,
+                    topic TEXT NOT NULL,
+                    day INTEGER NOT NULL,
+                    completed BOOLEAN DEFAULT 0,
+                    UNIQUE(user_id, topic, day),
+                    FOREIGN KEY(user_id) REFERENCES users(id))''')
+
+
+# Migration 2: story image ETags, resized variants and the listing index
+def add_story_images(db):
+    # Databases from before this migration need the column and a one-off backfill
+    if 'image_etag' not in _columns(db, 'stories'):
+        db.execute('ALTER TABLE stories ADD COLUMN image_etag TEXT')
+    for story in db.execute('SELECT id, image FROM stories WHERE image IS NOT NULL AND image_etag IS NULL').fetchall():
+        db.execute('UPDATE stories SET image_etag = ? WHERE id = ?', (hashlib.sha256(story['image']).hexdigest(), story['id']))
+
+    # Partial index for the story listing: seeks straight to approved stories in id order, so
+    # unapproved ones are skipped. It isn't covering: the listing reads each story's text for
+    # its excerpt, so every listed row is still read from the table
+    db.execute('CREATE INDEX IF NOT EXISTS idx_stories_approved ON stories (id, name, image_etag) WHERE approved = 1')
+
+    db.execute('''CREATE TABLE IF NOT EXISTS StoryImage (
+                    story_id INTEGER NOT NULL,
+                    variant TEXT NOT NULL,
+                    mime_type TEXT NOT NULL,
+                    width INTEGER NOT NULL,
+                    height INTEGER NOT NULL,
+                    data BLOB NOT NULL,
+                    etag TEXT NOT NULL,
+                    PRIMARY KEY(story_id, variant),
+                    FOREIGN KEY(story_id) REFERENCES stories(id))''')
+
+
+# Migration 3: resource cache, guide templates and video summarization jobs
+def add_caches_and_jobs(db):
+    db.execute('''CREATE TABLE IF NOT EXISTS ResourceCache (
+                    key TEXT PRIMARY KEY,
+                    body TEXT NOT NULL,
+                    created_at REAL NOT NULL)''')
+
+    db.execute('''CREATE TABLE IF NOT EXISTS GuideTemplate (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    topic TEXT NOT NULL,
+                    guide TEXT NOT NULL)''')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_guide_template_topic ON GuideTemplate (topic)')
+
+    db.execute('''CREATE TABLE IF NOT EXISTS VideoJob (
+                    id TEXT PRIMARY KEY,
+                    url TEXT NOT NULL,
+                    job_key TEXT,
+                    status TEXT NOT NULL,
+                    stage TEXT,
+                    summary TEXT,
+                    error TEXT,
+                    timings TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL)''')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_video_job_status ON VideoJob (status)')
+    # At most one queued/running job per video, so concurrent requests share it
+    db.execute('''CREATE UNIQUE INDEX IF NOT EXISTS idx_video_job_pending_key ON VideoJob (job_key)
+                  WHERE status IN ('queued', 'running')''')
+
+    db.execute('''CREATE TABLE IF NOT EXISTS VideoSummary (
+                    video_id TEXT PRIMARY KEY,
+                    summary TEXT,
+                    file_name TEXT,
+                    file_expires_at REAL,
+                    updated_at REAL NOT NULL)''')
+
+
+# Migration 4: one GuideEntry per (user, topic, day), so INSERT OR IGNORE really ignores duplicates
+def add_guide_entry_constraints(db):
+    # Keep the oldest copy of each day; it's the one progress was recorded against
+    db.execute('''DELETE FROM GuideEntry WHERE id NOT IN (
+                    SELECT MIN(id) FROM GuideEntry GROUP BY user_id, topic, day)''')
+    db.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_guide_entry_user_topic_day ON GuideEntry (user_id, topic, day)')
+
+
+# Migration 5: server-side chatbot conversations
+def add_conversations(db):
+    db.execute('''CREATE TABLE IF NOT EXISTS Conversation (
+                    id TEXT PRIMARY KEY,
+                    user_id INTEGER,
+                    summary TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    FOREIGN KEY(user_id) REFERENCES users(id))''')
+
+    db.execute('''CREATE TABLE IF NOT EXISTS ChatMessage (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    conversation_id TEXT NOT NULL,
+                    role TEXT NOT NULL,
+                    content TEXT NOT NULL,
+                    tokens INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    FOREIGN KEY(conversation_id) REFERENCES Conversation(id))''')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_chat_message_conversation ON ChatMessage (conversation_id, id)')
+
+
+# Migration 6: "generating" markers, so only one worker generates a given guide at a time
+def add_generation_leases(db):
+    db.execute('''CREATE TABLE IF NOT EXISTS GenerationLease (
+                    key TEXT PRIMARY KEY,
+                    owner TEXT NOT NULL,
+                    started_at REAL NOT NULL)''')
+
+
+# Migration 7: a version per (user, topic), bumped by triggers on every GuideEntry/UserProgress write,
+# so cached guide and progress responses know when they're out of date in every process
+def add_guide_versions(db):
+    db.execute('''CREATE TABLE IF NOT EXISTS GuideVersion (
+                    user_id INTEGER NOT NULL,
+                    topic TEXT NOT NULL,
+                    version INTEGER NOT NULL,
+                    PRIMARY KEY(user_id, topic)) WITHOUT ROWID''')
+    db.execute('''INSERT OR IGNORE INTO GuideVersion (user_id, topic, version)
+                  SELECT user_id, topic, 1 FROM GuideEntry UNION SELECT user_id, topic, 1 FROM UserProgress''')
+
+    for table in ('GuideEntry', 'UserProgress'):
+        for event, row in (('INSERT', 'NEW'), ('UPDATE', 'NEW'), ('DELETE', 'OLD')):
+            db.execute(f'''CREATE TRIGGER IF NOT EXISTS {table.lower()}_{event.lower()}_version AFTER {event} ON {table}
+                           BEGIN
+                               INSERT INTO GuideVersion (user_id, topic, version) VALUES ({row}.user_id, {row}.topic, 1)
+                               ON CONFLICT(user_id, topic) DO UPDATE SET version = version + 1;
+                           END''')
+
+
+# Migration 8: full-text index of approved stories, kept in sync by triggers. It keeps its own copy
+# of the text and image ETag, so searches never read the stories table or its image BLOBs
+def add_story_search(db):
+    db.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS StorySearch USING fts5(
+                    name, story, image_etag UNINDEXED, tokenize = 'porter unicode61 remove_diacritics 2')''')
+    # Rank matches in a story's name ten times higher than matches in its text
+    db.execute("INSERT INTO StorySearch (StorySearch, rank) VALUES ('rank', 'bm25(10.0, 1.0)')")
+    db.execute('''INSERT INTO StorySearch (rowid, name, story, image_etag)
+                  SELECT id, name, story, image_etag FROM stories WHERE approved = 1''')
+
+    db.execute('''CREATE TRIGGER IF NOT EXISTS stories_search_insert AFTER INSERT ON stories WHEN NEW.approved = 1
+                  BEGIN
+                      INSERT INTO StorySearch (rowid, name, story, image_etag) VALUES (NEW.id, NEW.name, NEW.story, NEW.image_etag);
+                  END''')
+    # Approving, unapproving or editing a story (or replacing its image) replaces its entry
+    db.execute('''CREATE TRIGGER IF NOT EXISTS stories_search_update AFTER UPDATE OF name, story, approved, image_etag ON stories
+                  BEGIN
+                      DELETE FROM StorySearch WHERE rowid = OLD.id;
+                      INSERT INTO StorySearch (rowid, name, story, image_etag)
+                      SELECT NEW.id, NEW.name, NEW.story, NEW.image_etag WHERE NEW.approved = 1;
+                  END''')
+    db.execute('''CREATE TRIGGER IF NOT EXISTS stories_search_delete AFTER DELETE ON stories
+                  BEGIN
+                      DELETE FROM StorySearch WHERE rowid = OLD.id;
+                  END''')
+
+
+# Migration 9: how many times each video job has been started, so a job whose worker keeps
+# dying is given up on rather than re-queued forever
+def add_video_job_attempts(db):
+    db.execute('ALTER TABLE VideoJob ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0')
+
+
+# Migration 10: story image uploads not yet resized, kept until their variants are stored so a
+# restart or a crashed worker doesn't lose them
+def add_story_image_uploads(db):
+    db.execute('''CREATE TABLE IF NOT EXISTS StoryImageUpload (
+                    story_id INTEGER PRIMARY KEY,
+                    data BLOB NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    claimed_at REAL NOT NULL,
+                    FOREIGN KEY(story_id) REFERENCES stories(id))''')
+
+
+# Schema migrations in order; the database's user_version is the number already applied.
+# Only ever append to this list.
+MIGRATIONS = [
+    create_base_schema,
+    add_story_images,
+    add_caches_and_jobs,
+    add_guide_entry_constraints,
+    add_conversations,
+    add_generation_leases,
+    add_guide_versions,
+    add_story_search,
+    add_video_job_attempts,
+    add_story_image_uploads,
+]
+
+
+# Function to bring a database up to the latest schema version
+def migrate(db):
+    """Applies every migration newer than the database's user_version, each in its own
+    transaction. Returns the list of migrations that were applied."""
+    version = db.execute('PRAGMA user_version').fetchone()[0]
+    applied = []
+    for number, migration in enumerate(MIGRATIONS, start=1):
+        if number <= version:
+            continue
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            migration(db)
+            db.execute(f'PRAGMA user_version = {number}')
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        applied.append(migration.__name__)
+    return applied
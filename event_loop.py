@@ -0,0 +1,35 @@
+import asyncio
+import threading
+
+
+class BackgroundLoop:
+    """One asyncio event loop running on a daemon thread, started on first use.
+
+    run() is what Flask's async_to_sync() hands async views to: the calling thread blocks
+    until the coroutine finishes on this loop. Because every view shares the loop, model
+    calls, single-flight waits and the gateway queue all live on one loop, rather than on a
+    new loop per request as asgiref would make.
+    """
+
+    def __init__(self, name='event-loop'):
+        self.name = name
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def loop(self):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, name=self.name, daemon=True)
+                self._thread.start()
+            return self._loop
+
+    def run(self, coro):
+        """Run ``coro`` on the loop from another thread and return its result (or raise its exception)."""
+        loop = self.loop()
+        if threading.current_thread() is self._thread:
+            coro.close()
+            raise RuntimeError("BackgroundLoop.run() can't be called from its own loop")
+        # The task starts in a copy of the caller's context, so the request and app contexts carry over
+        return asyncio.run_coroutine_threadsafe(coro, loop).result()
@@ -0,0 +1,116 @@
+import asyncio
+import contextvars
+import json
+import logging
+
+import metrics
+from guide_templates import GUIDE_DAYS, validate_days
+
+logger = logging.getLogger(__name__)
+
+# The 21 days are written in three week-long chunks, generated in parallel
+WEEKS = [(1, 7), (8, 14), (15, 21)]
+
+
+# Function to decode a model response, tolerating a ```json code fence around it
+def parse_json(text):
+    text = text.strip()
+    if text.startswith('```'):
+        text = text.split('\n', 1)[1] if '\n' in text else ''
+        text = text.rsplit('```', 1)[0]
+    return json.loads(text)
+
+
+# Function to build the prompt asking for the titles of all 21 days; the mentor instructions
+# are the model's system instruction, so prompts only carry the task
+def outline_prompt(goal):
+    return f'''First, outline the plan only: give a short activity title for each of the 21 days, each building progressively toward the goal.
+                Output as raw JSON structure that follows the format below (do not include the json headline):
+                {{"outline": ["<Day 1 activity title>", "<Day 2 activity title>", ..., "<Day 21 activity title>"]}}
+                The goal for this user is {goal}'''
+
+
+# Function to build the prompt asking for the full guidance of days first..last of an outline
+def chunk_prompt(goal, outline, first, last):
+    outline_text = "\n".join(f"                Day {day}: {title}" for day, title in enumerate(outline, start=1))
+    return f'''The 21-day plan has already been outlined as follows:
+{outline_text}
+                Write the full guidance for days {first} to {last} only, keeping the outlined titles.
+                Output as raw JSON structure that follows the format below (do not include the json headline):
+                {{"guide": [
+                    {{"day": {first}, "title": "<Day {first} activity title>", "approaches": ["<First approach to achieve the daily goal>", "<Second approach to achieve the daily goal>", ...]}},
+                    ...
+                    {{"day": {last}, "title": "<Day {last} activity title>", "approaches": ["<First approach to achieve the daily goal>", "<Second approach to achieve the daily goal>", ...]}}
+                ]}}
+                The goal for this user is {goal}'''
+
+
+def _parse_outline(text):
+    outline = parse_json(text).get("outline")
+    if not isinstance(outline, list) or len(outline) != GUIDE_DAYS or not all(isinstance(t, str) and t.strip() for t in outline):
+        raise ValueError("outline does not have 21 titles")
+    return outline
+
+
+def _parse_chunk(text, first, last):
+    days = parse_json(text).get("guide")
+    if not validate_days(days, first, last):
+        raise ValueError(f"days {first}-{last} are missing or malformed")
+    return days
+
+
+# Function to run one generation step, retrying it alone until its output parses
+async def _with_retries(step, max_retries, label):
+    for attempt in range(1, max_retries + 1):
+        try:
+            return await step()
+        except (ValueError, AttributeError) as e:
+            # JSONDecodeError is a ValueError; AttributeError covers JSON that isn't an object
+            logger.warning("Invalid %s on attempt %d: %s", label, attempt, e)
+            metrics.observe_llm_retry(label)
+    logger.error("Exceeded maximum retries for the %s.", label)
+    return None
+
+
+# Function to generate a 21-day guide as an outline plus three week-long chunks in parallel
+async def generate_chunked_guide_async(generate_text, goal, max_retries=3):
+    """Returns {"goal": goal, "guide": [21 days]} or None if a step kept failing.
+
+    generate_text(prompt) is a coroutine returning the text of a model whose system instruction
+    is the mentor prompt. The outline is generated first so the weeks stay consistent with each
+    other; the weeks are then awaited together and each is validated and retried on its own, so
+    a bad response only costs that week rather than the whole guide. Once one week fails for
+    good, the others are cancelled instead of going on calling the model.
+    """
+    async def outline_step():
+        return _parse_outline(await generate_text(outline_prompt(goal)))
+
+    outline = await _with_retries(outline_step, max_retries, "outline")
+    if outline is None:
+        return None
+
+    async def week_step(first, last):
+        return _parse_chunk(await generate_text(chunk_prompt(goal, outline, first, last)), first, last)
+
+    weeks = [
+        asyncio.ensure_future(_with_retries(lambda first=first, last=last: week_step(first, last), max_retries, f"days {first}-{last}"))
+        for first, last in WEEKS
+    ]
+    try:
+        for finished in asyncio.as_completed(weeks):
+            if await finished is None:
+                return None
+    finally:
+        for week in weeks:
+            week.cancel()
+    return {"goal": goal, "guide": [day for week in weeks for day in week.result()]}
+
+
+# Function to generate a 21-day guide like generate_chunked_guide_async, for a blocking generate_text
+def generate_chunked_guide(generate_text, goal, executor, max_retries=3):
+    """Runs generate_chunked_guide_async on its own event loop, with each generate_text(prompt)
+    call on executor in a copy of this context, so its model calls are attributed to the request."""
+    async def generate_text_async(prompt):
+        return await asyncio.get_running_loop().run_in_executor(executor, contextvars.copy_context().run, generate_text, prompt)
+
+    return asyncio.run(generate_chunked_guide_async(generate_text_async, goal, max_retries=max_retries))
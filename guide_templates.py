@@ -0,0 +1,89 @@
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+GUIDE_DAYS = 21
+
+
+# Function to check that a generated guide has the shape the GuideEntry table expects
+def validate_guide(guide_data):
+    """Returns True if guide_data holds exactly 21 well-formed days."""
+    if not isinstance(guide_data, dict):
+        return False
+    return validate_days(guide_data.get("guide"), 1, GUIDE_DAYS)
+
+
+# Function to check a list of generated days covers exactly days first..last, in order
+def validate_days(days, first, last):
+    if not isinstance(days, list):
+        return False
+    if [item.get("day") if isinstance(item, dict) else None for item in days] != list(range(first, last + 1)):
+        return False
+
+    for item in days:
+        if not isinstance(item.get("title"), str) or not item["title"].strip():
+            return False
+        approaches = item.get("approaches")
+        if not isinstance(approaches, list) or not approaches or not all(isinstance(a, str) for a in approaches):
+            return False
+    return True
+
+
+# Function to count the templates currently in a topic's pool
+def pool_size(db, topic):
+    return db.execute('SELECT COUNT(*) FROM GuideTemplate WHERE topic = ?', (topic,)).fetchone()[0]
+
+
+# Function to add a validated guide to a topic's pool
+def add_template(db, topic, guide_data):
+    if not validate_guide(guide_data):
+        return False
+    db.execute('INSERT INTO GuideTemplate (topic, guide) VALUES (?, ?)', (topic, json.dumps(guide_data["guide"])))
+    db.commit()
+    return True
+
+
+# Function to fill (or, with refresh, rebuild) the template pool of a topic
+def fill_pool(db, topic, generate, size, refresh=False):
+    """Generates guides with generate() until the topic has `size` valid templates.
+
+    Returns the number of templates added. Invalid generations are discarded and retried,
+    up to twice the requested size, so a misbehaving model can't loop forever.
+    """
+    if refresh:
+        db.execute('DELETE FROM GuideTemplate WHERE topic = ?', (topic,))
+        db.commit()
+
+    added = 0
+    attempts = 0
+    while pool_size(db, topic) < size and attempts < size * 2:
+        attempts += 1
+        if add_template(db, topic, generate()):
+            added += 1
+        else:
+            logger.warning("Discarded an invalid guide template for '%s'.", topic)
+    return added
+
+
+# Function to copy a random template from the pool into the user's GuideEntry rows
+def assign_template(db, user_id, topic):
+    """Copies one pooled guide to the user with a single INSERT ... SELECT.
+
+    Returns False when the topic has no templates yet, leaving the caller to generate one.
+    """
+    template = db.execute(
+        'SELECT id FROM GuideTemplate WHERE topic = ? ORDER BY RANDOM() LIMIT 1', (topic,)
+    ).fetchone()
+    if template is None:
+        return False
+
+    db.execute('''
+        INSERT OR IGNORE INTO GuideEntry (user_id, topic, day, title, approaches, completed)
+        SELECT ?, ?, json_extract(day.value, '$.day'), json_extract(day.value, '$.title'),
+               json_extract(day.value, '$.approaches'), 0
+        FROM GuideTemplate, json_each(GuideTemplate.guide) AS day
+        WHERE GuideTemplate.id = ?
+    ''', (user_id, topic, template[0]))
+    db.commit()
+    return True
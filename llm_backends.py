@@ -0,0 +1,393 @@
+import asyncio
+import json
+import logging
+import random
+import re
+import threading
+import time
+import uuid
+from types import SimpleNamespace
+
+from guide_templates import GUIDE_DAYS
+
+logger = logging.getLogger(__name__)
+
+# A context cache is extended once this share of its TTL has passed, so it never runs out mid-call
+CACHE_REFRESH_AFTER = 0.8
+
+# Smallest prompt, in tokens, Gemini will keep in a context cache (for the gemini-1.5 models)
+CACHE_MIN_TOKENS = 32768
+
+# Rough characters-per-token ratio, enough to tell a prompt is far too small to cache
+CHARS_PER_TOKEN = 4
+
+
+# Function to create the LLM backend named by the LLM_BACKEND setting
+def create_backend(name, api_key=None, **fake_options):
+    """Returns a backend exposing model(system_instruction=None, cache_ttl=None, name=None), upload_file(path)
+    and get_file(name).
+
+    'gemini' talks to the Gemini API and needs an API key by its first call; 'fake' answers locally, so the
+    app can run and be load tested without a Gemini account.
+    """
+    if name == 'gemini':
+        return GeminiBackend(api_key)
+    if name == 'fake':
+        return FakeBackend(**fake_options)
+    raise ValueError(f"Unknown LLM backend '{name}'.")
+
+
+class GeminiBackend:
+    """Imports and configures google.generativeai on the first call rather than at startup;
+    the SDK is slow to import, and a missing API key only matters once a call is made."""
+
+    def __init__(self, api_key, model_name="gemini-1.5-flash", cache_min_tokens=CACHE_MIN_TOKENS):
+        self.api_key = api_key
+        self.model_name = model_name
+        self.cache_min_tokens = cache_min_tokens
+        self._genai = None
+        self._async_loop = None
+        self._lock = threading.Lock()
+
+    # Function to import and configure the Gemini SDK once
+    def client(self):
+        with self._lock:
+            if self._genai is None:
+                if not self.api_key:
+                    raise ValueError("API_KEY environment variable not set.")
+                import google.generativeai as genai
+                genai.configure(api_key=self.api_key)
+                self._genai = genai
+            return self._genai
+
+    # Function to tell whether the SDK's async client can be used from the running event loop
+    def on_async_loop(self):
+        """The SDK keeps one async (grpc.aio) client per process, bound to the event loop it is
+        first used on. That is the server's loop under the ASGI server, or main.view_loop when
+        Flask runs the async views itself; calls from any other loop use the sync client on a
+        thread instead."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._async_loop is None:
+                self._async_loop = loop
+            return self._async_loop is loop
+
+    def model(self, system_instruction=None, cache_ttl=None, name=None):
+        """With cache_ttl (seconds), the system instruction is kept in an explicit context cache
+        if it reaches Gemini's minimum cacheable size and Gemini accepts it; otherwise it is
+        sent with every call."""
+        cache = None
+        if system_instruction and cache_ttl:
+            # Gemini would refuse a smaller prompt, so don't spend a create call finding that out
+            if len(system_instruction) / CHARS_PER_TOKEN >= self.cache_min_tokens:
+                cache = ContextCache(self, system_instruction, cache_ttl, name)
+            else:
+                logger.info("Not caching the %s prompt: it is under the %d tokens Gemini can cache", name, self.cache_min_tokens)
+        return LazyGeminiModel(self, system_instruction, cache)
+
+    def upload_file(self, path):
+        return self.client().upload_file(path=path)
+
+    def get_file(self, name):
+        return self.client().get_file(name)
+
+
+class ContextCache:
+    """An explicit Gemini context cache holding one system instruction.
+
+    The cache is created on first use and its TTL is extended while it keeps being used, so
+    a busy prompt stays cached and an idle one expires on its own. GeminiBackend.model() only
+    makes one for prompts of at least its cache_min_tokens. Caching is still best effort: if
+    Gemini refuses the prompt or the model can't cache, model() returns None and calls send
+    the system instruction as usual.
+    """
+
+    def __init__(self, backend, system_instruction, ttl, name=None):
+        self._backend = backend
+        self._system_instruction = system_instruction
+        self.ttl = ttl
+        self.name = name
+        self._cached_content = None
+        self._model = None
+        self._expires_at = 0.0
+        self._retry_at = 0.0
+        self._disabled = False
+        self._lock = threading.Lock()
+
+    # Function to return a model reading from the cache, or None to call without it
+    def model(self):
+        now = time.time()
+        model, expires_at = self._model, self._expires_at
+        if model is not None and now < expires_at - self.ttl * (1 - CACHE_REFRESH_AFTER):
+            return model
+        # One thread refreshes; the others carry on with the cache while it lasts, or without it
+        if self._disabled or now < self._retry_at or not self._lock.acquire(blocking=False):
+            return model if now < expires_at else None
+        try:
+            self._refresh(now)
+            return self._model
+        finally:
+            self._lock.release()
+
+    def _refresh(self, now):
+        genai = self._backend.client()
+        from google.api_core import exceptions
+        try:
+            if self._model is not None and now < self._expires_at:
+                self._cached_content.update(ttl=self.ttl)
+            else:
+                self._cached_content = genai.caching.CachedContent.create(
+                    model=self._backend.model_name, display_name=self.name,
+                    system_instruction=self._system_instruction, ttl=self.ttl)
+                self._model = genai.GenerativeModel.from_cached_content(self._cached_content)
+            self._expires_at = now + self.ttl
+        except exceptions.InvalidArgument as e:
+            # The prompt is too small to cache, or the model can't cache; that won't change
+            logger.info("Not caching the %s prompt: %s", self.name, e)
+            self._disabled = True
+            self.invalidate()
+        except Exception as e:
+            logger.warning("Could not cache the %s prompt, sending it with each call for now: %s", self.name, e)
+            self._retry_at = now + min(self.ttl, 300)
+            self.invalidate()
+
+    # Function to stop using the cache, e.g. after Gemini reports it gone
+    def invalidate(self):
+        self._cached_content = self._model = None
+        self._expires_at = 0.0
+
+
+class LazyGeminiModel:
+    """GenerativeModel that is only built when it is first used, reading its system
+    instruction from a context cache when one is available."""
+
+    def __init__(self, backend, system_instruction=None, cache=None):
+        self._backend = backend
+        self._system_instruction = system_instruction
+        self._cache = cache
+        self._model = None
+
+    def _get(self):
+        if self._model is None:
+            genai = self._backend.client()
+            self._model = genai.GenerativeModel(self._backend.model_name, system_instruction=self._system_instruction)
+        return self._model
+
+    def _current(self):
+        cached = self._cache.model() if self._cache is not None else None
+        return cached or self._get()
+
+    # Function to tell whether a call failed because the context cache it read is gone
+    def _cache_gone(self, model, error):
+        if model is self._model:
+            return False
+        from google.api_core import exceptions
+        if isinstance(error, (exceptions.NotFound, exceptions.PermissionDenied)):
+            self._cache.invalidate()
+            return True
+        return False
+
+    def generate_content(self, *args, **kwargs):
+        model = self._current()
+        try:
+            return model.generate_content(*args, **kwargs)
+        except Exception as e:
+            if not self._cache_gone(model, e):
+                raise
+        # The cache expired or was deleted early; answer this call without it
+        return self._get().generate_content(*args, **kwargs)
+
+    async def generate_content_async(self, *args, **kwargs):
+        if not self._backend.on_async_loop():
+            return await asyncio.to_thread(self.generate_content, *args, **kwargs)
+        # Building the model may import the SDK or refresh the context cache, so that runs on a thread
+        model = await asyncio.to_thread(self._current)
+        try:
+            return await model.generate_content_async(*args, **kwargs)
+        except Exception as e:
+            if not self._cache_gone(model, e):
+                raise
+        return await self._get().generate_content_async(*args, **kwargs)
+
+    def start_chat(self, **kwargs):
+        return GeminiChat(self._backend, self._current().start_chat(**kwargs))
+
+    def __getattr__(self, name):
+        return getattr(self._get(), name)
+
+
+class GeminiChat:
+    """ChatSession whose send_message_async uses the sync client on a thread when the running
+    event loop isn't the one the SDK's async client belongs to."""
+
+    def __init__(self, backend, chat):
+        self._backend = backend
+        self._chat = chat
+
+    async def send_message_async(self, *args, **kwargs):
+        if not self._backend.on_async_loop():
+            return await asyncio.to_thread(self._chat.send_message, *args, **kwargs)
+        return await self._chat.send_message_async(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._chat, name)
+
+
+class FakeBackendError(Exception):
+    """Stands in for an upstream API error; raised at the configured failure rate."""
+
+
+class FakeBackend:
+    """Local stand-in for Gemini with a configurable latency distribution and failure rates.
+
+    Latencies follow a log-normal distribution around latency_ms (latency_sigma=0 makes them
+    constant). failure_rate is the share of calls that raise FakeBackendError and
+    malformed_rate the share of guide responses that come back as unparseable JSON, so the
+    retry paths get exercised too. A seed makes a run reproducible.
+    """
+
+    def __init__(self, latency_ms=800, latency_sigma=0.5, failure_rate=0.0, malformed_rate=0.0, seed=None):
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.failure_rate = failure_rate
+        self.malformed_rate = malformed_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def model(self, system_instruction=None, cache_ttl=None, name=None):
+        return FakeModel(self, system_instruction, cached=bool(system_instruction and cache_ttl))
+
+    def upload_file(self, path):
+        return SimpleNamespace(name=f"files/{uuid.uuid4().hex[:12]}", state=SimpleNamespace(name="ACTIVE"), expiration_time=None)
+
+    def get_file(self, name):
+        return SimpleNamespace(name=name, state=SimpleNamespace(name="ACTIVE"), expiration_time=None)
+
+    def _roll(self):
+        with self._lock:
+            return self._random.random()
+
+    # Function to draw one call's simulated latency, and whether the call fails
+    def _draw(self):
+        with self._lock:
+            seconds = self.latency_ms / 1000 * self._random.lognormvariate(0, self.latency_sigma) if self.latency_sigma else self.latency_ms / 1000
+        return seconds, self._roll() < self.failure_rate
+
+    # Function to wait out one call's simulated latency, or fail it
+    def latency(self):
+        seconds, failed = self._draw()
+        if failed:
+            time.sleep(seconds / 2)
+            raise FakeBackendError("Simulated LLM backend failure")
+        return seconds
+
+    async def latency_async(self):
+        seconds, failed = self._draw()
+        if failed:
+            await asyncio.sleep(seconds / 2)
+            raise FakeBackendError("Simulated LLM backend failure")
+        return seconds
+
+    # Function to write a response shaped like the one the prompt asks for
+    def answer(self, prompt):
+        if isinstance(prompt, (list, tuple)):
+            prompt = "\n".join(part for part in prompt if isinstance(part, str))
+
+        chunk = re.search(r'days (\d+) to (\d+) only', prompt)
+        if '"guide"' in prompt or '"outline"' in prompt:
+            if self._roll() < self.malformed_rate:
+                return '{"guide": ['
+            if chunk:
+                return json.dumps({"guide": _fake_days(int(chunk[1]), int(chunk[2]))})
+            if '"outline"' in prompt:
+                return json.dumps({"outline": [f"Day {day}: practice step {day}" for day in range(1, GUIDE_DAYS + 1)]})
+            goal = re.search(r'The goal for this user is (.*)', prompt)
+            return json.dumps({"goal": goal[1].strip() if goal else "", "guide": _fake_days(1, GUIDE_DAYS)})
+
+        return ("That's a great question! Here are a few ideas to get you started:\n"
+                "1. Break the goal into small steps you can do this week.\n"
+                "2. Find someone who has done it before and ask how they started.\n"
+                "3. Celebrate every bit of progress along the way.")
+
+
+def _fake_days(first, last):
+    return [{"day": day, "title": f"Practice step {day}", "approaches": [f"Spend 20 minutes on step {day}", "Write down what you learned"]}
+            for day in range(first, last + 1)]
+
+
+class FakeResponse:
+    def __init__(self, text, usage_metadata=None):
+        self.text = text
+        self.usage_metadata = usage_metadata
+
+
+# Function to estimate token usage the way Gemini reports it, at about 4 characters per token;
+# a cached system instruction is counted in the prompt tokens and again as cached tokens
+def _fake_usage(prompt, text, system_instruction=None, cached=False):
+    if isinstance(prompt, (list, tuple)):
+        prompt = "".join(part for part in prompt if isinstance(part, str))
+    system_tokens = len(system_instruction) // 4 if system_instruction else 0
+    return SimpleNamespace(prompt_token_count=system_tokens + len(str(prompt)) // 4 + 1, candidates_token_count=len(text) // 4 + 1,
+                           cached_content_token_count=system_tokens if cached else 0)
+
+
+class FakeModel:
+    def __init__(self, backend, system_instruction=None, cached=False):
+        self._backend = backend
+        self._system_instruction = system_instruction
+        self._cached = cached
+
+    def generate_content(self, contents, stream=False, **kwargs):
+        seconds = self._backend.latency()
+        text = self._backend.answer(contents)
+        usage = _fake_usage(contents, text, self._system_instruction, self._cached)
+        if stream:
+            return _stream(text, seconds, usage)
+        time.sleep(seconds)
+        return FakeResponse(text, usage)
+
+    async def generate_content_async(self, contents, **kwargs):
+        seconds = await self._backend.latency_async()
+        text = self._backend.answer(contents)
+        await asyncio.sleep(seconds)
+        return FakeResponse(text, _fake_usage(contents, text, self._system_instruction, self._cached))
+
+    def start_chat(self, history=None):
+        return FakeChat(self, list(history or []))
+
+
+# Streams the text in small chunks: a third of the latency before the first chunk, the rest spread
+# out; like Gemini, the last chunk carries the usage metadata
+def _stream(text, seconds, usage, chunk_size=40):
+    chunks = [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)] or ['']
+    time.sleep(seconds / 3)
+    for number, chunk in enumerate(chunks, start=1):
+        yield FakeResponse(chunk, usage if number == len(chunks) else None)
+        time.sleep(seconds * 2 / 3 / len(chunks))
+
+
+class FakeChat:
+    def __init__(self, model, history):
+        self._model = model
+        self.history = history
+
+    def send_message(self, message, stream=False, **kwargs):
+        self.history.append({"role": "user", "parts": message})
+        response = self._model.generate_content(message, stream=stream)
+        if not stream:
+            self.history.append({"role": "model", "parts": response.text})
+            return response
+        return self._record(response)
+
+    async def send_message_async(self, message, **kwargs):
+        self.history.append({"role": "user", "parts": message})
+        response = await self._model.generate_content_async(message)
+        self.history.append({"role": "model", "parts": response.text})
+        return response
+
+    def _record(self, chunks):
+        parts = []
+        for chunk in chunks:
+            parts.append(chunk.text)
+            yield chunk
+        self.history.append({"role": "model", "parts": "".join(parts)})
@@ -0,0 +1,305 @@
+import asyncio
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+
+
+class LLMUnavailable(Exception):
+    """Raised instead of making a model call; retry_after is in seconds."""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class RateLimited(LLMUnavailable):
+    pass
+
+
+class LLMBusy(LLMUnavailable):
+    pass
+
+
+class TokenBucket:
+    """Allows bursts of up to `capacity` calls, refilled at `rate` tokens per second."""
+
+    def __init__(self, rate, capacity, now):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    # Function to return how long until a token is available (0 if one is available now)
+    def wait_time(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+
+class RateLimiter:
+    """Token buckets per key (a user or an IP address), keeping the most recently used
+    `max_keys` so the table can't grow without bound."""
+
+    def __init__(self, per_minute, burst, max_keys=10000):
+        self.rate = per_minute / 60
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+
+    def bucket(self, key, now):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(self.rate, self.burst, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        return bucket
+
+
+class LLMGateway:
+    """Admission control for model calls.
+
+    admit() applies the per-user and per-IP rate limits to a request before it starts
+    any model work. slot() bounds the number of model calls in flight: callers wait for
+    a free slot in a queue of at most `max_waiting`, for at most `max_wait` seconds, and
+    get LLMBusy instead of piling up behind a saturated upstream. Background work can
+    pass bounded=False to wait for its slot however long it takes. slot_async() is the
+    same for coroutines; threads and coroutines share the one limit. A waiting coroutine
+    sleeps on a future of its own event loop, which is resolved when a slot is released.
+    """
+
+    def __init__(self, max_concurrent, max_waiting, max_wait, user_limits, ip_limits):
+        self.max_concurrent = max_concurrent
+        self.max_waiting = max_waiting
+        self.max_wait = max_wait
+        self.user_limits = user_limits
+        self.ip_limits = ip_limits
+        self._semaphore = threading.BoundedSemaphore(max_concurrent)
+        self._lock = threading.Lock()
+        self._waiters = deque()  # (loop, future) of each coroutine waiting for a slot, oldest first
+        self.in_flight = 0
+        self.waiting = 0
+        self.rejected = 0
+
+    # Function to take one request's worth of the user's and the IP's rate limits
+    def admit(self, user_id, ip):
+        with self._lock:
+            now = time.monotonic()
+            buckets = [self.ip_limits.bucket(ip, now)]
+            if user_id is not None:
+                buckets.append(self.user_limits.bucket(user_id, now))
+
+            retry_after = max(bucket.wait_time(now) for bucket in buckets)
+            if retry_after > 0:
+                self.rejected += 1
+                raise RateLimited("Too many requests, please slow down", retry_after)
+            for bucket in buckets:
+                bucket.take()
+
+    def _busy(self):
+        with self._lock:
+            self.rejected += 1
+        return LLMBusy("The assistant is busy, please try again shortly", self.max_wait)
+
+    # Function to join the queue for a slot, unless the queue is full
+    def _start_waiting(self, bounded):
+        with self._lock:
+            full = bounded and self.waiting >= self.max_waiting
+            if not full:
+                self.waiting += 1
+        if full:
+            raise self._busy()
+
+    def _stop_waiting(self):
+        with self._lock:
+            self.waiting -= 1
+
+    @contextmanager
+    def _held(self):
+        with self._lock:
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+            self._semaphore.release()
+            self._notify()
+
+    # Function to wake the longest-waiting coroutine, on its own loop, so it can take the free slot
+    def _notify(self):
+        with self._lock:
+            while self._waiters:
+                loop, waiter = self._waiters.popleft()
+                try:
+                    loop.call_soon_threadsafe(_wake, waiter)
+                    return
+                except RuntimeError:
+                    pass  # Its loop has been closed
+
+    # Function to wait on the running loop until a slot is taken (True) or max_wait runs out (False)
+    async def _acquire_async(self, bounded):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_wait if bounded else None
+        while True:
+            entry = (loop, loop.create_future())
+            with self._lock:
+                self._waiters.append(entry)
+            acquired = leaving = False
+            try:
+                # Check again once queued, so a slot released just before isn't missed
+                acquired = self._semaphore.acquire(blocking=False)
+                if acquired:
+                    return True
+                remaining = None if deadline is None else deadline - loop.time()
+                leaving = True
+                if remaining is not None and remaining <= 0:
+                    return False
+                try:
+                    await asyncio.wait_for(entry[1], remaining)
+                except asyncio.TimeoutError:
+                    return False
+                # Woken: try again, as a thread may have taken the slot first
+                leaving = False
+            finally:
+                with self._lock:
+                    woken = entry not in self._waiters
+                    if not woken:
+                        self._waiters.remove(entry)
+                # A wake-up meant for a coroutine that timed out or was cancelled goes to the next one
+                if woken and leaving and not acquired:
+                    self._notify()
+
+    @contextmanager
+    def slot(self, bounded=True):
+        if not self._semaphore.acquire(blocking=False):
+            self._start_waiting(bounded)
+            try:
+                acquired = self._semaphore.acquire(timeout=self.max_wait if bounded else None)
+            finally:
+                self._stop_waiting()
+            if not acquired:
+                raise self._busy()
+
+        with self._held():
+            yield
+
+    # Waiting coroutines sleep until a release wakes them, so a full queue costs no threads
+    @asynccontextmanager
+    async def slot_async(self, bounded=True):
+        if not self._semaphore.acquire(blocking=False):
+            self._start_waiting(bounded)
+            try:
+                acquired = await self._acquire_async(bounded)
+            finally:
+                self._stop_waiting()
+            if not acquired:
+                raise self._busy()
+
+        with self._held():
+            yield
+
+
+def _wake(waiter):
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+class GatedModel:
+    """Wraps a GenerativeModel so every call, including chat turns and streamed responses,
+    runs inside a gateway slot.
+
+    bounded() decides per call whether the caller gets a bounded wait (request threads) or
+    waits as long as needed (background jobs). observer(operation, seconds, outcome, response),
+    if given, is told about every call once it is over; outcome is "success", "error" or
+    "rejected" and response is the (last streamed) response, or None. The *_async methods
+    do the same for coroutines, awaiting the wrapped model's async calls.
+    """
+
+    def __init__(self, model, gateway, bounded=lambda: True, observer=None):
+        self._model = model
+        self._gateway = gateway
+        self._bounded = bounded
+        self._observer = observer
+
+    def call(self, operation, fn, *args, **kwargs):
+        if kwargs.get('stream'):
+            return self._stream(operation, fn, args, kwargs)
+        started = time.perf_counter()
+        outcome, response = 'error', None
+        try:
+            with self._gateway.slot(bounded=self._bounded()):
+                response = fn(*args, **kwargs)
+            outcome = 'success'
+            return response
+        except LLMUnavailable:
+            outcome = 'rejected'
+            raise
+        finally:
+            self._observe(operation, started, outcome, response)
+
+    # A streamed response holds its slot until the last chunk has been read
+    def _stream(self, operation, fn, args, kwargs):
+        started = time.perf_counter()
+        outcome, chunk = 'error', None
+        try:
+            with self._gateway.slot(bounded=self._bounded()):
+                for chunk in fn(*args, **kwargs):
+                    yield chunk
+            outcome = 'success'
+        except LLMUnavailable:
+            outcome = 'rejected'
+            raise
+        finally:
+            self._observe(operation, started, outcome, chunk)
+
+    async def call_async(self, operation, fn, *args, **kwargs):
+        started = time.perf_counter()
+        outcome, response = 'error', None
+        try:
+            async with self._gateway.slot_async(bounded=self._bounded()):
+                response = await fn(*args, **kwargs)
+            outcome = 'success'
+            return response
+        except LLMUnavailable:
+            outcome = 'rejected'
+            raise
+        finally:
+            self._observe(operation, started, outcome, response)
+
+    def _observe(self, operation, started, outcome, response):
+        if self._observer is not None:
+            self._observer(operation, time.perf_counter() - started, outcome, response)
+
+    def generate_content(self, *args, **kwargs):
+        return self.call('generate', self._model.generate_content, *args, **kwargs)
+
+    async def generate_content_async(self, *args, **kwargs):
+        return await self.call_async('generate', self._model.generate_content_async, *args, **kwargs)
+
+    def start_chat(self, **kwargs):
+        return _GatedChat(self._model.start_chat(**kwargs), self)
+
+    def __getattr__(self, name):
+        return getattr(self._model, name)
+
+
+class _GatedChat:
+    def __init__(self, chat, model):
+        self._chat = chat
+        self._model = model
+
+    def send_message(self, *args, **kwargs):
+        return self._model.call('chat', self._chat.send_message, *args, **kwargs)
+
+    async def send_message_async(self, *args, **kwargs):
+        return await self._model.call_async('chat', self._chat.send_message_async, *args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._chat, name)
@@ -0,0 +1,28 @@
+class PromptRegistry:
+    """Models built around the app's fixed system prompts, one per prompt name.
+
+    Each prompt is given to its model as the system_instruction, so calls only carry what
+    changes from one request to the next. With cache_ttl (seconds), backends that support it
+    also keep each prompt in a context cache, whose tokens are billed at the cheaper cached
+    rate and skip prefill; wrap(model) is applied to every model built, e.g. to gate its calls.
+    """
+
+    def __init__(self, backend, wrap=lambda model: model, cache_ttl=None):
+        self._backend = backend
+        self._wrap = wrap
+        self.cache_ttl = cache_ttl
+        self._models = {}
+        self.prompts = {}
+
+    # Function to build the model for a fixed prompt; registering a name again replaces it
+    def register(self, name, system_instruction):
+        self.prompts[name] = system_instruction
+        model = self._models[name] = self._wrap(
+            self._backend.model(system_instruction=system_instruction, cache_ttl=self.cache_ttl, name=name))
+        return model
+
+    def __getitem__(self, name):
+        return self._models[name]
+
+    def __contains__(self, name):
+        return name in self._models
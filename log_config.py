@@ -0,0 +1,49 @@
+import json
+import logging
+import sys
+
+import metrics
+
+# Attributes every LogRecord has; anything else on a record came from extra={...}
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime', 'endpoint'}
+
+
+class EndpointFilter(logging.Filter):
+    """Tags every record with the endpoint whose work produced it ("background" outside requests)."""
+
+    def filter(self, record):
+        record.endpoint = metrics.current_endpoint()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, endpoint, message and any extra fields."""
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "endpoint": getattr(record, 'endpoint', None),
+            "message": record.getMessage(),
+        }
+        entry.update({key: value for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES})
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+# Function to send the app's logs to stderr at the given level, as text or as JSON lines
+def configure_logging(level='INFO', fmt='text'):
+    handler = logging.StreamHandler(sys.stderr)
+    handler.addFilter(EndpointFilter())
+    if fmt == 'json':
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s [%(endpoint)s] %(message)s'))
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level.upper() if isinstance(level, str) else level)
@@ -1,126 +1,366 @@
 
 
-import base64
+import asyncio
+import contextvars
+import html
 import json
+import logging
 import os
+import re
 import sqlite3
-import subprocess
+import shutil
 import tempfile
 import time
-from io import BytesIO
-import google.generativeai as genai
-import yt_dlp
-from PIL import Image
-from flask import Flask, request, jsonify, g, session
-from flask_bcrypt import Bcrypt
+from concurrent.futures import ThreadPoolExecutor
+import click
+from flask import Flask, Blueprint, current_app, request, jsonify, g, session, stream_with_context, has_request_context
 from flask_cors import CORS
 from dotenv import load_dotenv
+from werkzeug.serving import is_running_from_reloader
 from werkzeug.utils import secure_filename
-
-load_dotenv()  # Load variables from .env
-
-# Set up the environment and configure Generative AI client
-api_key = os.getenv('API_KEY')
-if not api_key:
-    raise ValueError("API_KEY environment variable not set.")
-genai.configure(api_key=api_key)
-
-# Set up the Flask application
-app = Flask(__name__, static_folder='src/frontend/build', static_url_path='/')
-app.secret_key = os.getenv('SECRET_KEY', 'default-secret-key')  # Use a default key for local testing if necessary
-CORS(app, origins=["http://localhost:3000"])  # Enable CORS for local frontend
-bcrypt = Bcrypt(app)  # Set up Bcrypt for password hashing
-app.config['DATABASE'] = 'database.db'  # Database file name
-model = genai.GenerativeModel("gemini-1.5-flash")  # Set up generative AI model
-
-# Function to get a database connection
+import database
+import auth
+from response_cache import ResponseCache, SQLiteResponseStore, VersionedBodyCache
+import guide_templates
+import guide_generation
+from video_jobs import VideoJobQueue, JobQueueFull
+from video_cache import VideoSummaryCache, youtube_video_id, canonical_video_url
+import video_media
+from chat_store import ChatStore
+from streaming import sse_event, GuideDayParser
+from singleflight import AsyncSingleFlight, GenerationLeases
+from event_loop import BackgroundLoop
+from llm_gateway import LLMGateway, GatedModel, RateLimiter, LLMUnavailable, RateLimited
+from llm_prompts import PromptRegistry
+import llm_backends
+import metrics
+import log_config
+import static_assets
+import story_images
+
+# All routes, request hooks and CLI commands; create_app() registers them on the app
+routes = Blueprint('routes', __name__, cli_group=None)
+logger = logging.getLogger(__name__)
+
+# The event loop async views run on when Flask runs them (the debug server, the test client); see AsyncViewFlask
+view_loop = BackgroundLoop(name='async-views')
+
+class AsyncViewFlask(Flask):
+    """Flask, with async views run on view_loop instead of a new event loop per request.
+
+    The request's thread waits for the view, while the model calls, single-flight waits and
+    gateway queue it awaits are shared with the other requests on the one loop. Under the
+    ASGI server (asgi.py) coroutine views are awaited on the server's loop and this isn't used.
+    """
+
+    def async_to_sync(self, func):
+        return lambda *args, **kwargs: view_loop.run(func(*args, **kwargs))
+
+# Function to create and configure the Flask application
+def create_app(config=None):
+    """Builds the app from environment settings, with `config` overriding them.
+
+    Nothing slow happens here: the Gemini client, yt-dlp and Pillow are only loaded when
+    first used, so worker boots and CLI commands like init-db start quickly.
+    """
+    load_dotenv()  # Load variables from .env
+
+    # Set up the Flask application
+    # Static files are served by the routes below (see static_assets), not by Flask's static view
+    app = AsyncViewFlask(__name__, static_folder=None)
+    app.secret_key = os.getenv('SECRET_KEY', 'default-secret-key')  # Use a default key for local testing if necessary
+    CORS(app, origins=["http://localhost:3000"])  # Enable CORS for local frontend
+    app.config['DATABASE'] = 'database.db'  # Database file name
+    app.config['STATIC_FOLDER'] = os.path.join(app.root_path, 'src/frontend/build')  # The frontend build, served at /
+    app.config['STATIC_MAX_AGE'] = int(os.getenv('STATIC_MAX_AGE', 24 * 60 * 60))  # Seconds browsers may keep files that aren't fingerprinted
+    app.config['BCRYPT_LOG_ROUNDS'] = int(os.getenv('BCRYPT_LOG_ROUNDS', 12))  # Cost of new password hashes; older hashes are redone at login
+    app.config['AUTH_HASH_WORKERS'] = int(os.getenv('AUTH_HASH_WORKERS', 2))  # Processes hashing passwords
+    app.config['AUTH_HASH_MAX_PENDING'] = int(os.getenv('AUTH_HASH_MAX_PENDING', 32))  # Hashes queued + running before sign-ins get a 503
+    app.config['AUTH_HASH_MAX_WAIT'] = float(os.getenv('AUTH_HASH_MAX_WAIT', 10))  # Seconds a sign-in waits for its hash
+    app.config['AUTH_PRINCIPAL_TTL'] = int(os.getenv('AUTH_PRINCIPAL_TTL', 5 * 60))  # Seconds a signed-in user is trusted before the users table is checked again
+    app.config['LOG_LEVEL'] = os.getenv('LOG_LEVEL', 'INFO')  # DEBUG, INFO, WARNING or ERROR
+    app.config['LOG_FORMAT'] = os.getenv('LOG_FORMAT', 'text')  # 'text', or 'json' for one JSON object per line
+    app.config['RESOURCE_CACHE_TTL'] = int(os.getenv('RESOURCE_CACHE_TTL', 6 * 60 * 60))  # Seconds a generated resource guide stays fresh
+    app.config['RESOURCE_CACHE_STALE_TTL'] = int(os.getenv('RESOURCE_CACHE_STALE_TTL', 7 * 24 * 60 * 60))  # Seconds a stale guide may still be served while refreshing
+    app.config['GUIDE_TEMPLATE_POOL_SIZE'] = int(os.getenv('GUIDE_TEMPLATE_POOL_SIZE', 5))  # Pre-generated guides kept per topic
+    app.config['VIDEO_JOB_WORKERS'] = int(os.getenv('VIDEO_JOB_WORKERS', 2))  # Videos summarized concurrently
+    app.config['VIDEO_JOB_MAX_PENDING'] = int(os.getenv('VIDEO_JOB_MAX_PENDING', 20))  # Queued + running jobs before new ones are refused
+    app.config['VIDEO_JOB_MAX_WAIT'] = 60  # Longest long-poll a client may request, in seconds
+    app.config['VIDEO_MAX_DURATION'] = int(os.getenv('VIDEO_MAX_DURATION', 60 * 60))  # Longest video we summarize, in seconds
+    app.config['VIDEO_MAX_DOWNLOAD_BYTES'] = int(os.getenv('VIDEO_MAX_DOWNLOAD_BYTES', 200 * 1024 * 1024))  # Largest media file we download
+    app.config['VIDEO_TRANSCRIPT_LANGUAGES'] = ('en',)  # Caption languages tried before falling back to audio
+    app.config['IMAGE_MAX_BYTES'] = int(os.getenv('IMAGE_MAX_BYTES', 10 * 1024 * 1024))  # Largest story image accepted
+    app.config['IMAGE_WORKERS'] = int(os.getenv('IMAGE_WORKERS', 2))  # Processes resizing story images
+    app.config['IMAGE_MAX_PENDING'] = int(os.getenv('IMAGE_MAX_PENDING', 20))  # Story images waiting to be resized before uploads get a 503
+    app.config['RESPONSE_BODY_CACHE_SIZE'] = int(os.getenv('RESPONSE_BODY_CACHE_SIZE', 2000))  # Serialized guide/progress responses kept in memory
+    app.config['PROGRESS_MAX_UPDATES'] = 200  # Most day updates accepted by one /update-progress request
+    app.config['STORIES_PAGE_SIZE'] = 20  # Stories per /approved-stories page unless ?limit= is given
+    app.config['STORIES_MAX_PAGE_SIZE'] = 100  # Largest ?limit= accepted
+    app.config['STORY_EXCERPT_LENGTH'] = 200  # Characters of each story included in the listing
+    app.config['STORY_SNIPPET_TOKENS'] = 24  # Words of context around the matches in each search result
+    app.config['STORY_SEARCH_MAX_OFFSET'] = 1000  # Deepest ?offset= accepted by /stories/search
+    app.config['CHAT_HISTORY_TOKEN_BUDGET'] = int(os.getenv('CHAT_HISTORY_TOKEN_BUDGET', 2000))  # Chat history tokens kept before older turns are summarized
+    app.config['GUIDE_GENERATION_MODE'] = os.getenv('GUIDE_GENERATION_MODE', 'chunked')  # 'chunked' (outline + parallel weeks) or 'single'
+    app.config['GUIDE_GENERATION_WORKERS'] = int(os.getenv('GUIDE_GENERATION_WORKERS', 6))  # Threads generating guide chunks
+    app.config['GUIDE_GENERATION_LEASE_TIMEOUT'] = int(os.getenv('GUIDE_GENERATION_LEASE_TIMEOUT', 180))  # Seconds before another worker may take over an unfinished guide
+    app.config['ASYNC_DB_WORKERS'] = int(os.getenv('ASYNC_DB_WORKERS', 4))  # Threads running the SQLite work of async views
+    app.config['WSGI_THREADS'] = int(os.getenv('WSGI_THREADS', 16))  # Threads serving the other routes under the ASGI server (asgi.py)
+    app.config['LLM_MAX_CONCURRENT'] = int(os.getenv('LLM_MAX_CONCURRENT', 8))  # Model calls in flight at once, across all routes
+    app.config['LLM_MAX_WAITING'] = int(os.getenv('LLM_MAX_WAITING', 16))  # Requests allowed to queue for a free model call
+    app.config['LLM_MAX_WAIT'] = float(os.getenv('LLM_MAX_WAIT', 10))  # Seconds a request waits in that queue before getting a 429
+    app.config['LLM_USER_RATE'] = int(os.getenv('LLM_USER_RATE', 20))  # Model-backed requests per minute per user...
+    app.config['LLM_USER_BURST'] = int(os.getenv('LLM_USER_BURST', 5))  # ...of which this many may come at once
+    app.config['LLM_IP_RATE'] = int(os.getenv('LLM_IP_RATE', 60))  # Model-backed requests per minute per IP address
+    app.config['LLM_IP_BURST'] = int(os.getenv('LLM_IP_BURST', 15))
+    app.config['LLM_CONTEXT_CACHE_TTL'] = int(os.getenv('LLM_CONTEXT_CACHE_TTL', 60 * 60))  # Seconds Gemini keeps an unused cached system prompt (0 to never cache)
+    app.config['LLM_BACKEND'] = os.getenv('LLM_BACKEND', 'gemini')  # 'gemini', or 'fake' to run without a Gemini account
+    app.config['FAKE_LLM_LATENCY_MS'] = float(os.getenv('FAKE_LLM_LATENCY_MS', 800))  # Median latency of a fake model call
+    app.config['FAKE_LLM_LATENCY_SIGMA'] = float(os.getenv('FAKE_LLM_LATENCY_SIGMA', 0.5))  # Spread of fake latencies (log-normal sigma, 0 = constant)
+    app.config['FAKE_LLM_FAILURE_RATE'] = float(os.getenv('FAKE_LLM_FAILURE_RATE', 0))  # Share of fake calls that raise an error
+    app.config['FAKE_LLM_MALFORMED_RATE'] = float(os.getenv('FAKE_LLM_MALFORMED_RATE', 0))  # Share of fake guides returned as broken JSON
+    app.config['FAKE_LLM_SEED'] = os.getenv('FAKE_LLM_SEED')  # Makes fake latencies and failures reproducible
+    app.config.update(config or {})
+    if app.config['MAX_CONTENT_LENGTH'] is None:
+        app.config['MAX_CONTENT_LENGTH'] = app.config['IMAGE_MAX_BYTES'] + 1024 * 1024  # Reject oversized bodies before they're read
+
+    log_config.configure_logging(app.config['LOG_LEVEL'], app.config['LOG_FORMAT'])
+    app.teardown_appcontext(close_db)
+    app.register_blueprint(routes)
+    init_services(app)
+    return app
+
+# Services shared by the routes, set up by init_services()
+llm_backend = llm_gateway = model = prompts = None
+guide_executor = guide_leases = db_executor = image_ingestion = password_hasher = principals = None
+video_summaries = video_jobs = chat_store = resource_cache = response_bodies = None
+
+# Function to set up the model clients, caches, job queues and worker pools for an app. They live
+# at module level so the routes can reach them, which makes it one app per process.
+def init_services(app):
+    global llm_backend, llm_gateway, model, prompts, guide_executor, guide_leases, db_executor
+    global image_ingestion, password_hasher, principals, video_summaries, video_jobs, chat_store, resource_cache, response_bodies
+
+    # Set up the LLM backend; the Gemini backend reads its key from API_KEY when it makes its first call
+    llm_backend = llm_backends.create_backend(
+        app.config['LLM_BACKEND'],
+        api_key=os.getenv('API_KEY'),
+        latency_ms=app.config['FAKE_LLM_LATENCY_MS'],
+        latency_sigma=app.config['FAKE_LLM_LATENCY_SIGMA'],
+        failure_rate=app.config['FAKE_LLM_FAILURE_RATE'],
+        malformed_rate=app.config['FAKE_LLM_MALFORMED_RATE'],
+        seed=app.config['FAKE_LLM_SEED']
+    )
+    llm_gateway = LLMGateway(
+        max_concurrent=app.config['LLM_MAX_CONCURRENT'],
+        max_waiting=app.config['LLM_MAX_WAITING'],
+        max_wait=app.config['LLM_MAX_WAIT'],
+        user_limits=RateLimiter(app.config['LLM_USER_RATE'], app.config['LLM_USER_BURST']),
+        ip_limits=RateLimiter(app.config['LLM_IP_RATE'], app.config['LLM_IP_BURST'])
+    )
+    # Request threads get a bounded wait for a model call; background jobs wait for their turn
+    gated = lambda llm: GatedModel(llm, llm_gateway, bounded=has_request_context, observer=metrics.observe_llm_call)
+    model = gated(llm_backend.model())  # Set up generative AI model
+
+    # Each fixed prompt is its model's system instruction, kept in a Gemini context cache where possible
+    prompts = PromptRegistry(llm_backend, wrap=gated, cache_ttl=app.config['LLM_CONTEXT_CACHE_TTL'])
+    prompts.register('guide', guide_mentor_prompt)
+    prompts.register('chatbot', chatbot_system_prompt)
+    prompts.register('video_summary', video_summary_prompt)
+
+    password_hasher = auth.PasswordHasher(
+        app.config['DATABASE'],
+        rounds=app.config['BCRYPT_LOG_ROUNDS'],
+        max_workers=app.config['AUTH_HASH_WORKERS'],
+        max_pending=app.config['AUTH_HASH_MAX_PENDING'],
+        max_wait=app.config['AUTH_HASH_MAX_WAIT']
+    )
+    principals = auth.PrincipalCache(ttl=app.config['AUTH_PRINCIPAL_TTL'])
+
+    guide_executor = ThreadPoolExecutor(max_workers=app.config['GUIDE_GENERATION_WORKERS'], thread_name_prefix='guide-chunk')
+    guide_leases = GenerationLeases(app.config['DATABASE'], timeout=app.config['GUIDE_GENERATION_LEASE_TIMEOUT'])
+    db_executor = ThreadPoolExecutor(max_workers=app.config['ASYNC_DB_WORKERS'], thread_name_prefix='sqlite')
+    image_ingestion = story_images.ImageIngestion(app.config['DATABASE'], max_workers=app.config['IMAGE_WORKERS'],
+                                                  max_pending=app.config['IMAGE_MAX_PENDING'])
+    chat_store = ChatStore(app.config['DATABASE'], token_budget=app.config['CHAT_HISTORY_TOKEN_BUDGET'])
+    resource_cache = ResponseCache(
+        ttl=app.config['RESOURCE_CACHE_TTL'],
+        stale_ttl=app.config['RESOURCE_CACHE_STALE_TTL'],
+        store=SQLiteResponseStore(app.config['DATABASE'])
+    )
+    response_bodies = VersionedBodyCache(max_entries=app.config['RESPONSE_BODY_CACHE_SIZE'])
+
+    video_summaries = VideoSummaryCache(app.config['DATABASE'])
+    # Jobs run inside an app context so the pipeline stages can read the app's settings
+    video_jobs = VideoJobQueue(
+        app.config['DATABASE'],
+        stages=[
+            ('reuse-upload', reuse_upload_stage),
+            ('acquire', acquire_media_stage),
+            ('upload', upload_video_stage),
+            ('process', process_video_stage),
+            ('summarize', summarize_video_stage),
+        ],
+        max_workers=app.config['VIDEO_JOB_WORKERS'],
+        max_pending=app.config['VIDEO_JOB_MAX_PENDING'],
+        cleanup=cleanup_video_job,
+        run_in=app.app_context
+    )
+
+# Function to pick up the background work a previous run left unfinished, once a process starts
+# serving; the ASGI server calls it at startup (see asgi.py)
+def start_background_work():
+    video_jobs.start()
+    image_ingestion.resume()
+
+# Connection of the db_executor thread doing an async view's SQLite work; see run_sync()
+_executor_db = contextvars.ContextVar('executor_db', default=None)
+
+# Function to get a database connection; the connection is reused by later requests on this thread
 def get_db():
+    db = _executor_db.get()
+    if db is not None:
+        return db
     if 'db' not in g:
-        g.db = sqlite3.connect(app.config['DATABASE'])
-        g.db.row_factory = sqlite3.Row
+        g.db = database.connection(current_app.config['DATABASE'])
     return g.db
 
-# Close the database connection after the app context ends
-@app.teardown_appcontext
+# Hand the database connection back after the app context ends; create_app() registers this
 def close_db(error):
     db = g.pop('db', None)
     if db is not None:
-        db.close()
+        database.release(db)
 
-# Initialize the database tables
-def init_db():
-    db = get_db()
-    db.execute('''CREATE TABLE IF NOT EXISTS users (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    email TEXT NOT NULL UNIQUE,
-                    password TEXT NOT NULL)''')
-    db.commit()
-
-    db.execute('''CREATE TABLE IF NOT EXISTS stories (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    name TEXT NOT NULL,
-                    email TEXT NOT NULL,
-                    story TEXT NOT NULL,
-                    image BLOB,
-                    mime_type TEXT,
-                    approved BOOLEAN DEFAULT 0)''')
-    db.commit()
+# Function to run blocking work, chiefly SQLite, for an async view without blocking the event loop
+async def run_sync(fn, *args, **kwargs):
+    """Runs fn(*args, **kwargs) on db_executor in a copy of the caller's context, so the request,
+    session and app are available, with get_db() returning that thread's own connection."""
+    path = current_app.config['DATABASE']
 
-    db.execute('''CREATE TABLE IF NOT EXISTS GuideEntry (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER NOT NULL,
-                    topic TEXT NOT NULL,
-                    day INTEGER NOT NULL,
-                    title TEXT NOT NULL,
-                    approaches TEXT NOT NULL,
-                    completed INTEGER DEFAULT 0,
-                    FOREIGN KEY(user_id) REFERENCES users(id))''')
-    db.commit()
-
-    db.execute('''CREATE TABLE IF NOT EXISTS UserProgress (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER NOT NULL,
-                    topic TEXT NOT NULL,
-                    day INTEGER NOT NULL,
-                    completed BOOLEAN DEFAULT 0,
-                    UNIQUE(user_id, topic, day),
-                    FOREIGN KEY(user_id) REFERENCES users(id))''')
-    db.commit()
+    def run():
+        db = database.connection(path)
+        token = _executor_db.set(db)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _executor_db.reset(token)
+            database.release(db)
+
+    return await asyncio.get_running_loop().run_in_executor(db_executor, contextvars.copy_context().run, run)
+
+# Record every request's latency and SQLite statements; model calls are recorded by GatedModel
+database.observe_queries(metrics.observe_query)
+
+@routes.before_app_request
+def start_request_metrics():
+    g.request_metrics = metrics.start_request(request.endpoint.rsplit('.', 1)[-1] if request.endpoint else 'unmatched')
+
+# Finish the request's metrics once the response is closed, so streamed bodies are timed to their last byte
+@routes.after_app_request
+def finish_request_metrics_on_close(response):
+    state = g.pop('request_metrics', None)
+    if state is not None:
+        method = request.method
+        response.call_on_close(lambda: metrics.finish_request(state, method, response.status_code))
+    return response
+
+# Requests that failed before a response was made are finished here instead
+@routes.teardown_app_request
+def finish_failed_request_metrics(error):
+    state = g.pop('request_metrics', None)
+    if state is not None:
+        metrics.finish_request(state, request.method, 500)
+
+# Endpoint exposing the collected metrics in the Prometheus text format
+@routes.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    return current_app.response_class(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+# Answer requests the LLM gateway turned away with a quick 429 rather than tying up a worker
+@routes.app_errorhandler(LLMUnavailable)
+def llm_unavailable(error):
+    if isinstance(error, RateLimited):
+        metrics.observe_rate_limited()
+    return jsonify({"error": str(error)}), 429, {"Retry-After": str(error.retry_after)}
+
+# Answer sign-ins with a quick 503 while the password hashing processes are saturated
+@routes.app_errorhandler(auth.HasherBusy)
+def password_hasher_busy(error):
+    return jsonify({"error": str(error)}), 503, {"Retry-After": str(round(error.retry_after))}
+
+# Function to charge a model-backed request to the user's and the client IP's rate limits
+def admit_llm_request():
+    llm_gateway.admit(session.get('user_id'), request.remote_addr)
+
+# Initialize the database tables by applying any pending schema migrations
+def init_db():
+    applied = database.migrate(get_db())
+    for name in applied:
+        logger.info("Applied migration %s.", name)
 
 # Command to initialize the database from command line
-@app.cli.command('init-db')
+@routes.cli.command('init-db')
 def init_db_command():
     init_db()
-    print("Initialized the database.")
+    click.echo("Initialized the database.")
+
+# Command to generate the fixed-prompt resource guides ahead of the first request
+@routes.cli.command('warm-cache')
+def warm_cache_command():
+    warm_resource_cache(force=True)
+    click.echo("Warmed the resource cache.")
+
+# Command to pre-generate the shared guide templates for every topic
+@routes.cli.command('fill-guide-templates')
+@click.option('--size', type=int, default=None, help='Templates to keep per topic.')
+@click.option('--refresh', is_flag=True, help='Discard existing templates and generate new ones.')
+def fill_guide_templates_command(size, refresh):
+    size = size or current_app.config['GUIDE_TEMPLATE_POOL_SIZE']
+    db = get_db()
+    for goal_index, topic in enumerate(topics):
+        added = guide_templates.fill_pool(db, topic, lambda: generate_guide(goal_index), size, refresh=refresh)
+        click.echo(f"{topic}: added {added} template(s), {guide_templates.pool_size(db, topic)} in pool.")
+
+# Command to write the resized copies of the frontend's public images; run before the frontend build
+@routes.cli.command('build-images')
+def build_images_command():
+    public = os.path.join(current_app.root_path, 'src/frontend/public')
+    written = static_assets.build_image_variants(public, os.path.join(public, 'img'))
+    click.echo(f"Wrote {len(written)} image variant(s).")
+
+# Command to write .gz/.br copies of the frontend build; run after the frontend build
+@routes.cli.command('compress-static')
+def compress_static_command():
+    written = static_assets.compress_directory(current_app.config['STATIC_FOLDER'])
+    click.echo(f"Wrote {len(written)} compressed file(s).")
 
 # Endpoint to add a user (for testing purposes)
-@app.route('/add_user', methods=['POST'])
+@routes.route('/add_user', methods=['POST'])
 def add_user():
     db = get_db()
     db.execute('INSERT INTO users (email, password) VALUES (?, ?)',
-               ('testuser@example.com', bcrypt.generate_password_hash('password').decode('utf-8')))
+               ('testuser@example.com', password_hasher.hash('password')))
     db.commit()
     return 'User added!'
 
 # API endpoint for retrieving a sample message
-@app.route('/api/data', methods=['GET'])
+@routes.route('/api/data', methods=['GET'])
 def get_data():
     # Provide a simple message in JSON format
     data = {'message': 'Hello from Flask!'}
     return jsonify(data)
     
 # Root endpoint for serving the index.html file
-@app.route('/')
+@routes.route('/')
 def index():
-    # Log information about the static folder and file being served
-    print(f"static_folder: {app.static_folder}")
-    print(f"Trying to serve {os.path.join(app.static_folder, 'index.html')}")
+    return static_assets.send_asset(current_app.config['STATIC_FOLDER'], 'index.html', current_app.config['STATIC_MAX_AGE'])
 
-    # Serve the index.html from the static folder
-    return send_from_directory(app.static_folder, 'index.html')
+# Serve the rest of the frontend build, precompressed where possible
+@routes.route('/<path:filename>')
+def static_file(filename):
+    return static_assets.send_asset(current_app.config['STATIC_FOLDER'], filename, current_app.config['STATIC_MAX_AGE'])
 
 # Signup endpoint for new users
-@app.route('/signup', methods=['POST'])
+@routes.route('/signup', methods=['POST'])
 def signup():
     # Get the email and password from the request
     data = request.json
@@ -131,8 +371,11 @@ def signup():
     if not email or not password:
         return jsonify({'error': 'Please provide an email and password'}), 400
 
-    # Hash the password using Bcrypt
-    hashed_password = bcrypt.generate_password_hash(password).decode('utf-8')
+    if len(password.encode('utf-8')) > auth.MAX_PASSWORD_BYTES:
+        return jsonify({'error': 'Please choose a password of at most 72 bytes'}), 400
+
+    # Hash the password using bcrypt, in the hashing processes
+    hashed_password = password_hasher.hash(password)
 
     # Insert the new user into the database
     try:
@@ -142,22 +385,22 @@ def signup():
         return jsonify({"message": "User registered successfully"}), 201
     except sqlite3.IntegrityError as e:
         # Handle unique constraint error (email already exists)
-        print(f"IntegrityError: {e}")
+        logger.info("Signup with an existing email: %s", e)
         return jsonify({"error": "User with this email already exists"}), 400
     except Exception as e:
         # Handle any unexpected error
-        print(f"Unexpected error: {e}")
+        logger.exception("Unexpected error during signup")
         return jsonify({"error": "An unexpected error occurred"}), 500
 
 # Logout endpoint to clear the user session
-@app.route('/logout')
+@routes.route('/logout')
 def logout():
     session.clear()  # This clears the entire session
     return jsonify({"message": "Logged out successfully"}), 200
 
 
 # Login endpoint for user authentication
-@app.route('/login', methods=['POST'])
+@routes.route('/login', methods=['POST'])
 def login():
     # Get the email and password from the request
     data = request.json
@@ -172,34 +415,45 @@ def login():
 
     # Attempt to retrieve the user record by email
     try:
-        user_record = db.execute("SELECT * FROM users WHERE email = ?", (email,)).fetchone()
+        user_record = db.execute("SELECT id, email, password FROM users WHERE email = ?", (email,)).fetchone()
     except sqlite3.Error as e:
         # Log any database error and return an error response
-        print("Database error:", e)
+        logger.error("Database error during login: %s", e)
         return jsonify({"error": "Database error"}), 500
 
     # Check if the user record was found and verify the password
     if user_record is None:
         return jsonify({"error": "Invalid credentials"}), 401
 
-    # Verify the password using Bcrypt
-    if bcrypt.check_password_hash(user_record['password'], password):
+    # Verify the password using bcrypt, in the hashing processes
+    if password_hasher.check(user_record['password'], password):
+        # Hashes made with other rounds are redone in the background
+        if password_hasher.needs_rehash(user_record['password']):
+            password_hasher.rehash(user_record['id'], user_record['password'], password)
+
         # Store the user ID in the session if login is successful
         session['user_id'] = user_record['id']
+        principals.put({'id': user_record['id'], 'email': user_record['email']})
         return jsonify({"message": "Login successful"}), 200
     else:
         return jsonify({"error": "Invalid credentials"}), 401
 
 # Function to get the current logged-in user from the session
 def get_current_user():
+    """Returns {"id", "email"} for the signed-in user, or None."""
     # Get the user_id from the session
     user_id = session.get('user_id')
     if user_id is None:
         return None
 
-    # Fetch the user from the database using the user_id
-    db = get_db()
-    return db.execute("SELECT * FROM users WHERE id = ?", (user_id,)).fetchone()
+    # The session is signed, so the id can be trusted; the users table is only checked
+    # again once the cached principal is older than AUTH_PRINCIPAL_TTL
+    return principals.get(user_id, load_principal)
+
+# Function to fetch a user's principal from the database
+def load_principal(user_id):
+    user = get_db().execute("SELECT id, email FROM users WHERE id = ?", (user_id,)).fetchone()
+    return dict(user) if user is not None else None
 
 # List of topics for guides
 topics = [
@@ -211,17 +465,9 @@ topics = [
     "Improving Communication Skills"
 ]
 
-# Function to generate a 21-day guide based on the selected goal
-def generate_guide(goal_index, max_retries=5):
-    """Generates a 21-day plan based on the selected goal."""
-    
-    # Validate the goal index
-    if not (0 <= goal_index < len(topics)):
-        raise ValueError("Invalid goal index.")
-    
-    # Prepare prompt to generate content using the selected goal
-    goal = topics[goal_index]
-    prompt = f'''You are a mentor dedicated to helping young adult girls develop new skills to enhance their career potential. 
+# Mentor instructions shared by every guide prompt, whether the guide is generated whole or in chunks;
+# they are the guide model's system instruction rather than part of each prompt
+guide_mentor_prompt = '''You are a mentor dedicated to helping young adult girls develop new skills to enhance their career potential. 
                 As an expert in goal-setting and habit-building, you specialize in creating 21-day plans that break down goals into manageable daily steps for building lasting habits.
                 These habits are intended to support the achievement of a larger goal.
                 While the goal might not be fully accomplished within 21 days, this period serves as a foundation to develop skills and continue working towards the ultimate objective.
@@ -229,8 +475,20 @@ def generate_guide(goal_index, max_retries=5):
                 For each day, offer more than one approach to help achieve their goal.
                 Your task is to:
                 1. Provide Daily Guidance for the goal: Deliver clear, relevant, and easy-to-understand advice to support the user in reaching each day’s objective.
-                2. Break the Goal into 21 Steps: Divide the goal into 21 actionable daily tasks, each designed to build progressively toward accomplishing the larger goal.
-                3. Output as raw JSON structure that follows the format below (do not include the json headline):
+                2. Break the Goal into 21 Steps: Divide the goal into 21 actionable daily tasks, each designed to build progressively toward accomplishing the larger goal.'''
+
+# Function to build the prompt for a 21-day guide based on the selected goal
+def guide_prompt(goal_index):
+    """Builds the prompt asking for a 21-day plan for the selected goal, for the guide model."""
+
+    # Validate the goal index
+    if not (0 <= goal_index < len(topics)):
+        raise ValueError("Invalid goal index.")
+
+    # Prepare prompt to generate content using the selected goal
+    goal = topics[goal_index]
+    return f'''Write the full 21-day plan.
+                Output as raw JSON structure that follows the format below (do not include the json headline):
                 {{
                 "goal": "<the goal description>",
                 "guide": [
@@ -266,90 +524,351 @@ def generate_guide(goal_index, max_retries=5):
                 }}
                 The goal for this user is {goal}'''
 
-    response = model.generate_content(prompt)
-    retries = 0
-    
-    while retries < max_retries:
-        response = model.generate_content(prompt)
-        
-        try:
-            # Attempt to decode the model's response
-            guide_data = json.loads(response.text.strip())
-            
-            # Check if the response contains a 'guide' key
-            if "guide" in guide_data:
-                return guide_data  # Success: return the correctly formatted response
+# Function to generate a 21-day guide based on the selected goal
+def generate_guide(goal_index, max_retries=5):
+    """Generates a 21-day plan based on the selected goal."""
+    prompt = guide_prompt(goal_index)  # Also validates the goal index
 
-            print("Model response missing 'guide' key, retrying...")
+    # Outline first, then the three weeks in parallel, each retried on its own
+    if current_app.config['GUIDE_GENERATION_MODE'] == 'chunked':
+        return guide_generation.generate_chunked_guide(
+            lambda prompt: prompts['guide'].generate_content(prompt).text,
+            topics[goal_index],
+            guide_executor,
+            max_retries=max_retries
+        )
 
-        except json.JSONDecodeError:
-            # Log JSON decode errors
-            print(f"Failed to decode JSON on attempt {retries + 1}. Raw response: {response.text}")
+    retries = 0
+
+    while retries < max_retries:
+        response = prompts['guide'].generate_content(prompt)
+        guide_data = parse_guide_response(response.text, retries + 1)
+        if guide_data is not None:
+            return guide_data  # Success: return the correctly formatted response
 
         # Increment retry counter
         retries += 1
 
     # If no valid response after retries
-    print("Exceeded maximum retries. Model response was not in the correct format.")
+    logger.error("Exceeded maximum retries. Model response was not in the correct format.")
+    return None
+
+# Function to generate a 21-day guide like generate_guide(), for async views
+async def generate_guide_async(goal_index, max_retries=5):
+    prompt = guide_prompt(goal_index)  # Also validates the goal index
+
+    if current_app.config['GUIDE_GENERATION_MODE'] == 'chunked':
+        async def generate_text(prompt):
+            return (await prompts['guide'].generate_content_async(prompt)).text
+        return await guide_generation.generate_chunked_guide_async(generate_text, topics[goal_index], max_retries=max_retries)
+
+    for attempt in range(1, max_retries + 1):
+        response = await prompts['guide'].generate_content_async(prompt)
+        guide_data = parse_guide_response(response.text, attempt)
+        if guide_data is not None:
+            return guide_data
+
+    logger.error("Exceeded maximum retries. Model response was not in the correct format.")
+    return None
+
+# Function to decode a single-request guide, or return None (after logging why) to have it retried
+def parse_guide_response(text, attempt):
+    try:
+        # Attempt to decode the model's response
+        guide_data = guide_generation.parse_json(text)
+
+        # Check if the response contains a 'guide' key
+        if "guide" in guide_data:
+            return guide_data
+
+        logger.warning("Model response missing 'guide' key, retrying...")
+        metrics.observe_llm_retry("guide")
+
+    except json.JSONDecodeError:
+        # Log JSON decode errors
+        logger.warning("Failed to decode JSON on attempt %d.", attempt, extra={"raw_response": text})
+        metrics.observe_llm_retry("guide")
+
     return None
 
 # Endpoint to get the guide for a specific topic
-@app.route('/get-guide/<topic>', methods=['GET'])
-def get_guide(topic):
-    db = get_db()
-    user = get_current_user()  # Get the current user
+@routes.route('/get-guide/<topic>', methods=['GET'])
+async def get_guide(topic):
+    user = await run_sync(get_current_user)  # Get the current user
+    if user is None:
+        return jsonify({"error": "User not logged in"}), 401
     user_id = user['id']
 
-    # Fetch existing guide entries for the topic and user
-    guide_entries = db.execute(
-        'SELECT day, title, approaches, completed FROM GuideEntry WHERE topic = ? AND user_id = ? ORDER BY day', 
-        (topic, user_id)
-    ).fetchall()
+    def build():
+        # Fetch existing guide entries for the topic and user
+        guide_entries = fetch_guide_entries(get_db(), user_id, topic)
+        if not guide_entries:
+            return None
+        # Format the guide data to return to the user
+        guide = [format_guide_entry(entry) for entry in guide_entries]
+        return {"daily_guide": {"goal": topic, "guide": guide}}
 
-    # If guide doesn't exist, generate a new guide
-    if not guide_entries:
+    def respond():
+        return versioned_json_response('guide', user_id, topic, guide_version(get_db(), user_id, topic), build)
+
+    response = await run_sync(respond)
+
+    # If guide doesn't exist, copy one from the shared template pool or generate a new guide
+    if response is None:
         goal_index = topics.index(topic) if topic in topics else -1
         if goal_index == -1:
             return jsonify({"error": "Topic not found"}), 404
 
-        guide_data = generate_guide(goal_index)
-        
-        # Store the generated guide in the database
-        for day_item in guide_data["guide"]:
-            db.execute('''
-                INSERT OR IGNORE INTO GuideEntry (user_id, topic, day, title, approaches, completed)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (
-                user_id,
-                topic,
-                day_item["day"],
-                day_item["title"],
-                json.dumps(day_item["approaches"]),
-                0  # Default to not completed
-            ))
-        db.commit()
-        
-        # Fetch the newly created guide entries
-        guide_entries = db.execute(
-            'SELECT day, title, approaches, completed FROM GuideEntry WHERE topic = ? AND user_id = ? ORDER BY day', 
-            (topic, user_id)
-        ).fetchall()
-
-    # Format the guide data to return to the user
-    guide = [
-        {
-            "day": entry["day"],
-            "title": entry["title"],
-            "approaches": json.loads(entry["approaches"]),
-            "completed": bool(entry["completed"])
+        if not await create_user_guide(user_id, topic, goal_index):
+            return jsonify({"error": "Failed to generate guide"}), 500
+        response = await run_sync(respond)
+
+    return response
+
+# Endpoint to get the guide for a topic together with the user's progress on it, so the
+# guide screen needs one request instead of /get-guide plus /get-user-progress
+@routes.route('/get-guide/<topic>/progress', methods=['GET'])
+async def get_guide_with_progress(topic):
+    user = await run_sync(get_current_user)
+    if user is None:
+        return jsonify({"error": "User not logged in"}), 401
+    user_id = user['id']
+
+    def build():
+        guide_entries = fetch_guide_with_progress(get_db(), user_id, topic)
+        if not guide_entries:
+            return None
+        totals = guide_entries[0]
+        return {
+            "daily_guide": {"goal": topic, "guide": [format_guide_entry(entry) for entry in guide_entries]},
+            "progress": {
+                "completed_days": totals["completed_days"],
+                "total_days": totals["total_days"],
+                "percent_complete": totals["percent_complete"]
+            }
         }
-        for entry in guide_entries
-    ]
 
-    return jsonify({"daily_guide": {"goal": topic, "guide": guide}})
+    def respond():
+        return versioned_json_response('guide-progress', user_id, topic, guide_version(get_db(), user_id, topic), build)
+
+    response = await run_sync(respond)
+
+    # If guide doesn't exist, copy one from the shared template pool or generate a new guide
+    if response is None:
+        goal_index = topics.index(topic) if topic in topics else -1
+        if goal_index == -1:
+            return jsonify({"error": "Topic not found"}), 404
+
+        if not await create_user_guide(user_id, topic, goal_index):
+            return jsonify({"error": "Failed to generate guide"}), 500
+        response = await run_sync(respond)
+
+    return response
+
+# Endpoint streaming the guide for a specific topic as Server-Sent Events: one "day" event per
+# day as soon as it is available, then a "done" event once the guide is saved
+@routes.route('/get-guide/<topic>/stream', methods=['GET'])
+def stream_guide(topic):
+    db = get_db()
+    user = get_current_user()
+    if user is None:
+        return jsonify({"error": "User not logged in"}), 401
+    user_id = user['id']
+
+    goal_index = topics.index(topic) if topic in topics else -1
+    if goal_index == -1:
+        return jsonify({"error": "Topic not found"}), 404
+
+    # Existing guides, and new ones copied from the template pool, are sent in one go
+    guide_entries = fetch_guide_entries(db, user_id, topic)
+    if not guide_entries and guide_templates.assign_template(db, user_id, topic):
+        guide_entries = fetch_guide_entries(db, user_id, topic)
+    if not guide_entries:
+        admit_llm_request()
+
+    def generate():
+        entries = guide_entries
+        key = guide_generation_key(user_id, topic)
+        owner = None
+        try:
+            if not entries:
+                owner = guide_leases.acquire(key)
+                if owner is None:
+                    # Another request is already generating this guide; send its result once it's stored
+                    guide_leases.wait(key)
+                entries = fetch_guide_entries(get_db(), user_id, topic)
+                if not entries and owner is None:
+                    yield sse_event({"error": "Failed to generate guide"}, event="error")
+                    return
+
+            if entries:
+                for entry in entries:
+                    yield sse_event(format_guide_entry(entry), event="day")
+                yield sse_event({"goal": topic}, event="done")
+                return
+
+            # Otherwise stream the model's output, emitting each day object as soon as it closes
+            parser = GuideDayParser()
+            days = []
+            for chunk in prompts['guide'].generate_content(guide_prompt(goal_index), stream=True):
+                for day_item in parser.feed(chunk.text):
+                    days.append(day_item)
+                    yield sse_event(dict(day_item, completed=False), event="day")
+
+            guide_data = {"goal": topic, "guide": days}
+            if not guide_templates.validate_guide(guide_data):
+                yield sse_event({"error": "Failed to generate guide"}, event="error")
+                return
+            store_user_guide(get_db(), user_id, topic, guide_data)
+            yield sse_event({"goal": topic}, event="done")
+        except LLMUnavailable as e:
+            yield sse_event({"error": str(e), "retry_after": e.retry_after}, event="error")
+        except Exception:
+            # The status line is already sent, so a failure has to be reported in the stream;
+            # without an error event the client would take the days so far for the whole guide
+            logger.exception("Streaming the guide for %s failed", topic)
+            yield sse_event({"error": "Failed to generate guide"}, event="error")
+        finally:
+            if owner is not None:
+                guide_leases.release(key, owner)
+
+    return current_app.response_class(stream_with_context(generate()), mimetype='text/event-stream',
+                              headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+# Concurrent requests for the same user's guide share one generation: within this process
+# through the single-flight registry, across worker processes through a GenerationLease row
+guide_flights = AsyncSingleFlight()
+
+# Function to build the key guide generation is de-duplicated on
+def guide_generation_key(user_id, topic):
+    return f"guide:{user_id}:{topic}"
+
+# Function to create a user's guide for a topic exactly once, however many requests ask for it
+async def create_user_guide(user_id, topic, goal_index):
+    """Returns True once the user has a guide for the topic, False if generation failed.
+
+    The first request copies a template or generates the guide; requests arriving meanwhile
+    wait for it instead of making their own model calls. Waiting holds no thread: only the
+    SQLite work runs on the database executor.
+    """
+    key = guide_generation_key(user_id, topic)
+
+    def fetch():
+        return fetch_guide_entries(get_db(), user_id, topic)
+
+    async def create():
+        owner = await run_sync(guide_leases.acquire, key)
+        if owner is None:
+            # A request in another worker process holds the lease; use whatever it stores
+            await guide_leases.wait_async(key, run_sync)
+            return bool(await run_sync(fetch))
+
+        try:
+            # The previous holder may have finished between our check and taking the lease
+            if await run_sync(lambda: fetch() or guide_templates.assign_template(get_db(), user_id, topic)):
+                return True
+            # Only a guide that needs the model counts against the user's and IP's rate limits
+            admit_llm_request()
+            guide_data = await generate_guide_async(goal_index)
+            if not guide_data:
+                return False
+            await run_sync(lambda: store_user_guide(get_db(), user_id, topic, guide_data))
+            return True
+        finally:
+            await run_sync(guide_leases.release, key, owner)
+
+    return await guide_flights.do(key, create)
+
+# Function to fetch a user's guide entries for a topic in day order
+def fetch_guide_entries(db, user_id, topic):
+    return db.execute(
+        'SELECT day, title, approaches, completed FROM GuideEntry WHERE topic = ? AND user_id = ? ORDER BY day',
+        (topic, user_id)
+    ).fetchall()
+
+# Function to read a user's guide for a topic with their progress, in one query on the
+# (user_id, topic, day) indexes of both tables
+def fetch_guide_with_progress(db, user_id, topic):
+    """Each row also carries the topic's totals: total_days, completed_days and percent_complete."""
+    return db.execute('''
+        SELECT day, title, approaches, completed,
+               COUNT(*) OVER () AS total_days,
+               SUM(completed) OVER () AS completed_days,
+               ROUND(100.0 * SUM(completed) OVER () / COUNT(*) OVER (), 1) AS percent_complete
+        FROM (
+            SELECT e.day, e.title, e.approaches, COALESCE(p.completed, e.completed) AS completed
+            FROM GuideEntry e
+            LEFT JOIN UserProgress p ON p.user_id = e.user_id AND p.topic = e.topic AND p.day = e.day
+            WHERE e.user_id = ? AND e.topic = ?
+        )
+        ORDER BY day
+    ''', (user_id, topic)).fetchall()
+
+# Function to get the version of a user's guide and progress for a topic; it goes up with every
+# write to either (database triggers bump it), and is 0 if neither has been written yet
+def guide_version(db, user_id, topic):
+    row = db.execute('SELECT version FROM GuideVersion WHERE user_id = ? AND topic = ?', (user_id, topic)).fetchone()
+    return row['version'] if row else 0
+
+# Function to get a version covering all of a user's guides and progress
+def user_progress_version(db, user_id):
+    return db.execute('SELECT COALESCE(SUM(version), 0) FROM GuideVersion WHERE user_id = ?', (user_id,)).fetchone()[0]
+
+# Function to answer a per-user read from the version of its data
+def versioned_json_response(kind, user_id, topic, version, build):
+    """Answers If-None-Match from the version alone with a 304, and otherwise serves the body
+    from the in-process cache, calling build() for the data on a miss. Returns None if
+    build() returns None, i.e. there is nothing to serve yet."""
+    # The user id is part of the ETag so a browser shared by two accounts never gets a false 304
+    etag = f'{kind}-{user_id}-{version}'
+    if version and request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+    else:
+        def produce():
+            data = build()
+            return None if data is None else current_app.json.dumps(data)
+
+        body = response_bodies.get((kind, user_id, topic), version, produce)
+        if body is None:
+            return None
+        response = current_app.response_class(body, mimetype='application/json')
+
+    response.set_etag(etag)
+    # Only the user's own browser may keep it, and it has to revalidate every time
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+# Function to format a GuideEntry row the way the frontend expects it
+def format_guide_entry(entry):
+    return {
+        "day": entry["day"],
+        "title": entry["title"],
+        "approaches": json.loads(entry["approaches"]),
+        "completed": bool(entry["completed"])
+    }
+
+# Function to store a newly generated guide for a user and offer it to the template pool
+def store_user_guide(db, user_id, topic, guide_data):
+    db.executemany('''
+        INSERT OR IGNORE INTO GuideEntry (user_id, topic, day, title, approaches, completed)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', [(
+        user_id,
+        topic,
+        day_item["day"],
+        day_item["title"],
+        json.dumps(day_item["approaches"]),
+        0  # Default to not completed
+    ) for day_item in guide_data["guide"]])
+    db.commit()
+
+    # Keep the guide for later users while the topic's pool is still filling up
+    if guide_templates.pool_size(db, topic) < current_app.config['GUIDE_TEMPLATE_POOL_SIZE']:
+        guide_templates.add_template(db, topic, guide_data)
 
 # Endpoint to manually generate a guide plan for a specific topic (for testing purposes)
-@app.route('/generate-plan', methods=['POST'])
+@routes.route('/generate-plan', methods=['POST'])
 def generate_plan():
     data = request.json
     goal_index = data.get('goal_index')
@@ -359,6 +878,7 @@ def generate_plan():
         return jsonify({"error": "Invalid goal index"}), 400
 
     # Generate the guide for the given goal index
+    admit_llm_request()
     topic = topics[goal_index]
     guide_data = generate_guide(goal_index)
 
@@ -382,41 +902,41 @@ def generate_plan():
     
     return jsonify({"daily_guide": guide_data}), 200
 
-@app.route('/get-user-progress', methods=['POST'])
+@routes.route('/get-user-progress', methods=['POST'])
 def get_user_progress():
     # Get the current logged-in user
     user = get_current_user()
     
     # Check if user is logged in
     if user is None:
-        print("No user is logged in.")
+        logger.debug("No user is logged in.")
         return jsonify({"error": "User not logged in"}), 401
     
     # Fetch user's progress
-    print(f"Fetching progress for user_id: {user['id']}")
     db = get_db()
-    progress = db.execute('''
-        SELECT topic, day, completed
-        FROM UserProgress
-        WHERE user_id = ?
-    ''', (user['id'],)).fetchall()
-
-    # Log if no progress records are found
-    if not progress:
-        print(f"No progress records found for user_id: {user['id']}")
-    
-    # Format progress data as a dictionary for the frontend
-    progress_dict = {}
-    for row in progress:
-        topic = row["topic"]
-        if topic not in progress_dict:
-            progress_dict[topic] = []
-        progress_dict[topic].append({"day": row["day"], "completed": bool(row["completed"])})
-
-    print("Progress data being sent:", progress_dict)
-    return jsonify(progress=progress_dict)
-
-@app.route('/update-day-completion', methods=['POST'])
+    user_id = user['id']
+
+    def build():
+        progress = db.execute('''
+            SELECT topic, day, completed
+            FROM UserProgress
+            WHERE user_id = ?
+        ''', (user_id,)).fetchall()
+
+        # Format progress data as a dictionary for the frontend
+        progress_dict = {}
+        for row in progress:
+            topic = row["topic"]
+            if topic not in progress_dict:
+                progress_dict[topic] = []
+            progress_dict[topic].append({"day": row["day"], "completed": bool(row["completed"])})
+
+        logger.debug("Sending progress", extra={"user_id": user_id, "records": len(progress)})
+        return {"progress": progress_dict}
+
+    return versioned_json_response('progress', user_id, None, user_progress_version(db, user_id), build)
+
+@routes.route('/update-day-completion', methods=['POST'])
 def update_day_completion():
     # Retrieve data from the request
     data = request.json
@@ -438,22 +958,66 @@ def update_day_completion():
     # Update or insert user's progress for the given topic and day
     db = get_db()
     try:
-        # Insert or update the entry in UserProgress using ON CONFLICT
-        db.execute('''
+        save_progress(db, user_id, [(topic, day, completed)])
+        return jsonify({"message": "Day completion status updated successfully"})
+    except sqlite3.Error as e:
+        # Log and return error if updating fails
+        logger.error("Database error while updating progress: %s", e)
+        return jsonify({"error": "Failed to update day completion status"}), 500
+
+# Function to apply (topic, day, completed) changes to a user's progress in one transaction
+def save_progress(db, user_id, changes):
+    try:
+        # Insert or update the entries in UserProgress using ON CONFLICT
+        db.executemany('''
             INSERT INTO UserProgress (user_id, topic, day, completed)
             VALUES (?, ?, ?, ?)
             ON CONFLICT(user_id, topic, day)
             DO UPDATE SET completed = excluded.completed
-        ''', (user_id, topic, day, 1 if completed else 0))
-        
+        ''', [(user_id, topic, day, 1 if completed else 0) for topic, day, completed in changes])
         db.commit()
-        return jsonify({"message": "Day completion status updated successfully"})
+    except sqlite3.Error:
+        db.rollback()
+        raise
+
+# Endpoint to update many days at once: {"updates": [{"topic": ..., "day": ..., "completed": ...}, ...]}.
+# Later updates to the same day win.
+@routes.route('/update-progress', methods=['POST'])
+def update_progress():
+    user = get_current_user()
+    if user is None:
+        return jsonify({"error": "User not logged in"}), 401
+
+    data = request.get_json(silent=True) or {}
+    updates = data.get("updates")
+    if not isinstance(updates, list) or not updates:
+        return jsonify({"error": "Missing required data"}), 400
+    if len(updates) > current_app.config['PROGRESS_MAX_UPDATES']:
+        return jsonify({"error": "Too many updates in one request"}), 400
+
+    # Validate every update before applying any of them
+    changes = []
+    for update in updates:
+        if not isinstance(update, dict):
+            return jsonify({"error": "Invalid update"}), 400
+        topic, day = update.get("topic"), update.get("day")
+        if not isinstance(topic, str) or not isinstance(day, int) or isinstance(day, bool):
+            return jsonify({"error": "Each update needs a topic and a day"}), 400
+        changes.append((topic, day, bool(update.get("completed", True))))
+
+    try:
+        save_progress(get_db(), user['id'], changes)
+        return jsonify({"message": "Progress updated successfully", "updated": len(changes)})
     except sqlite3.Error as e:
-        # Log and return error if updating fails
-        print("Database error:", e)
-        return jsonify({"error": "Failed to update day completion status"}), 500
+        logger.error("Database error while updating progress: %s", e)
+        return jsonify({"error": "Failed to update progress"}), 500
+
+# Return JSON instead of an HTML page when a request body is over MAX_CONTENT_LENGTH
+@routes.app_errorhandler(413)
+def request_too_large(error):
+    return jsonify({'error': 'The upload is too large'}), 413
 
-@app.route('/submit-story', methods=['POST'])
+@routes.route('/submit-story', methods=['POST'])
 def submit_story():
     # Retrieve form data
     name = request.form.get('name')
@@ -465,57 +1029,192 @@ def submit_story():
     if not name or not email or not story:
         return jsonify({'error': 'All fields except image are required'}), 400
 
-    # Process image if provided
-    image_data = image.read() if image else None
-    mime_type = image.mimetype if image else None
+    # Check the image if provided; resizing happens later in the image process pool
+    image_data = None
+    if image:
+        image_data = image.read(current_app.config['IMAGE_MAX_BYTES'] + 1)
+        if len(image_data) > current_app.config['IMAGE_MAX_BYTES']:
+            return jsonify({'error': 'The image is too large'}), 413
+        try:
+            story_images.inspect_image(image_data)
+        except story_images.InvalidImage as e:
+            return jsonify({'error': str(e)}), 400
 
-    # Insert story into the database
+    # Insert story into the database, with its image kept until it has been resized
     db = get_db()
-    db.execute("INSERT INTO stories (name, email, story, image, mime_type) VALUES (?, ?, ?, ?, ?)", 
-               (name, email, story, image_data, mime_type))
-    db.commit()
+    try:
+        with db:
+            story_id = db.execute("INSERT INTO stories (name, email, story) VALUES (?, ?, ?)", (name, email, story)).lastrowid
+            if image_data:
+                image_ingestion.save(db, story_id, image_data)
+    except story_images.ImageQueueFull as e:
+        logger.warning("Image queue full: %s", e)
+        return jsonify({"error": "Too many stories are being submitted right now, please try again shortly"}), 503, {"Retry-After": "30"}
+
+    if image_data:
+        image_ingestion.submit(story_id, image_data)
 
     return jsonify({"message": "Story submitted successfully!"}), 201
 
-@app.route('/approved-stories', methods=['GET'])
+# Function to build the URL of a story's image at one of story_images.SIZES; the ETag in the
+# query string changes whenever the image does, which is what allows it to be cached as immutable
+def story_image_url(story, size='master'):
+    if not story['image_etag']:
+        return None
+    return f"/story/{story['id']}/image?size={size}&v={story['image_etag'][:16]}"
+
+# Endpoint listing approved stories one page at a time; pass the returned "next" cursor as
+# ?after= to get the following page
+@routes.route('/approved-stories', methods=['GET'])
 def get_approved_stories():
-    # Retrieve all approved stories from the database
+    after = request.args.get('after', 0, type=int)
+    limit = min(max(request.args.get('limit', current_app.config['STORIES_PAGE_SIZE'], type=int), 1), current_app.config['STORIES_MAX_PAGE_SIZE'])
+
+    # Seek past the cursor on the approved-stories index; one extra row tells us if there's a next page.
+    # Only the first few hundred characters of each story are read, and never the image BLOB
     db = get_db()
-    stories = db.execute("SELECT id, name, story, image, mime_type FROM stories WHERE approved = 1").fetchall()
+    stories = db.execute('''
+        SELECT id, name, substr(story, 1, ?) AS excerpt, length(story) > ? AS truncated, image_etag
+        FROM stories
+        WHERE approved = 1 AND id > ?
+        ORDER BY id
+        LIMIT ?
+    ''', (current_app.config['STORY_EXCERPT_LENGTH'], current_app.config['STORY_EXCERPT_LENGTH'], after, limit + 1)).fetchall()
+
+    has_more = len(stories) > limit
+    stories = stories[:limit]
 
     stories_data = []
     for story in stories:
-        story_data = dict(story)
-        if story_data['image']:
-            # Encode image as base64 string with MIME type
-            mime_type = story_data['mime_type'] or "image/jpeg"  # Default to JPEG if MIME type is not available
-            story_data['image'] = f"data:{mime_type};base64," + base64.b64encode(story_data['image']).decode('utf-8')
-        
-        stories_data.append(story_data)
-
-    return jsonify(stories_data)
-    
-@app.route('/story/<int:story_id>', methods=['GET'])
+        stories_data.append({
+            "id": story['id'],
+            "name": story['name'],
+            "excerpt": story['excerpt'],
+            "truncated": bool(story['truncated']),
+            "image": story_image_url(story, 'medium'),
+            "thumbnail": story_image_url(story, 'thumb')
+        })
+
+    return jsonify({"stories": stories_data, "next": stories[-1]['id'] if has_more else None})
+
+# Markers snippet() puts around matched words; control characters, so they can't clash with story text
+MATCH_START, MATCH_END = '\x02', '\x03'
+
+# Function to turn what a user typed into an FTS5 query: every word must appear, the last one
+# as a prefix so results show up while typing. Returns None if there are no words
+def story_search_query(text):
+    words = re.findall(r'\w+', text)[:10]
+    if not words:
+        return None
+    # Quoting each word keeps FTS5 operators and syntax in the input from being interpreted
+    return ' '.join(f'"{word}"' for word in words) + '*'
+
+# Function to HTML-escape a highlighted snippet and mark its matches with <mark>
+def highlight_html(text):
+    return html.escape(text).replace(MATCH_START, '<mark>').replace(MATCH_END, '</mark>')
+
+# Endpoint searching approved stories by name and text, best matches first; pass the returned
+# "next" offset as ?offset= to get the following page
+@routes.route('/stories/search', methods=['GET'])
+def search_stories():
+    query = story_search_query(request.args.get('q', ''))
+    if query is None:
+        return jsonify({"error": "Please provide something to search for"}), 400
+    limit = min(max(request.args.get('limit', current_app.config['STORIES_PAGE_SIZE'], type=int), 1), current_app.config['STORIES_MAX_PAGE_SIZE'])
+    offset = min(max(request.args.get('offset', 0, type=int), 0), current_app.config['STORY_SEARCH_MAX_OFFSET'])
+
+    # The index only holds approved stories and ranks them by bm25 itself (see database.add_story_search),
+    # so snippets are only built for the rows returned and the stories table isn't read at all
+    db = get_db()
+    stories = db.execute('''
+        SELECT rowid AS id, image_etag,
+               highlight(StorySearch, 0, ?, ?) AS name,
+               snippet(StorySearch, 1, ?, ?, '…', ?) AS snippet
+        FROM StorySearch
+        WHERE StorySearch MATCH ?
+        ORDER BY rank
+        LIMIT ? OFFSET ?
+    ''', (MATCH_START, MATCH_END, MATCH_START, MATCH_END, current_app.config['STORY_SNIPPET_TOKENS'], query, limit + 1, offset)).fetchall()
+
+    has_more = len(stories) > limit
+    stories = stories[:limit]
+
+    stories_data = []
+    for story in stories:
+        stories_data.append({
+            "id": story['id'],
+            "name": story['name'].replace(MATCH_START, '').replace(MATCH_END, ''),
+            "name_html": highlight_html(story['name']),
+            "snippet_html": highlight_html(story['snippet']),
+            "image": story_image_url(story, 'medium'),
+            "thumbnail": story_image_url(story, 'thumb')
+        })
+
+    return jsonify({"stories": stories_data, "next": offset + limit if has_more else None})
+
+@routes.route('/story/<int:story_id>', methods=['GET'])
 def get_story(story_id):
     # Retrieve specific approved story by ID from the database
     db = get_db()
     story = db.execute(
-        "SELECT id, name, story, image, mime_type FROM stories WHERE id = ? AND approved = 1", (story_id,)
+        "SELECT id, name, story, image_etag FROM stories WHERE id = ? AND approved = 1", (story_id,)
     ).fetchone()
 
     if story:
-        # Convert the story to a dictionary format
-        story_data = dict(story)
-        
-        # If an image exists, encode it as a base64 string with the correct MIME type
-        if story_data['image']:
-            mime_type = story_data['mime_type'] or "image/jpeg"  # Default to JPEG if MIME type is missing
-            story_data['image'] = f"data:{mime_type};base64," + base64.b64encode(story_data['image']).decode('utf-8')
-        
-        return jsonify(story_data)
+        return jsonify({
+            "id": story['id'],
+            "name": story['name'],
+            "story": story['story'],
+            "image": story_image_url(story)
+        })
     else:
         return jsonify({"error": "Story not found"}), 404
 
+# Endpoint serving a story's image bytes with long-lived HTTP caching; ?size= picks a variant and
+# browsers that accept WebP get the WebP encoding of it
+@routes.route('/story/<int:story_id>/image', methods=['GET'])
+def get_story_image(story_id):
+    size = request.args.get('size', 'master')
+    if size not in story_images.SIZES:
+        return jsonify({"error": "Unknown image size"}), 400
+
+    variants = [size]
+    if any(mime_type == 'image/webp' for mime_type, _ in request.accept_mimetypes):
+        variants.insert(0, f'{size}-webp')
+
+    db = get_db()
+    story = db.execute("SELECT image_etag FROM stories WHERE id = ? AND approved = 1 AND image_etag IS NOT NULL",
+                       (story_id,)).fetchone()
+    if story is None:
+        return jsonify({"error": "Image not found"}), 404
+
+    variant = db.execute(
+        f"SELECT variant, etag FROM StoryImage WHERE story_id = ? AND variant IN ({', '.join('?' for _ in variants)})",
+        (story_id, *variants)
+    ).fetchall()
+    variant = min(variant, key=lambda row: variants.index(row['variant']), default=None)
+
+    # Stories stored before variants existed only have the image in the stories table
+    etag = variant['etag'] if variant else story['image_etag']
+
+    # Answer revalidation from the ETag alone, without reading the BLOB
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+    elif variant:
+        image = db.execute("SELECT data, mime_type FROM StoryImage WHERE story_id = ? AND variant = ?",
+                           (story_id, variant['variant'])).fetchone()
+        response = current_app.response_class(image['data'], mimetype=image['mime_type'])
+    else:
+        image = db.execute("SELECT image, mime_type FROM stories WHERE id = ?", (story_id,)).fetchone()
+        response = current_app.response_class(image['image'], mimetype=image['mime_type'] or "image/jpeg")
+
+    response.set_etag(etag)
+    response.vary.add('Accept')
+    response.cache_control.public = True
+    response.cache_control.max_age = 365 * 24 * 60 * 60
+    response.cache_control.immutable = True
+    return response
+
 def store_guide_in_db(topic, guide_data):
     # Store generated guide data in the database
     db = get_db()
@@ -533,151 +1232,321 @@ def store_guide_in_db(topic, guide_data):
     db.commit()
 
 
-@app.route('/summarize-video', methods=['POST'])
+# System instruction for summarizing a video; the call itself only sends the transcript or the file
+video_summary_prompt = """
+        Summarize this video clearly and concisely, capturing its main message, themes, and any key takeaways. Identify specific goals or outcomes that a viewer can work toward based on the video’s content.
+        For each goal, provide a list of practical, actionable activities or exercises that will help achieve it. These should be realistic and achievable, designed to build momentum and reinforce progress.
+        Use a coaching tone that encourages persistence, offers strategies to overcome challenges, and emphasizes the benefits of consistency and focus in working toward each goal.
+        """
+
+# Pipeline stage 1: reuse a file already uploaded to GenAI for this video if it is still valid
+def reuse_upload_stage(ctx):
+    file_name = video_summaries.get_file_name(ctx['key'])
+    if file_name is None:
+        return
+    try:
+        video_file = llm_backend.get_file(file_name)
+    except Exception as e:
+        logger.info("Job %s: cached GenAI file is no longer available: %s", ctx['job_id'], e)
+        video_summaries.forget_file(ctx['key'])
+        return
+    if video_file.state.name != "FAILED":
+        ctx['video_file'] = video_file
+
+# Pipeline stage 2: get the cheapest usable media; existing captions first, then an audio-only stream
+def acquire_media_stage(ctx):
+    if 'video_file' in ctx:
+        return
+    logger.info("Job %s: fetching video details from YouTube...", ctx['job_id'])
+    info = video_media.probe(ctx['url'])
+    video_media.check_duration(info, current_app.config['VIDEO_MAX_DURATION'])
+
+    transcript = video_media.fetch_transcript(info, current_app.config['VIDEO_TRANSCRIPT_LANGUAGES'])
+    if transcript:
+        ctx['transcript'] = transcript
+        return
+
+    logger.info("Job %s: no captions found, downloading audio from YouTube...", ctx['job_id'])
+    ctx['work_dir'] = tempfile.mkdtemp(prefix=f"video_{ctx['job_id']}_")
+    ctx['video_file_name'] = video_media.download_media(ctx['url'], ctx['work_dir'], current_app.config['VIDEO_MAX_DOWNLOAD_BYTES'])
+
+# Pipeline stage 3: upload the downloaded media to Generative AI (GenAI)
+def upload_video_stage(ctx):
+    if 'video_file' in ctx or 'transcript' in ctx:
+        return
+    logger.info("Job %s: uploading file to GenAI...", ctx['job_id'])
+    video_file = llm_backend.upload_file(ctx['video_file_name'])
+    expires_at = video_file.expiration_time.timestamp() if video_file.expiration_time else None
+    video_summaries.set_file(ctx['key'], video_file.name, expires_at)
+    ctx['video_file'] = video_file
+
+# Pipeline stage 4: wait for GenAI to process the uploaded file
+def process_video_stage(ctx):
+    if 'transcript' in ctx:
+        return
+    logger.info("Job %s: waiting for file processing to complete...", ctx['job_id'])
+    video_file = ctx['video_file']
+    max_retries = 10  # Retry limit to prevent infinite loop
+    retries = 0
+    while video_file.state.name == "PROCESSING" and retries < max_retries:
+        time.sleep(10)  # Wait before retrying
+        video_file = llm_backend.get_file(video_file.name)
+        retries += 1
+
+    # Handle upload failure or timeout
+    if video_file.state.name != "ACTIVE":
+        raise ValueError("File upload failed or processing timed out")
+    ctx['video_file'] = video_file
+
+# Pipeline stage 5: generate the video summary using the Generative AI model
+def summarize_video_stage(ctx):
+    logger.info("Job %s: making LLM inference request...", ctx['job_id'])
+    if 'transcript' in ctx:
+        content = ["The video's transcript:\n" + ctx['transcript']]
+    else:
+        content = [ctx['video_file']]
+    response = prompts['video_summary'].generate_content(content, request_options={"timeout": 600})
+    ctx['summary'] = response.text
+    video_summaries.set_summary(ctx['key'], response.text)
+
+# Clean up by deleting the job's temporary directory once the job is over
+def cleanup_video_job(ctx):
+    work_dir = ctx.get('work_dir')
+    if work_dir and os.path.exists(work_dir):
+        shutil.rmtree(work_dir, ignore_errors=True)
+        logger.debug("Job %s: temporary files deleted.", ctx['job_id'])
+
+# Endpoint to queue a video summarization job; the summary is fetched from /summarize-video/<job_id>
+@routes.route('/summarize-video', methods=['POST'])
 def summarize_video():
     # Retrieve YouTube URL from request
-    data = request.json
-    youtube_url = data.get('url')
-    
+    data = request.get_json(silent=True)
+    youtube_url = data.get('url') if isinstance(data, dict) else None
+
     # Validate if YouTube URL is provided
-    if not youtube_url:
+    if not isinstance(youtube_url, str) or not youtube_url:
         return jsonify({"error": "YouTube URL is required"}), 400
 
-    video_file_name = "/content/downloaded_video.mp4"
-
-    try:
-        # Step 1: Download the video from YouTube using yt-dlp
-        print("Downloading video from YouTube...")
-        download_command = ["yt-dlp", "-o", video_file_name, youtube_url]
-        
-        # Run the download command and check for errors
-        result = subprocess.run(download_command, capture_output=True, text=True)
-        if result.returncode != 0:
-            print("Download error:", result.stderr)
-            return jsonify({"error": "Failed to download video from YouTube"}), 500
-        
-        # Step 2: Upload the downloaded video to Generative AI (GenAI)
-        print("Uploading file to GenAI...")
-        video_file = genai.upload_file(path=video_file_name)
-
-        # Step 3: Wait for GenAI to process the uploaded file
-        print("Waiting for file processing to complete...")
-        max_retries = 10  # Retry limit to prevent infinite loop
-        retries = 0
-        while video_file.state.name == "PROCESSING" and retries < max_retries:
-            print('.', end='', flush=True)
-            time.sleep(10)  # Wait before retrying
-            video_file = genai.get_file(video_file.name)
-            retries += 1
-
-        # Handle upload failure or timeout
-        if video_file.state.name == "FAILED" or retries == max_retries:
-            raise ValueError("File upload failed or processing timed out")
-
-        # Step 4: Generate video summary using the Generative AI model
-        prompt = """
-        Summarize this video clearly and concisely, capturing its main message, themes, and any key takeaways. Identify specific goals or outcomes that a viewer can work toward based on the video’s content.
-        For each goal, provide a list of practical, actionable activities or exercises that will help achieve it. These should be realistic and achievable, designed to build momentum and reinforce progress.
-        Use a coaching tone that encourages persistence, offers strategies to overcome challenges, and emphasizes the benefits of consistency and focus in working toward each goal.
-        """
+    video_id = youtube_video_id(youtube_url)
+    if video_id is None:
+        return jsonify({"error": "Please provide a link to a single YouTube video"}), 400
 
-        print("Making LLM inference request...")
-        response = model.generate_content([video_file, prompt], request_options={"timeout": 600})
+    # Videos that were summarized before are answered straight from the cache
+    summary = video_summaries.get_summary(video_id)
+    if summary is not None:
+        return jsonify({"video_id": video_id, "status": "done", "summary": summary}), 200
 
-        # Step 5: Return the generated summary as a response
-        return jsonify({"summary": response.text})
+    admit_llm_request()
+    try:
+        # Requests for a video that is already being summarized join the running job
+        job_id = video_jobs.submit(canonical_video_url(video_id), key=video_id)
+    except JobQueueFull as e:
+        logger.warning("Video queue full: %s", e)
+        return jsonify({"error": "Too many videos are being summarized right now, please try again shortly"}), 503, {"Retry-After": "30"}
 
-    except Exception as e:
-        # Handle exceptions and return error message
-        print("Error:", e)
-        return jsonify({"error": str(e)}), 500
+    return jsonify({"video_id": video_id, "job_id": job_id, "status": "queued", "status_url": f"/summarize-video/{job_id}"}), 202
 
-    finally:
-        # Step 6: Clean up by deleting the temporary video file
-        if os.path.exists(video_file_name):
-            os.remove(video_file_name)
-            print("\nTemporary file deleted.")
+# Endpoint to check on a video summarization job; ?wait=<seconds> long-polls until it finishes
+@routes.route('/summarize-video/<job_id>', methods=['GET'])
+async def get_video_summary_job(job_id):
+    wait = min(request.args.get('wait', 0, type=float), current_app.config['VIDEO_JOB_MAX_WAIT'])
+    # A long poll holds no thread while the job runs
+    job = await video_jobs.wait_async(job_id, wait, run_sync) if wait > 0 else await run_sync(video_jobs.get, job_id)
 
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job)
 
-def get_accountability_response3(user_input, chat_history=None):
-    """Provides a supportive response for goal setting."""
 
-    initial_prompt = """You are a super supportive and encouraging AI best friend for teenage girls aged 14-19.  You are enthusiastic, empowering, and understanding.
+# System prompt for the chatbot; it is the chat model's system instruction rather than a chat turn
+chatbot_system_prompt = """You are a super supportive and encouraging AI best friend for teenage girls aged 14-19.  You are enthusiastic, empowering, and understanding.
       You believe that girls and women are capable of achieving anything they set their minds to, regardless of societal expectations or stereotypes.
        You avoid gendered clichés and offer concrete, actionable advice where appropriate.  You understand the unique challenges faced by girls in this
        age group and provide a safe and supportive space for them to discuss their aspirations.  You help them break down their goals into smaller,
         manageable steps and celebrate their accomplishments, no matter how small. Remember to focus on building confidence and resilience.
          If the user expresses interest in a non-traditional career path for women, be extra encouraging and provide resources or examples of successful women in that field."""
 
+async def get_accountability_response3(user_input, chat_history=None):
+    """Provides a supportive response for goal setting."""
+
     # Initialize chat history if it's empty
     if chat_history is None:
         chat_history = []
 
-    # Add the initial prompt if chat history is empty
-    if not chat_history:
-        chat_history.append({"role": "user", "parts": initial_prompt})  # Important change
-        chat_history.append({"role": "model", "parts": "Awesome! I'm so excited to hear about your goals and be your biggest cheerleader! ✨ Tell me everything – I'm here to listen, support you, and help you make those dreams a reality.  No dream is too big or too small!  Let's do this! 💪"})
-
-    # Add the user's input to the chat history
-    chat_history.append({"role": "user", "parts": user_input})
-
-    # Start a chat session with the Generative AI model
-    chat = model.start_chat(history=chat_history)
-    response = chat.send_message(user_input)
-
-    # Append the response to the chat history
-    chat_history.append({"role": "model", "parts": response.text})
+    # Start a chat session with the earlier turns; send_message adds the user's input itself.
+    # The first chat may set up the Gemini client, so starting it runs off the event loop
+    chat = await run_sync(prompts['chatbot'].start_chat, history=chat_history)
+    response = await chat.send_message_async(user_input)
+
+    return response.text, chat.history
+
+# Function to fold older chatbot turns into a short running summary
+def summarize_conversation(previous_summary, turns):
+    transcript = "\n".join(f"{'User' if role == 'user' else 'You'}: {content}" for role, content in turns)
+    prompt = f"""Summarize this part of your conversation with the user in a few sentences, keeping the user's goals,
+    the steps you agreed on, and anything personal they shared that you should remember.
+    Earlier summary: {previous_summary or "(none)"}
+    Conversation:
+    {transcript}"""
+    response = model.generate_content(prompt)
+    return response.text
 
-    return response.text, chat_history
 
+# Function to get the session's conversation id, starting a new conversation if needed;
+# the session only carries the id, the history itself is stored server-side
+def current_conversation_id():
+    session.pop("chat_history", None)  # Drop history left in the cookie by older versions
+    conversation_id = session.get("conversation_id")
+    if conversation_id is None or not chat_store.exists(conversation_id):
+        conversation_id = chat_store.create(user_id=session.get('user_id'))
+        session["conversation_id"] = conversation_id
+    return conversation_id
 
-@app.route('/chatbot', methods=['POST'])
-def chatbot():
+@routes.route('/chatbot', methods=['POST'])
+async def chatbot():
     # Retrieve user input from request
     user_input = request.json.get("message")
-    chat_history = session.get("chat_history", [])
+    if not user_input:
+        return jsonify({"error": "Message is required"}), 400
+
+    admit_llm_request()
+    conversation_id = await run_sync(current_conversation_id)
 
     # Generate accountability response based on user input and chat history
-    response_text, updated_chat_history = get_accountability_response3(user_input, chat_history)
+    history = await run_sync(chat_store.history, conversation_id)
+    response_text, _ = await get_accountability_response3(user_input, history)
 
-    # Update chat history in session
-    session["chat_history"] = updated_chat_history
+    # Store the new turn, then summarize older turns if the history is over its token budget
+    await run_sync(chat_store.append, conversation_id, [("user", user_input), ("model", response_text)])
+    chat_store.compact_in_background(conversation_id, summarize_conversation)
 
     # Return the chatbot's response
     return jsonify({"response": response_text})
 
-@app.route('/generate-mentorship-guide', methods=['GET'])
-def generate_management_guide():
-    # Generate a list of 15 online resources where young women aged 14-19 can find mentors or networking opportunities
-    prompt = '''List 15 online resources and platforms and URL links, aside from LinkedIn, where young women ages 14-19 can find mentors or networking opportunities. Tailor this list to support and inspire young women seeking guidance in their career journey.
-    Provide specific platform names and a brief description of each, focusing on resources particularly suited to young women in this age range.'''
-    response = model.generate_content(prompt)
-    return response.text
+# Endpoint streaming the chatbot's reply as Server-Sent Events: "chunk" events with text as it is
+# generated, then a "done" event once the turn is stored
+@routes.route('/chatbot/stream', methods=['POST'])
+def chatbot_stream():
+    user_input = request.json.get("message")
+    if not user_input:
+        return jsonify({"error": "Message is required"}), 400
+
+    admit_llm_request()
+
+    # The conversation id has to be in the session before streaming starts, since the
+    # cookie can't change once the response headers are sent
+    conversation_id = current_conversation_id()
 
-@app.route('/generate-resources', methods=['GET'])
-def generate_mentor_resources():
-    # Generate a step-by-step guide on how to find a female mentor, including specific guidance and a sample message
-    prompt = '''Create a step-by-step guide tailored for young women ages 14-19 on how to find a female mentor in manager or CEO roles through LinkedIn or online platforms. Use a friendly, supportive tone that feels both encouraging and approachable.
+    history = chat_store.history(conversation_id)
+
+    def generate():
+        chat = prompts['chatbot'].start_chat(history=history)
+        parts = []
+        try:
+            for chunk in chat.send_message(user_input, stream=True):
+                parts.append(chunk.text)
+                yield sse_event({"text": chunk.text}, event="chunk")
+        except LLMUnavailable as e:
+            yield sse_event({"error": str(e), "retry_after": e.retry_after}, event="error")
+            return
+        except Exception:
+            # Report the failure in the stream rather than ending it as if the reply were complete
+            logger.exception("Streaming a chatbot reply failed")
+            yield sse_event({"error": "Failed to get a response"}, event="error")
+            return
+
+        response_text = "".join(parts)
+        chat_store.append(conversation_id, [("user", user_input), ("model", response_text)])
+        chat_store.compact_in_background(conversation_id, summarize_conversation)
+        yield sse_event({"response": response_text}, event="done")
+
+    return current_app.response_class(stream_with_context(generate()), mimetype='text/event-stream',
+                              headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+# Fixed prompts for the resource guides; the answer only changes when the model does,
+# so the responses are cached instead of regenerated on every GET
+resource_prompts = {
+    # A list of 15 online resources where young women aged 14-19 can find mentors or networking opportunities
+    'mentorship-guide': '''List 15 online resources and platforms and URL links, aside from LinkedIn, where young women ages 14-19 can find mentors or networking opportunities. Tailor this list to support and inspire young women seeking guidance in their career journey.
+    Provide specific platform names and a brief description of each, focusing on resources particularly suited to young women in this age range.''',
+    # A step-by-step guide on how to find a female mentor, including specific guidance and a sample message
+    'mentor-resources': '''Create a step-by-step guide tailored for young women ages 14-19 on how to find a female mentor in manager or CEO roles through LinkedIn or online platforms. Use a friendly, supportive tone that feels both encouraging and approachable.
     Provide specific guidance for each of the following steps:
     1. Searching for potential mentors.
     2. Identifying and selecting a suitable mentor.
     3. Crafting a respectful, genuine message to initiate contact.
-    Include a sample introductory message that is warm and conversational, suitable for reaching out to a potential mentor on LinkedIn.'''
-    response = model.generate_content(prompt)
-    return response.text
-
-@app.route('/generate-scholarship-guide', methods=['GET'])
-def generate_scholarship_guide():
-    # Generate a step-by-step guide for finding college scholarships and tips for success in applying
-    prompt = '''Create a step-by-step guide for finding college scholarships, followed by practical tips for success in applying. Tailor this guide to young women ages 14-19, focusing on inspiring and guiding them in their career journey.
+    Include a sample introductory message that is warm and conversational, suitable for reaching out to a potential mentor on LinkedIn.''',
+    # A step-by-step guide for finding college scholarships and tips for success in applying
+    'scholarship-guide': '''Create a step-by-step guide for finding college scholarships, followed by practical tips for success in applying. Tailor this guide to young women ages 14-19, focusing on inspiring and guiding them in their career journey.
     Include specific steps for researching scholarships, organizing applications, and preparing materials. Follow up with actionable tips to increase their chances of success.
-    '''
-    response = model.generate_content(prompt)
+    ''',
+}
+
+# Function to generate a resource guide from its fixed prompt
+def generate_resource(key):
+    response = model.generate_content(resource_prompts[key])
     return response.text
 
+# Function to fill the cache with every resource guide (force regenerates even fresh entries)
+def warm_resource_cache(force=False):
+    for key in resource_prompts:
+        producer = lambda key=key: generate_resource(key)
+        if force:
+            resource_cache.warm(key, producer)
+        else:
+            resource_cache.get(key, producer)
+
+# Concurrent requests for a resource guide that isn't cached share one model call
+resource_flights = AsyncSingleFlight()
+
+# Function to generate a resource guide and cache it, for async views
+async def produce_resource_async(key):
+    response = await model.generate_content_async(resource_prompts[key])
+    return await run_sync(resource_cache.put, key, response.text)
+
+# Serve a cached resource guide with ETag/Cache-Control so browsers can revalidate cheaply
+async def cached_resource_response(key):
+    # A stale entry is served while a background thread refreshes it; only a miss waits on the model
+    entry = await run_sync(resource_cache.peek, key, lambda: generate_resource(key))
+    if entry is None:
+        entry = await resource_flights.do(key, lambda: produce_resource_async(key))
+    response = current_app.response_class(entry.body, mimetype='text/html')
+    response.set_etag(entry.etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = resource_cache.max_age(entry)
+    response.cache_control.stale_while_revalidate = resource_cache.stale_ttl
+    return response.make_conditional(request)
+
+@routes.route('/generate-mentorship-guide', methods=['GET'])
+async def generate_management_guide():
+    return await cached_resource_response('mentorship-guide')
+
+@routes.route('/generate-resources', methods=['GET'])
+async def generate_mentor_resources():
+    return await cached_resource_response('mentor-resources')
+
+@routes.route('/generate-scholarship-guide', methods=['GET'])
+async def generate_scholarship_guide():
+    return await cached_resource_response('scholarship-guide')
+
 def main():
-    # Run the Flask application
-    app.run(port=int(os.environ.get('PORT', 5000)), debug=True)
+    app = create_app()
+
+    # Pre-warm the resource guides so the first visitors don't wait on the model
+    if os.getenv('RESOURCE_CACHE_PREWARM', '').lower() in ('1', 'true', 'yes'):
+        with app.app_context():
+            init_db()
+            warm_resource_cache()
+
+    # Run the Flask debug server with FLASK_DEBUG=1, otherwise the production ASGI server
+    if app.debug:
+        # Only the reloader's child process serves requests, so only it takes on background work
+        if is_running_from_reloader():
+            start_background_work()
+        app.run(port=int(os.environ.get('PORT', 5000)), debug=True)
+    else:
+        import asgi
+        asgi.serve()
 
 # Entry point for running the script
 if __name__ == "__main__":
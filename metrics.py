@@ -0,0 +1,217 @@
+import contextvars
+import threading
+import time
+
+# Latency buckets, in seconds, for requests, SQLite statements and model calls
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+QUERY_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 250)
+LLM_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    type = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}'
+
+
+class Gauge(Counter):
+    type = 'gauge'
+
+    def set(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram:
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=REQUEST_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def samples(self):
+        with self._lock:
+            values = {key: (list(counts), total, count) for key, (counts, total, count) in self._values.items()}
+        for key, (counts, total, count) in sorted(values.items()):
+            for bound, bucket_count in zip(self.buckets, counts):
+                yield f'{self.name}_bucket{_format_labels(self.labelnames, key, [("le", _format_value(float(bound)))])} {bucket_count}'
+            yield f'{self.name}_bucket{_format_labels(self.labelnames, key, [("le", "+Inf")])} {count}'
+            yield f'{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}'
+            yield f'{self.name}_count{_format_labels(self.labelnames, key)} {count}'
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    # Function to render every metric in the Prometheus text exposition format
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+REQUEST_DURATION = REGISTRY.register(Histogram(
+    'http_request_duration_seconds', 'Time spent handling a request, including streamed bodies.',
+    ['endpoint', 'method', 'status']))
+REQUEST_QUERIES = REGISTRY.register(Histogram(
+    'http_request_sqlite_queries', 'SQLite statements run per request.', ['endpoint'], buckets=QUERY_COUNT_BUCKETS))
+SQLITE_QUERIES = REGISTRY.register(Counter(
+    'sqlite_queries_total', 'SQLite statements run.', ['endpoint']))
+SQLITE_QUERY_DURATION = REGISTRY.register(Histogram(
+    'sqlite_query_duration_seconds', 'Time spent executing SQLite statements.', ['endpoint'], buckets=QUERY_BUCKETS))
+LLM_CALLS = REGISTRY.register(Counter(
+    'llm_calls_total', 'Model calls by outcome (success, error, or rejected by the gateway).', ['endpoint', 'operation', 'outcome']))
+LLM_CALL_DURATION = REGISTRY.register(Histogram(
+    'llm_call_duration_seconds', 'Time spent in model calls, including streamed responses.', ['endpoint', 'operation', 'outcome'], buckets=LLM_BUCKETS))
+LLM_TOKENS = REGISTRY.register(Counter(
+    'llm_tokens_total', 'Tokens sent to and received from the model.', ['endpoint', 'direction']))
+LLM_CACHED_TOKENS = REGISTRY.register(Counter(
+    'llm_cached_input_tokens_total', 'Input tokens read from a context cache rather than prefilled; part of the input tokens, billed at the cached rate.',
+    ['endpoint', 'operation']))
+LLM_RETRIES = REGISTRY.register(Counter(
+    'llm_retries_total', 'Model responses a retry loop discarded as unusable.', ['endpoint', 'step']))
+LLM_RATE_LIMITED = REGISTRY.register(Counter(
+    'llm_rate_limited_total', 'Requests turned away by the per-user and per-IP rate limits.', ['endpoint']))
+PASSWORD_HASH_QUEUE = REGISTRY.register(Histogram(
+    'password_hash_queue_seconds', 'Time a password hash waited for a free hashing process.', ['operation']))
+PASSWORD_HASH_DURATION = REGISTRY.register(Histogram(
+    'password_hash_duration_seconds', 'Time spent hashing or checking a password in a hashing process.', ['operation']))
+PASSWORD_HASHES_PENDING = REGISTRY.register(Gauge(
+    'password_hashes_pending', 'Password hashes queued or running.'))
+PASSWORD_HASH_REJECTED = REGISTRY.register(Counter(
+    'password_hash_rejected_total', 'Password hashes refused because too many were queued, or given up on after the wait limit.',
+    ['operation', 'reason']))
+
+# Work is attributed to the Flask endpoint handling it; threads outside a request count as "background"
+_endpoint = contextvars.ContextVar('metrics_endpoint', default='background')
+_request_queries = contextvars.ContextVar('metrics_request_queries', default=None)
+
+
+def current_endpoint():
+    return _endpoint.get()
+
+
+# Function to start attributing work on this thread to a request's endpoint
+def start_request(endpoint):
+    return time.perf_counter(), _endpoint.set(endpoint), _request_queries.set([0])
+
+
+# Function to record a finished request and stop attributing work to it
+def finish_request(state, method, status):
+    started, endpoint_token, queries_token = state
+    endpoint = _endpoint.get()
+    REQUEST_DURATION.observe(time.perf_counter() - started, endpoint=endpoint, method=method, status=status)
+    REQUEST_QUERIES.observe(_request_queries.get()[0], endpoint=endpoint)
+    try:
+        _request_queries.reset(queries_token)
+        _endpoint.reset(endpoint_token)
+    except ValueError:
+        # Finished from a different context than the one the request started in
+        _request_queries.set(None)
+        _endpoint.set('background')
+
+
+# Function to record one SQLite statement
+def observe_query(seconds):
+    endpoint = _endpoint.get()
+    SQLITE_QUERIES.inc(endpoint=endpoint)
+    SQLITE_QUERY_DURATION.observe(seconds, endpoint=endpoint)
+    queries = _request_queries.get()
+    if queries is not None:
+        queries[0] += 1
+
+
+# Function to record one model call; response is the (last) response object, if there was one
+def observe_llm_call(operation, seconds, outcome, response=None):
+    endpoint = _endpoint.get()
+    LLM_CALLS.inc(endpoint=endpoint, operation=operation, outcome=outcome)
+    LLM_CALL_DURATION.observe(seconds, endpoint=endpoint, operation=operation, outcome=outcome)
+    usage = getattr(response, 'usage_metadata', None)
+    if usage is not None:
+        LLM_TOKENS.inc(getattr(usage, 'prompt_token_count', 0) or 0, endpoint=endpoint, direction='input')
+        LLM_TOKENS.inc(getattr(usage, 'candidates_token_count', 0) or 0, endpoint=endpoint, direction='output')
+        LLM_CACHED_TOKENS.inc(getattr(usage, 'cached_content_token_count', 0) or 0, endpoint=endpoint, operation=operation)
+
+
+def observe_llm_retry(step):
+    LLM_RETRIES.inc(endpoint=_endpoint.get(), step=step)
+
+
+def observe_rate_limited():
+    LLM_RATE_LIMITED.inc(endpoint=_endpoint.get())
+
+
+def observe_password_hash(operation, queued, seconds):
+    PASSWORD_HASH_QUEUE.observe(queued, operation=operation)
+    PASSWORD_HASH_DURATION.observe(seconds, operation=operation)
+
+
+def observe_password_hash_rejected(operation, reason):
+    PASSWORD_HASH_REJECTED.inc(operation=operation, reason=reason)
+
+
+def set_password_hashes_pending(count):
+    PASSWORD_HASHES_PENDING.set(count)
+
+
+def render():
+    return REGISTRY.render()
@@ -0,0 +1,195 @@
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import database
+
+logger = logging.getLogger(__name__)
+
+
+class CacheEntry:
+    """A cached response body together with its ETag and the time it was produced."""
+
+    def __init__(self, body, created_at=None):
+        self.body = body
+        self.created_at = time.time() if created_at is None else created_at
+        self.etag = hashlib.sha256(body.encode('utf-8')).hexdigest()
+
+    def age(self):
+        return time.time() - self.created_at
+
+
+class ResponseCache:
+    """In-process TTL cache that serves stale entries while refreshing them in the background.
+
+    An entry younger than ``ttl`` is served as-is. Between ``ttl`` and ``ttl + stale_ttl``
+    it is still served, but a single background refresh is started for its key. Anything
+    older (or missing) is produced synchronously, with concurrent callers for the same key
+    waiting on one producer call instead of each hitting the model.
+
+    ``store`` is an optional persistent backing store with ``load(key)`` returning
+    ``(body, created_at)`` or None and ``save(key, body, created_at)``. It lets a cache
+    warmed by one process (e.g. the ``warm-cache`` CLI command) be picked up by the workers.
+    """
+
+    def __init__(self, ttl=3600, stale_ttl=86400, store=None):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.store = store
+        self._entries = {}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    def _key_lock(self, key):
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def _store(self, key, body):
+        entry = CacheEntry(body)
+        with self._lock:
+            self._entries[key] = entry
+        if self.store is not None:
+            self.store.save(key, entry.body, entry.created_at)
+        return entry
+
+    def _lookup(self, key):
+        entry = self._entries.get(key)
+        # Check the store before treating an entry as stale: another process (e.g. warm-cache)
+        # may have saved a newer body since this one was cached here
+        if self.store is not None and (entry is None or entry.age() >= self.ttl):
+            saved = self.store.load(key)
+            if saved is not None and (entry is None or saved[1] > entry.created_at):
+                with self._lock:
+                    current = self._entries.get(key)
+                    if current is None or current.created_at < saved[1]:
+                        self._entries[key] = CacheEntry(*saved)
+                    entry = self._entries[key]
+        return entry
+
+    def _refresh_in_background(self, key, producer):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                self._store(key, producer())
+            except Exception as e:
+                # Keep serving the stale entry; the next stale hit will try again
+                logger.warning("Background refresh of '%s' failed: %s", key, e)
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+    def peek(self, key, producer):
+        """Return the CacheEntry for ``key`` if one can be served now, starting a background
+        refresh with ``producer()`` if it is stale; None if it has to be produced first."""
+        entry = self._lookup(key)
+        if entry is not None:
+            age = entry.age()
+            if age < self.ttl:
+                return entry
+            if age < self.ttl + self.stale_ttl:
+                self._refresh_in_background(key, producer)
+                return entry
+        return None
+
+    def get(self, key, producer):
+        """Return the CacheEntry for ``key``, calling ``producer()`` to build it when needed."""
+        entry = self.peek(key, producer)
+        if entry is not None:
+            return entry
+
+        # Nothing usable cached: produce it once, even if several requests arrive together
+        with self._key_lock(key):
+            entry = self._lookup(key)
+            if entry is not None and entry.age() < self.ttl:
+                return entry
+            return self._store(key, producer())
+
+    def put(self, key, body):
+        """Store a body produced elsewhere (e.g. by an async producer) and return its entry."""
+        return self._store(key, body)
+
+    def warm(self, key, producer):
+        """Produce and store ``key`` unconditionally (used to pre-warm at startup)."""
+        with self._key_lock(key):
+            return self._store(key, producer())
+
+    def max_age(self, entry):
+        """Seconds a client may keep ``entry`` before it should revalidate."""
+        return max(0, int(self.ttl - entry.age()))
+
+
+class VersionedBodyCache:
+    """In-process LRU of serialized response bodies, each kept with the version of the data it
+    was built from.
+
+    A lookup with a different version rebuilds the body and replaces the entry, so nothing has
+    to be invalidated explicitly: writers only need to bump the version. At most
+    ``max_entries`` bodies are kept, least recently used first out.
+    """
+
+    def __init__(self, max_entries=2000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, version, producer):
+        """Return the body for ``key`` at ``version``, calling ``producer()`` on a miss.
+
+        A producer returning None means there is nothing to serve; that isn't cached.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                return entry[1]
+
+        body = producer()
+        if body is not None:
+            with self._lock:
+                # Don't let a slow producer overwrite a body built from newer data
+                current = self._entries.get(key)
+                if current is None or current[0] <= version:
+                    self._entries[key] = (version, body)
+                    self._entries.move_to_end(key)
+                    if len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+        return body
+
+
+class SQLiteResponseStore:
+    """Persists cache entries in the ResourceCache table so they survive restarts."""
+
+    def __init__(self, database):
+        self.database = database
+
+    def _connect(self):
+        # Entries may be saved from background refresh threads, so don't rely on flask.g
+        return database.connection(self.database)
+
+    def load(self, key):
+        try:
+            row = self._connect().execute('SELECT body, created_at FROM ResourceCache WHERE key = ?', (key,)).fetchone()
+            return tuple(row) if row else None
+        except sqlite3.Error as e:
+            logger.warning("Could not load cached '%s': %s", key, e)
+            return None
+
+    def save(self, key, body, created_at):
+        try:
+            with self._connect() as db:
+                db.execute('''
+                    INSERT INTO ResourceCache (key, body, created_at) VALUES (?, ?, ?)
+                    ON CONFLICT(key) DO UPDATE SET body = excluded.body, created_at = excluded.created_at
+                ''', (key, body, created_at))
+        except sqlite3.Error as e:
+            logger.warning("Could not save cached '%s': %s", key, e)
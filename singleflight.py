@@ -0,0 +1,119 @@
+import asyncio
+import threading
+import time
+import uuid
+
+import database
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Runs at most one call per key at a time within this process.
+
+    Callers that arrive while a call for their key is in flight wait for it and get its
+    result (or its exception) instead of starting their own.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+        else:
+            try:
+                call.result = fn()
+            except Exception as e:
+                call.error = e
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+
+class AsyncSingleFlight:
+    """SingleFlight for coroutines on one event loop: while a call for a key is running,
+    other callers for the key await the same task. A caller that goes away (e.g. a client
+    that disconnects) doesn't cancel the call for the others. Callers on other event loops
+    (e.g. a CLI command's asyncio.run()) make their own call."""
+
+    def __init__(self):
+        self._tasks = {}
+
+    async def do(self, key, fn):
+        task = self._tasks.get(key)
+        if task is None or task.get_loop() is not asyncio.get_running_loop():
+            task = self._tasks[key] = asyncio.ensure_future(fn())
+            task.add_done_callback(lambda done: self._tasks.pop(key) if self._tasks.get(key) is done else None)
+        return await asyncio.shield(task)
+
+
+class GenerationLeases:
+    """Durable "generating" markers in the GenerationLease table.
+
+    A lease extends single-flight across worker processes: only the process that inserted
+    the row for a key generates, the others wait for the row to disappear. A lease older
+    than ``timeout`` is assumed to belong to a crashed worker and can be taken over.
+    """
+
+    def __init__(self, database_path, timeout=120, poll_interval=0.5):
+        self.database_path = database_path
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+
+    def _connect(self):
+        return database.connection(self.database_path)
+
+    def acquire(self, key):
+        """Returns an owner token if this caller now holds the lease for key, else None."""
+        owner = uuid.uuid4().hex
+        now = time.time()
+        with self._connect() as db:
+            acquired = db.execute('''
+                INSERT INTO GenerationLease (key, owner, started_at) VALUES (?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET owner = excluded.owner, started_at = excluded.started_at
+                WHERE GenerationLease.started_at < ?
+            ''', (key, owner, now, now - self.timeout)).rowcount
+        return owner if acquired else None
+
+    def release(self, key, owner):
+        with self._connect() as db:
+            db.execute('DELETE FROM GenerationLease WHERE key = ? AND owner = ?', (key, owner))
+
+    def held(self, key):
+        return self._connect().execute('SELECT 1 FROM GenerationLease WHERE key = ?', (key,)).fetchone() is not None
+
+    def wait(self, key):
+        """Blocks until nobody holds the lease for key, or until the lease times out."""
+        deadline = time.monotonic() + self.timeout
+        while time.monotonic() < deadline:
+            if not self.held(key):
+                return True
+            time.sleep(self.poll_interval)
+        return False
+
+    async def wait_async(self, key, run):
+        """wait() for coroutines; run(fn, *args) runs each check, e.g. on a database executor."""
+        deadline = time.monotonic() + self.timeout
+        while time.monotonic() < deadline:
+            if not await run(self.held, key):
+                return True
+            await asyncio.sleep(self.poll_interval)
+        return False
@@ -2,6 +2,10 @@ import React, { useState, useEffect, useRef } from 'react';
 import { Link, useNavigate } from 'react-router-dom';
 import '../styles/Chatbot.css';
 import api from '../axiosConfig';
+import ResponsiveImage, { Logo } from './ResponsiveImage';
+
+// Shown in place of a reply that couldn't be fetched, or that broke off midway
+const FAILED_REPLY = 'Sorry, something went wrong. Please try again.';
 
 function Chatbot() {
   // State to hold messages between the user and the bot
@@ -33,26 +37,83 @@ function Chatbot() {
       setMessages(newMessages);
       setUserInput('');
 
-      // Sends user's message to the backend
-      fetch('/chatbot', {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-        },
-        body: JSON.stringify({ message: userInput }),
-      })
-        .then((response) => response.json())
-        .then((data) => {
-          // Adds bot's response to messages list
-          setMessages((prevMessages) => [
-            ...prevMessages,
-            { sender: 'bot', text: data.response },
-          ]);
-        })
-        .catch((error) => {
-          console.error('Error:', error);
-        });
+      // Sends user's message to the backend and shows the reply as it streams in
+      streamReply(userInput).catch((error) => {
+        console.error('Error:', error);
+        setMessages((prevMessages) => [...prevMessages, { sender: 'bot', text: FAILED_REPLY }]);
+      });
+    }
+  };
+
+  // Reads the bot's reply from the Server-Sent Events stream, growing the last message chunk by chunk
+  const streamReply = async (message) => {
+    const response = await fetch('/chatbot/stream', {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+      },
+      body: JSON.stringify({ message }),
+    });
+    if (!response.ok || !response.body) {
+      // Shows the server's reason, e.g. a 429 when the assistant is busy or the user is sending too fast
+      const body = await response.json().catch(() => ({}));
+      setMessages((prevMessages) => [...prevMessages, { sender: 'bot', text: body.error || FAILED_REPLY }]);
+      return;
+    }
+
+    // Adds an empty bot message that the chunks are appended to
+    setMessages((prevMessages) => [...prevMessages, { sender: 'bot', text: '' }]);
+    const appendToReply = (text) => {
+      setMessages((prevMessages) => {
+        const last = prevMessages[prevMessages.length - 1];
+        return [...prevMessages.slice(0, -1), { ...last, text: last.text + text }];
+      });
+    };
+    // Ends the bot message with an error, after whatever part of the reply did arrive
+    const failReply = (error) => {
+      setMessages((prevMessages) => {
+        const last = prevMessages[prevMessages.length - 1];
+        const text = last.text ? `${last.text} (${error})` : error;
+        return [...prevMessages.slice(0, -1), { ...last, text }];
+      });
+    };
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    while (true) {
+      let chunk;
+      try {
+        chunk = await reader.read();
+      } catch (error) {
+        // The connection dropped midway
+        console.error('Error:', error);
+        break;
+      }
+      const { done, value } = chunk;
+      if (done) {
+        break;
+      }
+      buffer += decoder.decode(value, { stream: true });
+
+      // Events are separated by a blank line; keep any incomplete event in the buffer
+      const events = buffer.split('\n\n');
+      buffer = events.pop();
+      for (const event of events) {
+        const type = event.match(/^event: (.*)$/m)?.[1];
+        const data = event.match(/^data: (.*)$/m)?.[1];
+        if (type === 'chunk' && data) {
+          appendToReply(JSON.parse(data).text);
+        } else if (type === 'error') {
+          failReply((data && JSON.parse(data).error) || FAILED_REPLY);
+          return;
+        } else if (type === 'done') {
+          return;
+        }
+      }
     }
+    // The stream closed without a done event, so the reply is incomplete
+    failReply(FAILED_REPLY);
   };
 
   // Handles user logout
@@ -69,7 +130,7 @@ function Chatbot() {
     <div>
       {/* Navbar with links to other pages */}
       <header className="navbar">
-        <Link to="/home"><img src="grow_to_impress_logo.png" alt="logo" className="logo" /></Link>
+        <Link to="/home"><Logo /></Link>
         <div className="navbar-links">
           <Link to="/how-to-section" className="nav-link">LEARN HOW TO</Link>
           <Link to="/chatbot" className="nav-link active">IXIA</Link>
@@ -93,8 +154,9 @@ function Chatbot() {
           {messages.map((msg, index) => (
             <div key={index} className={`message ${msg.sender}`}>
               {msg.sender === 'bot' && (
-                <img
-                  src="Gemini_Generated_Image_6opy9e6opy9e6opy.jpg"
+                <ResponsiveImage
+                  name="Gemini_Generated_Image_6opy9e6opy9e6opy.jpg"
+                  sizes="50px"
                   className="avatar"
                   alt="Bot Avatar"
                 />
@@ -2,6 +2,7 @@ import React, { useState } from 'react';
 import { Link, useNavigate } from 'react-router-dom';
 import '../styles/HomePage.css';
 import api from '../axiosConfig';
+import ResponsiveImage, { Logo } from './ResponsiveImage';
 
 function HomePage() {
     // State to handle dropdown visibility for logout
@@ -35,7 +36,7 @@ function HomePage() {
             {/* Navbar with links to other pages */}
             <header id="home-navbar">
                 <Link to="/home">
-                    <img src="grow_to_impress_logo.png" alt="logo" className="logo" />
+                    <Logo />
                 </Link>
                 <div className="navbar-links">
                     <Link to="/how-to-section" className="nav-link">LEARN HOW TO</Link>
@@ -60,7 +61,7 @@ function HomePage() {
             </div>
             {/* Section for 'Learn How To' */}
             <div className="section" id="how-to-section">
-                <img src="/Gemini_Generated_Image_6ze6ir6ze6ir6ze6.jpeg" alt="How To" className="section-image" />
+                <ResponsiveImage name="Gemini_Generated_Image_6ze6ir6ze6ir6ze6.jpeg" sizes="120px" alt="How To" className="section-image" />
                 <div className="section-text">
                     <h3><Link to="/how-to-section">LEARN HOW TO</Link></h3>
                     <p>The Learn How to section is a 21-day guide to help you achieve specific goals by forming new habits. Each day you complete, a flower symbolizing your progress will grow, with the goal of making it bloom fully at the end of the 21 days. Simply select a goal, check off each completed day, and watch as your habit-building journey unfolds, rewarding you with a blooming flower at the finish line! 🌸</p>
@@ -68,7 +69,7 @@ function HomePage() {
             </div>
             {/* Section for 'IXIA Chatbot' */}
             <div className="section" id="chatbot-section">
-                <img src="/Gemini_Generated_Image_ghgrbkghgrbkghgr.jpeg" alt="IXIA Chatbot" className="section-image" />
+                <ResponsiveImage name="Gemini_Generated_Image_ghgrbkghgrbkghgr.jpeg" sizes="120px" alt="IXIA Chatbot" className="section-image" />
                 <div className="section-text">
                     <h3><Link to="/chatbot">IXIA</Link></h3>
                     <p>Interact with IXIA, an AI chatbot that provides motivational support and personalized guidance to help you stay on track with your goals.</p>
@@ -76,7 +77,7 @@ function HomePage() {
             </div>
             {/* Section for 'Guides' */}
             <div className="section" id="guides-section">
-                <img src="/Gemini_Generated_Image_kxn534kxn534kxn5.jpeg" alt="Guides" className="section-image" />
+                <ResponsiveImage name="Gemini_Generated_Image_kxn534kxn534kxn5.jpeg" sizes="120px" alt="Guides" className="section-image" />
                 <div className="section-text">
                     <h3><Link to="/resources">GUIDES</Link></h3>
                     <p>Access a variety of educational resources and step-by-step guides tailored to help you achieve both personal and professional goals.</p>
@@ -84,7 +85,7 @@ function HomePage() {
             </div>
             {/* Section for 'Stories of Inspiration' */}
             <div className="section" id="stories-section">
-                <img src="/Gemini_Generated_Image_wnz0xvwnz0xvwnz0.jpeg" alt="Stories of Inspiration" className="section-image" />
+                <ResponsiveImage name="Gemini_Generated_Image_wnz0xvwnz0xvwnz0.jpeg" sizes="120px" alt="Stories of Inspiration" className="section-image" />
                 <div className="section-text">
                     <h3><Link to="/stories">STORIES OF INSPIRATION</Link></h3>
                     <p>Read real-life stories of inspiration from people who have overcome challenges and made a difference. Let their experiences motivate you on your own journey.</p>
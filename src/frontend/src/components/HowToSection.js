@@ -1,7 +1,8 @@
-import React, { useState, useEffect, useCallback } from 'react'; 
+import React, { useState, useEffect, useCallback, useRef } from 'react'; 
 import { Link, useNavigate } from 'react-router-dom';
 import axios from 'axios';
 import '../styles/HowToSection.css';
+import { Logo } from './ResponsiveImage';
 
 function HowToSection({ userId }) {
   // State to keep track of selected topic
@@ -14,8 +15,9 @@ function HowToSection({ userId }) {
   const [loading, setLoading] = useState(false);
   // Current day index user is working on
   const [currentDayIndex, setCurrentDayIndex] = useState(0);
-  // State to track if progress is updating
-  const [isUpdating, setIsUpdating] = useState(false);
+  // Day changes not yet sent to the server, keyed by topic and day
+  const pendingUpdates = useRef({});
+  const flushTimer = useRef(null);
   // State to manage flower sizes to visualize progress
   const [flowerSizes, setFlowerSizes] = useState(new Array(6).fill(20));
   // State to handle dropdown visibility for logout
@@ -32,23 +34,51 @@ function HowToSection({ userId }) {
     "Improving Communication Skills"
   ], []);
 
+  // Send queued day changes in one request
+  const flushProgress = useCallback(async () => {
+    clearTimeout(flushTimer.current);
+    flushTimer.current = null;
+    const updates = Object.values(pendingUpdates.current);
+    pendingUpdates.current = {};
+    if (updates.length === 0) return;
+
+    try {
+      await axios.post('/update-progress', { updates });
+    } catch (error) {
+      console.error("Failed to update day completion status:", error);
+    }
+  }, []);
+
+  // Send anything still queued when leaving the page or the component
+  useEffect(() => {
+    const sendPending = () => {
+      const updates = Object.values(pendingUpdates.current);
+      pendingUpdates.current = {};
+      if (updates.length > 0) {
+        navigator.sendBeacon('/update-progress', new Blob([JSON.stringify({ updates })], { type: 'application/json' }));
+      }
+    };
+    window.addEventListener('pagehide', sendPending);
+    return () => {
+      window.removeEventListener('pagehide', sendPending);
+      flushProgress();
+    };
+  }, [flushProgress]);
+
   // Fetch guide and user progress based on selected topic
   const fetchGuideAndProgress = useCallback(async (goalIndex) => {
     setLoading(true);
     const selectedTopic = topics()[goalIndex];
 
     try {
-      const guideResponse = await axios.get(`/get-guide/${selectedTopic}`);
+      // Save queued changes first so the progress read includes them
+      await flushProgress();
+      const guideResponse = await axios.get(`/get-guide/${selectedTopic}/progress`);
       if (guideResponse.data.daily_guide) {
         const guideData = guideResponse.data.daily_guide.guide;
         setGuide(guideData);
 
-        const progressResponse = await axios.post('/get-user-progress', { user_id: userId });
-        const userProgress = progressResponse.data.progress || {};
-
-        const completedDays = userProgress[selectedTopic]
-          ? userProgress[selectedTopic].filter(day => day.completed).map(day => day.day)
-          : [];
+        const completedDays = guideData.filter(day => day.completed).map(day => day.day);
 
         setCheckedDays(completedDays);
         setFlowerSizes(prevSizes => prevSizes.map((size, index) => Math.min(20 + completedDays.length * 2, 50)));
@@ -64,7 +94,7 @@ function HowToSection({ userId }) {
       console.error("Error fetching guide or progress:", error);
     }
     setLoading(false);
-  }, [userId, topics]);
+  }, [topics, flushProgress]);
 
   // Fetch guide and progress whenever selected topic changes
   useEffect(() => {
@@ -72,9 +102,8 @@ function HowToSection({ userId }) {
     fetchGuideAndProgress(goalIndex);
   }, [selected, userId, fetchGuideAndProgress]);
 
-  // Handle checkbox to update completed days
-  const handleCheckboxChange = async (day) => {
-    setIsUpdating(true);
+  // Handle checkbox to update completed days; changes are batched and sent after a short pause
+  const handleCheckboxChange = (day) => {
     const updatedCheckedDays = checkedDays.includes(day)
       ? checkedDays.filter(d => d !== day)
       : [...checkedDays, day];
@@ -83,17 +112,9 @@ function HowToSection({ userId }) {
     setFlowerSizes(prevSizes => prevSizes.map((size, index) => Math.min(20 + updatedCheckedDays.length * 2, 50)));
     setCurrentDayIndex((prevIndex) => Math.min(prevIndex + 1, guide.length - 1));
 
-    try {
-      await axios.post('/update-day-completion', {
-        user_id: userId,
-        topic: selected,
-        day,
-        completed: updatedCheckedDays.includes(day)
-      });
-    } catch (error) {
-      console.error("Failed to update day completion status:", error);
-    }
-    setIsUpdating(false);
+    pendingUpdates.current[`${selected}:${day}`] = { topic: selected, day, completed: updatedCheckedDays.includes(day) };
+    clearTimeout(flushTimer.current);
+    flushTimer.current = setTimeout(flushProgress, 1000);
   };
 
   // Handle user logout
@@ -139,7 +160,7 @@ function HowToSection({ userId }) {
     <div className="how-to-section">
       {/* Navbar */}
       <header className="navbar">
-        <Link to="/home"><img src="grow_to_impress_logo.png" alt="logo" className="logo" /></Link>
+        <Link to="/home"><Logo /></Link>
         <div className="navbar-links">
           <Link to="/how-to-section" className="nav-link active">LEARN HOW TO</Link>
           <Link to="/chatbot" className="nav-link">IXIA</Link>
@@ -190,7 +211,6 @@ function HowToSection({ userId }) {
                   type="checkbox"
                   checked={checkedDays.includes(currentDay.day)}
                   onChange={() => handleCheckboxChange(currentDay.day)}
-                  disabled={isUpdating}
                 />
                 <span>Day {currentDay.day}: {currentDay.title}</span>
               </div>
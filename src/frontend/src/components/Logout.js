@@ -1,5 +1,6 @@
 import React from 'react'; 
 import { Link, useNavigate } from 'react-router-dom';
+import { Logo } from './ResponsiveImage';
 
 function Logout() {
   const navigate = useNavigate();
@@ -17,7 +18,7 @@ function Logout() {
       {/* Navbar with links to other pages */}
       <header className="navbar">
         <Link to="/home">
-          <img src="grow_to_impress_logo.png" alt="logo" className="logo" />
+          <Logo />
         </Link>
         <div className="navbar-links">
           <Link to="/how-to-section" className="nav-link">LEARN HOW TO</Link>
@@ -3,6 +3,7 @@ import { Link, useNavigate } from 'react-router-dom';
 import ReactMarkdown from 'react-markdown';
 import '../styles/Resources.css';
 import api from '../axiosConfig';
+import { Logo } from './ResponsiveImage';
 
 function Resources() {
   // State to store URL input
@@ -79,8 +80,11 @@ function Resources() {
         throw new Error("Failed to summarize video. Please check the URL or try again.");
       }
 
-      const data = await response.json();
-      setSummary(data.summary);
+      // Cached videos come back immediately; otherwise the server queues the video and
+      // returns a job id to long-poll until the summary is ready
+      const job = await response.json();
+      const summary = job.status === "done" ? job.summary : await waitForSummary(job.status_url);
+      setSummary(summary);
       setUrl(''); // Clear URL input after submission
     } catch (err) {
       setError(err.message);
@@ -89,6 +93,27 @@ function Resources() {
     }
   };
 
+  // Poll a video summarization job until it finishes, waiting server-side between checks,
+  // and give up once it has taken longer than any video should
+  const waitForSummary = async (statusUrl, maxWaitMs = 15 * 60 * 1000) => {
+    const deadline = Date.now() + maxWaitMs;
+    while (Date.now() < deadline) {
+      const response = await fetch(`${statusUrl}?wait=30`);
+      if (!response.ok) {
+        throw new Error("Failed to summarize video. Please check the URL or try again.");
+      }
+
+      const job = await response.json();
+      if (job.status === "done") {
+        return job.summary;
+      }
+      if (job.status === "failed") {
+        throw new Error("Failed to summarize video. Please check the URL or try again.");
+      }
+    }
+    throw new Error("Summarizing this video is taking too long. Please try again later.");
+  };
+
   // Fetch guide content with retry mechanism
   const fetchGuideWithRetry = async (endpoint, maxRetries = 5) => {
     let retries = 0;
@@ -179,7 +204,7 @@ Our product uses Gemini, Google's super smart AI, to help you with your journey!
       {/* Navbar from the first version */}
       <header className="navbar">
         <Link to="/home">
-          <img src="grow_to_impress_logo.png" alt="logo" className="logo" />
+          <Logo />
         </Link>
         <div className="navbar-links">
           <Link to="/how-to-section" className="nav-link">LEARN HOW TO</Link>
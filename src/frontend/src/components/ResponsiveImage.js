@@ -0,0 +1,25 @@
+import React from 'react';
+
+// Widths of the resized copies `flask build-images` writes to public/img
+const WIDTHS = [160, 320, 640, 1280];
+
+// Renders a public image from its resized copies: WebP where the browser supports it, JPEG (or PNG
+// for images with transparency) otherwise, at the width `sizes` says the image is displayed at
+function ResponsiveImage({ name, sizes, widths = WIDTHS, fallback = 'jpg', ...imageProps }) {
+  const stem = name.replace(/\.[^.]+$/, '');
+  const srcSet = (extension) => widths.map(width => `/img/${stem}-${width}.${extension} ${width}w`).join(', ');
+
+  return (
+    <picture>
+      <source type="image/webp" srcSet={srcSet('webp')} sizes={sizes} />
+      <img src={`/img/${stem}-${widths[0]}.${fallback}`} srcSet={srcSet(fallback)} sizes={sizes} {...imageProps} />
+    </picture>
+  );
+}
+
+// The logo is 740 pixels wide, so it has no 1280 copy
+export function Logo() {
+  return <ResponsiveImage name="grow_to_impress_logo.png" fallback="png" widths={[160, 320, 640]} sizes="70px" alt="logo" className="logo" />;
+}
+
+export default ResponsiveImage;
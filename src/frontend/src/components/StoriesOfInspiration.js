@@ -1,8 +1,9 @@
-import React, { useState, useEffect } from 'react'; 
+import React, { useState, useEffect, useRef, useCallback } from 'react'; 
 import { Link, useNavigate } from 'react-router-dom';
 import axios from 'axios';
 import '../styles/StoriesOfInspiration.css';
 import api from '../axiosConfig';
+import { Logo } from './ResponsiveImage';
 
 function StoriesOfInspiration() {
   // State to store form data for story submission
@@ -16,27 +17,90 @@ function StoriesOfInspiration() {
   const [successMessage, setSuccessMessage] = useState('');
   // State to store error message if submission fails
   const [errorMessage, setErrorMessage] = useState('');
-  // State to store the list of approved stories
+  // State to store the approved stories loaded so far
   const [stories, setStories] = useState([]);
-  // State to store the current page for pagination
-  const [currentPage, setCurrentPage] = useState(1);
+  // State to store the cursor of the next page of stories (null once everything is loaded)
+  const [nextCursor, setNextCursor] = useState(0);
+  // State to indicate a page of stories is being fetched
+  const [loadingStories, setLoadingStories] = useState(false);
+  // State to store the search box text, and the search results (null when not searching)
+  const [searchQuery, setSearchQuery] = useState('');
+  const [searchResults, setSearchResults] = useState(null);
+  // State to store the offset of the next page of search results (null once everything is loaded)
+  const [searchNext, setSearchNext] = useState(null);
   // State to manage dropdown visibility for logout
   const [showDropdown, setShowDropdown] = useState(false);
   const cardsPerPage = 9;
+  const loadMoreRef = useRef(null);
   const navigate = useNavigate();
 
-  // Fetch approved stories on component mount
+  // Fetch the next page of approved stories
+  const fetchApprovedStories = useCallback(async () => {
+    if (nextCursor === null || loadingStories) {
+      return;
+    }
+    setLoadingStories(true);
+    try {
+      const response = await axios.get('/approved-stories', { params: { after: nextCursor, limit: cardsPerPage } });
+      setStories((prev) => [...prev, ...response.data.stories]);
+      setNextCursor(response.data.next);
+    } catch (error) {
+      console.error("Failed to fetch approved stories", error);
+    } finally {
+      setLoadingStories(false);
+    }
+  }, [nextCursor, loadingStories]);
+
+  // Load the next page whenever the end of the gallery scrolls into view
   useEffect(() => {
-    const fetchApprovedStories = async () => {
+    const sentinel = loadMoreRef.current;
+    if (!sentinel) {
+      return undefined;
+    }
+    const observer = new IntersectionObserver((entries) => {
+      if (entries[0].isIntersecting) {
+        fetchApprovedStories();
+      }
+    });
+    observer.observe(sentinel);
+    return () => observer.disconnect();
+  }, [fetchApprovedStories]);
+
+  // Search as the user types, once they pause; responses to older queries are ignored
+  useEffect(() => {
+    const query = searchQuery.trim();
+    if (!query) {
+      setSearchResults(null);
+      return undefined;
+    }
+    let cancelled = false;
+    const timer = setTimeout(async () => {
       try {
-        const response = await axios.get('/approved-stories');
-        setStories(response.data);
+        const response = await axios.get('/stories/search', { params: { q: query, limit: cardsPerPage } });
+        if (!cancelled) {
+          setSearchResults(response.data.stories);
+          setSearchNext(response.data.next);
+        }
       } catch (error) {
-        console.error("Failed to fetch approved stories", error);
+        console.error("Failed to search stories", error);
       }
+    }, 300);
+    return () => {
+      cancelled = true;
+      clearTimeout(timer);
     };
-    fetchApprovedStories();
-  }, []);
+  }, [searchQuery]);
+
+  // Fetch the next page of search results
+  const loadMoreResults = async () => {
+    try {
+      const response = await axios.get('/stories/search', { params: { q: searchQuery.trim(), limit: cardsPerPage, offset: searchNext } });
+      setSearchResults((prev) => [...prev, ...response.data.stories]);
+      setSearchNext(response.data.next);
+    } catch (error) {
+      console.error("Failed to search stories", error);
+    }
+  };
 
   // Handle form input change
   const handleChange = (e) => {
@@ -93,21 +157,11 @@ function StoriesOfInspiration() {
     }
 };
 
-  // Pagination logic to determine which stories to display
-  const indexOfLastCard = currentPage * cardsPerPage;
-  const indexOfFirstCard = indexOfLastCard - cardsPerPage;
-  const currentCards = stories.slice(indexOfFirstCard, indexOfLastCard);
-
-  // Handle moving to the next page of stories
-  const nextPage = () => setCurrentPage((prev) => prev + 1);
-  // Handle moving to the previous page of stories
-  const prevPage = () => setCurrentPage((prev) => prev - 1);
-
   return (
     <div className="stories-page">
       {/* Navbar */}
       <header className="navbar">
-        <Link to="/home"><img src="grow_to_impress_logo.png" alt="logo" className="logo" /></Link>
+        <Link to="/home"><Logo /></Link>
         <div className="navbar-links">
           <Link to="/how-to-section" className="nav-link">LEARN HOW TO</Link>
           <Link to="/chatbot" className="nav-link">IXIA</Link>
@@ -168,25 +222,59 @@ function StoriesOfInspiration() {
           {errorMessage && <p className="error-message">{errorMessage}</p>} {/* Display error message */}
         </div>
 
-        {/* Gallery of approved stories */}
+        {/* Gallery of approved stories, or of the stories matching the search */}
         <div className="stories-gallery">
-          {currentCards.map(story => (
-            <Link key={story.id} to={`/story/${story.id}`} className="story-card-link">
-              <div className="story-card">
-                <img src={story.image} alt="User submitted" />
-                <div>
-                  <h3>{story.name}</h3>
-                  <p>{story.story.substring(0, 100)}...</p> {/* Truncated for preview */}
+          <input
+            type="search"
+            className="stories-search"
+            placeholder="Search stories..."
+            value={searchQuery}
+            onChange={(e) => setSearchQuery(e.target.value)}
+          />
+
+          {searchResults !== null ? (
+            <>
+              {searchResults.length === 0 && <p>No stories match your search.</p>}
+              {searchResults.map(story => (
+                <Link key={story.id} to={`/story/${story.id}`} className="story-card-link">
+                  <div className="story-card">
+                    {story.image && <img src={story.image} alt="User submitted" loading="lazy" />}
+                    <div>
+                      {/* The server escapes the story text and only adds <mark> around the matches */}
+                      <h3 dangerouslySetInnerHTML={{ __html: story.name_html }} />
+                      <p dangerouslySetInnerHTML={{ __html: story.snippet_html }} />
+                    </div>
+                  </div>
+                </Link>
+              ))}
+              {searchNext !== null && (
+                <div className="pagination">
+                  <button onClick={loadMoreResults}>Load more results</button>
                 </div>
-              </div>
-            </Link>
-          ))}
-
-          {/* Pagination Controls */}
-          <div className="pagination">
-            <button onClick={prevPage} disabled={currentPage === 1}>Previous</button>
-            <button onClick={nextPage} disabled={indexOfLastCard >= stories.length}>Next</button>
-          </div>
+              )}
+            </>
+          ) : (
+            <>
+              {stories.map(story => (
+                <Link key={story.id} to={`/story/${story.id}`} className="story-card-link">
+                  <div className="story-card">
+                    {story.image && <img src={story.image} alt="User submitted" loading="lazy" />}
+                    <div>
+                      <h3>{story.name}</h3>
+                      <p>{story.excerpt.substring(0, 100)}...</p> {/* Truncated for preview */}
+                    </div>
+                  </div>
+                </Link>
+              ))}
+
+              {/* Infinite scroll: more stories load when this comes into view */}
+              {nextCursor !== null && (
+                <div ref={loadMoreRef} className="pagination">
+                  {loadingStories && <p>Loading more stories...</p>}
+                </div>
+              )}
+            </>
+          )}
         </div>
       </div>
     </div>
@@ -3,6 +3,7 @@ import { useParams, Link, useNavigate } from 'react-router-dom';
 import axios from 'axios';
 import '../styles/StoryDetail.css';
 import api from '../axiosConfig';
+import { Logo } from './ResponsiveImage';
 
 function StoryDetail() {
   const { id } = useParams(); // Get the story ID from the route parameters
@@ -44,7 +45,7 @@ function StoryDetail() {
     <div className="story-detail-page">
       {/* Navbar */}
       <header className="navbar">
-       <Link to="/home"><img src="/grow_to_impress_logo.png" alt="logo" className="logo" /></Link>
+       <Link to="/home"><Logo /></Link>
        <div className="navbar-links">
           <Link to="/how-to-section" className="nav-link">LEARN HOW TO</Link>
           <Link to="/chatbot" className="nav-link">IXIA</Link>
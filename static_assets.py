@@ -0,0 +1,156 @@
+import gzip
+import logging
+import mimetypes
+import os
+import re
+
+from flask import abort, request, send_file
+from werkzeug.security import safe_join
+
+logger = logging.getLogger(__name__)
+
+# Precompressed copies written next to a file, best first, with the Content-Encoding each is served with
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+# Files worth compressing; images and fonts are compressed already
+COMPRESSIBLE = {'.html', '.js', '.css', '.json', '.map', '.svg', '.txt', '.ico', '.xml'}
+
+# Smaller files gain too little to be worth a compressed copy
+MIN_COMPRESS_BYTES = 1024
+
+# Create React App fingerprints what it builds: main.1a2b3c4d.js, 453.8f3c8e1a.chunk.css, logo.5d5d9eef.png
+HASHED_NAME = re.compile(r'\.[0-9a-f]{8,}\.')
+
+# Fingerprinted files never change, so browsers may keep them for a year without revalidating
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+# Widths, in pixels, of the resized copies of each public image; never larger than the original
+IMAGE_WIDTHS = (160, 320, 640, 1280)
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png'}
+
+
+# Function to pick the newest precompressed copy of a file that the client accepts
+def _encoded_copy(path):
+    """Returns (path, encoding, has_copies); copies older than the file are ignored as stale."""
+    modified = os.stat(path).st_mtime
+    has_copies = False
+    for encoding, suffix in ENCODINGS:
+        try:
+            copy_modified = os.stat(path + suffix).st_mtime
+        except OSError:
+            continue
+        has_copies = True
+        if copy_modified >= modified and request.accept_encodings[encoding]:
+            return path + suffix, encoding, True
+    return path, None, has_copies
+
+
+# Function to serve a file from the frontend build with caching suited to it
+def send_asset(folder, filename, max_age):
+    """Serves a precompressed .br/.gz copy when the client accepts it. Fingerprinted files are
+    cached as immutable, HTML always revalidates and anything else may be kept for max_age
+    seconds. Conditional and range requests are answered by send_file."""
+    path = safe_join(folder, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+
+    mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    served, encoding, has_copies = _encoded_copy(path)
+
+    if HASHED_NAME.search(os.path.basename(path)):
+        cache_for = IMMUTABLE_MAX_AGE
+    elif mimetype == 'text/html':
+        cache_for = 0
+    else:
+        cache_for = max_age
+
+    # The ETag comes from the file actually sent, so each encoding gets its own
+    response = send_file(served, mimetype=mimetype, conditional=True, max_age=cache_for)
+    if encoding is not None:
+        response.content_encoding = encoding
+    if has_copies:
+        response.vary.add('Accept-Encoding')
+    if cache_for == IMMUTABLE_MAX_AGE:
+        response.cache_control.immutable = True
+    elif cache_for == 0:
+        response.cache_control.no_cache = True
+    return response
+
+
+# Function to write gzip, and brotli if the Brotli package is installed, copies of a build's text files
+def compress_directory(folder):
+    """Returns the paths written. Copies that wouldn't be smaller than the file are skipped."""
+    try:
+        import brotli
+    except ImportError:
+        brotli = None
+        logger.warning("The Brotli package is not installed; writing gzip copies only")
+
+    written = []
+    for root, _, names in os.walk(folder):
+        for name in names:
+            path = os.path.join(root, name)
+            if os.path.splitext(name)[1].lower() not in COMPRESSIBLE:
+                continue
+            with open(path, 'rb') as source:
+                data = source.read()
+            if len(data) < MIN_COMPRESS_BYTES:
+                continue
+
+            # mtime=0 keeps the gzip output identical between builds of the same file
+            copies = {'.gz': gzip.compress(data, compresslevel=9, mtime=0)}
+            if brotli is not None:
+                copies['.br'] = brotli.compress(data, quality=11)
+            for suffix, compressed in copies.items():
+                if len(compressed) < len(data):
+                    with open(path + suffix, 'wb') as output:
+                        output.write(compressed)
+                    written.append(path + suffix)
+    return written
+
+
+# Function to write resized copies of the images in a folder, for use in srcset
+def build_image_variants(folder, output, widths=IMAGE_WIDTHS):
+    """Writes <name>-<width>.webp plus a .jpg (or .png, for images with transparency) copy at
+    each width up to the original's. Images whose copies are newer than the original are left
+    alone. Returns the paths written."""
+    # Pillow is imported on first use, so starting the app doesn't pay for it
+    from PIL import Image, ImageOps
+
+    os.makedirs(output, exist_ok=True)
+    written = []
+    built = {}
+    for name in sorted(os.listdir(folder)):
+        stem, extension = os.path.splitext(name)
+        if extension.lower() not in IMAGE_EXTENSIONS:
+            continue
+        # Copies are named by stem, so photo.jpeg and photo.png would overwrite each other
+        if stem in built:
+            logger.warning("Skipping %s: variants of %s are already built from %s", name, stem, built[stem])
+            continue
+        built[stem] = name
+
+        path = os.path.join(folder, name)
+        with Image.open(path) as image:
+            image.load()
+            image = ImageOps.exif_transpose(image)
+        has_alpha = image.mode in ('RGBA', 'LA', 'P') and image.convert('RGBA').getchannel('A').getextrema()[0] < 255
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+        fallback = 'png' if has_alpha else 'jpg'
+
+        for width in widths:
+            if width > image.width:
+                continue
+            targets = [os.path.join(output, f'{stem}-{width}.{extension}') for extension in ('webp', fallback)]
+            if all(os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(path) for target in targets):
+                continue
+
+            resized = image.resize((width, round(image.height * width / image.width)), Image.LANCZOS)
+            resized.save(targets[0], 'WEBP', quality=80, method=6)
+            if has_alpha:
+                resized.save(targets[1], 'PNG', optimize=True)
+            else:
+                resized.save(targets[1], 'JPEG', quality=82, optimize=True, progressive=True)
+            written.extend(targets)
+    return written
@@ -0,0 +1,185 @@
+import hashlib
+import logging
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+
+import database
+
+logger = logging.getLogger(__name__)
+
+# Formats accepted from uploads; anything else is rejected before processing
+ALLOWED_FORMATS = {'JPEG', 'PNG', 'WEBP', 'GIF'}
+
+# Longest side, in pixels, of every stored size
+SIZES = {
+    'master': 1600,
+    'medium': 800,
+    'thumb': 320,
+}
+
+# Refuse images whose pixel count would make decoding itself expensive
+MAX_PIXELS = 40_000_000
+
+
+class InvalidImage(ValueError):
+    """Raised when an upload isn't an image we accept."""
+
+
+class ImageQueueFull(Exception):
+    """Raised when too many story images are already waiting to be processed."""
+
+
+# Function to cheaply check an upload from its header, without decoding the pixels
+def inspect_image(data):
+    """Returns (format, width, height) or raises InvalidImage."""
+    # Pillow is imported on first use, so starting the app doesn't pay for it
+    from PIL import Image
+    try:
+        with Image.open(BytesIO(data)) as image:
+            image_format, (width, height) = image.format, image.size
+    except Exception as e:
+        raise InvalidImage("The uploaded file is not a readable image") from e
+
+    if image_format not in ALLOWED_FORMATS:
+        raise InvalidImage(f"{image_format} images are not supported")
+    if width * height > MAX_PIXELS:
+        raise InvalidImage("The uploaded image has too many pixels")
+    return image_format, width, height
+
+
+def _encode(image, image_format, **options):
+    buffer = BytesIO()
+    image.save(buffer, image_format, **options)
+    return buffer.getvalue()
+
+
+# Function to build every stored variant of an upload; runs in the image process pool
+def build_variants(data):
+    """Decodes the upload, applies its EXIF orientation, drops all metadata and returns
+    {variant: (mime_type, width, height, bytes)} for each size in JPEG/PNG and WebP."""
+    from PIL import Image, ImageOps
+    inspect_image(data)
+    with Image.open(BytesIO(data)) as image:
+        image.load()
+        image = ImageOps.exif_transpose(image)
+
+    # Keep transparency as PNG; everything else becomes JPEG
+    has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+    image = image.convert('RGBA' if has_alpha else 'RGB')
+
+    variants = {}
+    for size, longest_side in SIZES.items():
+        resized = image.copy()
+        resized.thumbnail((longest_side, longest_side), Image.LANCZOS)
+        width, height = resized.size
+
+        # Saving a fresh image without exif=/icc_profile= strips the original metadata
+        if has_alpha:
+            variants[size] = ('image/png', width, height, _encode(resized, 'PNG', optimize=True))
+        else:
+            variants[size] = ('image/jpeg', width, height, _encode(resized, 'JPEG', quality=85, optimize=True, progressive=True))
+        variants[f'{size}-webp'] = ('image/webp', width, height, _encode(resized, 'WEBP', quality=80, method=4))
+    return variants
+
+
+class ImageIngestion:
+    """Builds story image variants in a process pool and stores them once they're ready.
+
+    save() keeps the raw upload in the StoryImageUpload table, in the caller's transaction,
+    and the row is deleted once the variants are stored. At most ``max_pending`` uploads may
+    be waiting; beyond that save() raises ImageQueueFull. An upload whose processing failed
+    is tried again, and resume() queues the ones a stopped process left behind (claimed
+    more than ``stale_after`` seconds ago); an upload is given up on after ``max_attempts``.
+    """
+
+    def __init__(self, database, max_workers=2, max_pending=20, stale_after=10 * 60, max_attempts=3):
+        self.database = database
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.stale_after = stale_after
+        self.max_attempts = max_attempts
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                # Spawn rather than fork: forking a multi-threaded web server can deadlock the child
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                     mp_context=multiprocessing.get_context('spawn'))
+            return self._executor
+
+    def save(self, db, story_id, data):
+        """Keep an upload for processing in the caller's transaction; submit() it once that commits."""
+        pending = db.execute('SELECT COUNT(*) FROM StoryImageUpload').fetchone()[0]
+        if pending >= self.max_pending:
+            raise ImageQueueFull(f"{pending} story images are already waiting")
+        db.execute('INSERT INTO StoryImageUpload (story_id, data, attempts, claimed_at) VALUES (?, ?, 1, ?)',
+                   (story_id, data, time.time()))
+
+    def submit(self, story_id, data):
+        """Queue a saved upload for processing; the story gets its image when the variants are stored."""
+        future = self._pool().submit(build_variants, data)
+        future.add_done_callback(lambda done: self._store(story_id, done))
+        return future
+
+    def resume(self):
+        """Queue the uploads left behind by a process that stopped before storing them."""
+        db = database.connection(self.database)
+        stale_before = time.time() - self.stale_after
+        for (story_id,) in db.execute('SELECT story_id FROM StoryImageUpload WHERE claimed_at < ?', (stale_before,)).fetchall():
+            self._retry(db, story_id, stale_before)
+
+    # Function to claim an upload for another attempt and queue it, or drop it once out of attempts
+    def _retry(self, db, story_id, claimed_before):
+        # The claimed_at condition keeps two processes from resuming the same upload
+        with db:
+            row = db.execute('SELECT attempts, data FROM StoryImageUpload WHERE story_id = ? AND claimed_at < ?',
+                             (story_id, claimed_before)).fetchone()
+            if row is None:
+                return
+            if row['attempts'] >= self.max_attempts:
+                db.execute('DELETE FROM StoryImageUpload WHERE story_id = ?', (story_id,))
+            else:
+                db.execute('UPDATE StoryImageUpload SET attempts = attempts + 1, claimed_at = ? WHERE story_id = ?',
+                           (time.time(), story_id))
+
+        if row['attempts'] >= self.max_attempts:
+            logger.error("Gave up on the image of story %s after %d attempts", story_id, row['attempts'])
+        else:
+            self.submit(story_id, row['data'])
+
+    def _store(self, story_id, future):
+        db = database.connection(self.database)
+        try:
+            variants = future.result()
+        except InvalidImage as e:
+            logger.warning("Could not process the image of story %s: %s", story_id, e)
+            with db:
+                db.execute('DELETE FROM StoryImageUpload WHERE story_id = ?', (story_id,))
+            return
+        except Exception as e:
+            logger.warning("Processing the image of story %s failed, trying again: %s", story_id, e)
+            if isinstance(e, BrokenProcessPool):
+                # A worker died and took the pool with it; the next submit starts a new one
+                with self._lock:
+                    self._executor = None
+            self._retry(db, story_id, float('inf'))
+            return
+
+        with db:
+            db.executemany('''
+                INSERT OR REPLACE INTO StoryImage (story_id, variant, mime_type, width, height, data, etag)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', [(story_id, variant, mime_type, width, height, data, hashlib.sha256(data).hexdigest())
+                  for variant, (mime_type, width, height, data) in variants.items()])
+
+            # The master replaces the original upload so the stories table never holds the raw file
+            mime_type, _, _, master = variants['master']
+            db.execute('UPDATE stories SET image = ?, mime_type = ?, image_etag = ? WHERE id = ?',
+                       (master, mime_type, hashlib.sha256(master).hexdigest(), story_id))
+            db.execute('DELETE FROM StoryImageUpload WHERE story_id = ?', (story_id,))
@@ -0,0 +1,66 @@
+import json
+
+
+# Function to format one Server-Sent Events message
+def sse_event(data, event=None):
+    message = f"event: {event}\n" if event else ""
+    return message + f"data: {json.dumps(data)}\n\n"
+
+
+class GuideDayParser:
+    """Incrementally picks complete day objects out of a streamed guide JSON document.
+
+    Feed it text chunks as they arrive; each call returns the day objects inside the
+    "guide" array that closed during that chunk. Anything before the array (the goal,
+    code fences) is skipped, and string contents are tracked so braces inside
+    titles or approaches don't confuse the nesting count.
+    """
+
+    def __init__(self):
+        self._buffer = ''
+        self._position = 0
+        self._in_guide = False
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._day_start = None
+
+    def feed(self, chunk):
+        self._buffer += chunk
+        days = []
+
+        if not self._in_guide:
+            key = self._buffer.find('"guide"')
+            if key == -1:
+                return days
+            array = self._buffer.find('[', key)
+            if array == -1:
+                return days
+            self._in_guide = True
+            self._position = array + 1
+
+        while self._position < len(self._buffer):
+            char = self._buffer[self._position]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == '\\':
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char == '{':
+                if self._depth == 0:
+                    self._day_start = self._position
+                self._depth += 1
+            elif char == '}':
+                self._depth -= 1
+                if self._depth == 0 and self._day_start is not None:
+                    try:
+                        days.append(json.loads(self._buffer[self._day_start:self._position + 1]))
+                    except json.JSONDecodeError:
+                        pass
+                    self._day_start = None
+            self._position += 1
+        return days
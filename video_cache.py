@@ -0,0 +1,86 @@
+import re
+import time
+from urllib.parse import urlparse, parse_qs
+
+import database
+
+# YouTube video ids are always 11 characters from this alphabet
+VIDEO_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{11}$')
+
+YOUTUBE_HOSTS = {'youtube.com', 'www.youtube.com', 'm.youtube.com', 'music.youtube.com', 'youtube-nocookie.com',
+                 'www.youtube-nocookie.com'}
+
+
+# Function to reduce any supported YouTube URL to its canonical video id
+def youtube_video_id(url):
+    """Returns the 11-character video id for watch, youtu.be, shorts, embed, live and
+    playlist-item URLs, or None if the URL doesn't point at a single YouTube video."""
+    parsed = urlparse(url.strip() if '://' in url else 'https://' + url.strip())
+    host = (parsed.hostname or '').lower()
+    path = [part for part in parsed.path.split('/') if part]
+
+    video_id = None
+    if host in ('youtu.be', 'www.youtu.be'):
+        video_id = path[0] if path else None
+    elif host in YOUTUBE_HOSTS:
+        if path[:1] == ['watch']:
+            # Playlist items are plain watch URLs with an extra list= parameter
+            video_id = parse_qs(parsed.query).get('v', [None])[0]
+        elif len(path) >= 2 and path[0] in ('shorts', 'embed', 'live', 'v'):
+            video_id = path[1]
+
+    if video_id and VIDEO_ID_PATTERN.match(video_id):
+        return video_id
+    return None
+
+
+# Function to build the URL that is actually handed to yt-dlp for a video id
+def canonical_video_url(video_id):
+    return f"https://www.youtube.com/watch?v={video_id}"
+
+
+class VideoSummaryCache:
+    """Summaries and uploaded Gemini file handles stored per YouTube video id in SQLite."""
+
+    def __init__(self, database):
+        self.database = database
+
+    def _connect(self):
+        # Used from video job worker threads, so use that thread's own connection
+        return database.connection(self.database)
+
+    def _get(self, video_id, column):
+        return self._connect().execute(f"SELECT {column} FROM VideoSummary WHERE video_id = ?", (video_id,)).fetchone()
+
+    def _upsert(self, video_id, **fields):
+        fields['updated_at'] = time.time()
+        columns = ', '.join(fields)
+        placeholders = ', '.join('?' for _ in fields)
+        updates = ', '.join(f"{name} = excluded.{name}" for name in fields)
+        with self._connect() as db:
+            db.execute(f'''
+                INSERT INTO VideoSummary (video_id, {columns}) VALUES (?, {placeholders})
+                ON CONFLICT(video_id) DO UPDATE SET {updates}
+            ''', (video_id, *fields.values()))
+
+    def get_summary(self, video_id):
+        row = self._get(video_id, 'summary')
+        return row['summary'] if row else None
+
+    def set_summary(self, video_id, summary):
+        self._upsert(video_id, summary=summary)
+
+    def get_file_name(self, video_id):
+        """Returns the name of a previously uploaded Gemini file that has not expired yet."""
+        row = self._get(video_id, 'file_name, file_expires_at')
+        if row is None or row['file_name'] is None:
+            return None
+        if row['file_expires_at'] is not None and row['file_expires_at'] <= time.time():
+            return None
+        return row['file_name']
+
+    def set_file(self, video_id, file_name, expires_at):
+        self._upsert(video_id, file_name=file_name, file_expires_at=expires_at)
+
+    def forget_file(self, video_id):
+        self._upsert(video_id, file_name=None, file_expires_at=None)
@@ -0,0 +1,225 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import database
+
+logger = logging.getLogger(__name__)
+
+
+class JobQueueFull(Exception):
+    """Raised when too many video jobs are already waiting for a worker."""
+
+
+class VideoJobQueue:
+    """Runs video summarization jobs on a bounded thread pool and keeps them in SQLite.
+
+    Each job runs the pipeline ``stages`` in order; a stage is a ``(name, fn)`` pair where
+    ``fn(ctx)`` reads and updates a per-job context dict. The final summary is taken from
+    ``ctx['summary']``. The time spent in every stage is stored with the job, and jobs
+    that were queued when the process stopped are picked up again by ``start()``.
+    If given, ``run_in()`` returns a context manager each job runs inside, such as an app context.
+
+    A running job touches its ``updated_at`` every ``heartbeat_interval`` seconds. One that
+    hasn't for ``stale_after`` seconds lost its worker (a crash or restart) and is re-queued by
+    ``recover()``, or marked failed once it has been started ``max_attempts`` times.
+    """
+
+    def __init__(self, database, stages, max_workers=2, max_pending=20, stale_after=5 * 60, heartbeat_interval=30,
+                 max_attempts=3, cleanup=None, run_in=None):
+        self.database = database
+        self.stages = stages
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.stale_after = stale_after
+        self.heartbeat_interval = heartbeat_interval
+        self.max_attempts = max_attempts
+        self.cleanup = cleanup
+        self.run_in = run_in
+        self._executor = None
+        self._last_recovery = 0.0
+        self._lock = threading.Lock()
+        self._finished = threading.Condition()
+
+    def _connect(self):
+        # Jobs are updated from worker threads, so use that thread's own connection
+        return database.connection(self.database)
+
+    def _update(self, job_id, **fields):
+        fields['updated_at'] = time.time()
+        assignments = ', '.join(f"{name} = ?" for name in fields)
+        with self._connect() as db:
+            db.execute(f"UPDATE VideoJob SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+    def start(self):
+        """Create the worker pool and run the jobs left behind by a previous process."""
+        with self._lock:
+            if self._executor is not None:
+                return
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='video-job')
+
+        self.recover(force=True)
+        pending = [row['id'] for row in self._connect().execute("SELECT id FROM VideoJob WHERE status = 'queued' ORDER BY created_at")]
+        for job_id in pending:
+            self._executor.submit(self._run, job_id)
+
+    def recover(self, force=False):
+        """Re-queue running jobs whose heartbeat stopped, or fail those out of attempts.
+
+        submit() and get() call this, so a dead job is noticed by the next request that touches
+        the queue; unless ``force`` is set it checks at most once per heartbeat interval.
+        """
+        self.start()
+        now = time.time()
+        with self._lock:
+            if not force and now - self._last_recovery < self.heartbeat_interval:
+                return
+            self._last_recovery = now
+
+        db = self._connect()
+        stale_before = now - self.stale_after
+        stale = db.execute("SELECT id, attempts FROM VideoJob WHERE status = 'running' AND updated_at < ?", (stale_before,)).fetchall()
+        for job_id, attempts in stale:
+            # The updated_at condition keeps two processes from recovering the same job
+            with db:
+                if attempts >= self.max_attempts:
+                    recovered = db.execute('''UPDATE VideoJob SET status = 'failed', stage = NULL, error = ?, updated_at = ?
+                                              WHERE id = ? AND status = 'running' AND updated_at < ?''',
+                                           (f"Stopped responding {attempts} times", now, job_id, stale_before)).rowcount
+                else:
+                    recovered = db.execute('''UPDATE VideoJob SET status = 'queued', stage = NULL, updated_at = ?
+                                              WHERE id = ? AND status = 'running' AND updated_at < ?''',
+                                           (now, job_id, stale_before)).rowcount
+            if not recovered:
+                continue
+            if attempts >= self.max_attempts:
+                logger.error("Video job %s failed: its worker stopped responding %d times", job_id, attempts)
+                with self._finished:
+                    self._finished.notify_all()
+            else:
+                logger.warning("Re-queued video job %s, whose worker stopped responding", job_id)
+                self._executor.submit(self._run, job_id)
+
+    def submit(self, url, key=None):
+        """Queue a job for ``url`` and return its id without waiting for it to run.
+
+        Jobs with the same ``key`` share one run: while one is queued or running, submitting
+        the key again returns the existing job's id instead of starting another.
+        """
+        self.recover()
+        job_id = uuid.uuid4().hex
+        now = time.time()
+
+        db = self._connect()
+        if key is not None:
+            existing = self._pending_job_for(db, key)
+            if existing is not None:
+                return existing
+
+        pending = db.execute("SELECT COUNT(*) FROM VideoJob WHERE status IN ('queued', 'running')").fetchone()[0]
+        if pending >= self.max_pending:
+            raise JobQueueFull(f"{pending} video jobs are already pending")
+        try:
+            with db:
+                db.execute("INSERT INTO VideoJob (id, url, job_key, status, timings, created_at, updated_at) VALUES (?, ?, ?, 'queued', '{}', ?, ?)",
+                           (job_id, url, key, now, now))
+        except sqlite3.IntegrityError:
+            # Another request queued the same key between our check and insert
+            return self._pending_job_for(db, key)
+
+        self._executor.submit(self._run, job_id)
+        return job_id
+
+    def _pending_job_for(self, db, key):
+        row = db.execute("SELECT id FROM VideoJob WHERE job_key = ? AND status IN ('queued', 'running')", (key,)).fetchone()
+        return row['id'] if row else None
+
+    def get(self, job_id):
+        """Return the job as a dict, or None if there is no such job."""
+        self.recover()
+        row = self._connect().execute(
+            "SELECT id, url, status, stage, summary, error, timings, created_at, updated_at FROM VideoJob WHERE id = ?", (job_id,)
+        ).fetchone()
+
+        if row is None:
+            return None
+        job = dict(row)
+        job['timings'] = json.loads(job['timings'] or '{}')
+        return job
+
+    def wait(self, job_id, timeout):
+        """Long-poll: block up to ``timeout`` seconds for the job to finish, then return it."""
+        deadline = time.monotonic() + timeout
+        job = self.get(job_id)
+        while job is not None and job['status'] in ('queued', 'running'):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            with self._finished:
+                # Jobs finished by another process don't notify us, so re-check periodically
+                self._finished.wait(min(remaining, 5))
+            job = self.get(job_id)
+        return job
+
+    async def wait_async(self, job_id, timeout, run, poll_interval=0.5):
+        """wait() for coroutines: re-checks the job every ``poll_interval`` seconds, with
+        run(fn, *args) running each check, e.g. on a database executor."""
+        deadline = time.monotonic() + timeout
+        job = await run(self.get, job_id)
+        while job is not None and job['status'] in ('queued', 'running'):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            await asyncio.sleep(min(remaining, poll_interval))
+            job = await run(self.get, job_id)
+        return job
+
+    # Function to keep a running job's updated_at fresh through long stages, until `stop` is set
+    def _heartbeat(self, job_id, stop):
+        while not stop.wait(self.heartbeat_interval):
+            try:
+                self._update(job_id)
+            except Exception as e:
+                logger.warning("Could not record the heartbeat of video job %s: %s", job_id, e)
+
+    def _run(self, job_id):
+        if self.run_in is not None:
+            with self.run_in():
+                return self._run_job(job_id)
+        return self._run_job(job_id)
+
+    def _run_job(self, job_id):
+        with self._connect() as db:
+            # Claim the job so a second process resuming the queue doesn't run it too
+            claimed = db.execute("UPDATE VideoJob SET status = 'running', attempts = attempts + 1, updated_at = ? WHERE id = ? AND status = 'queued'",
+                                 (time.time(), job_id)).rowcount
+        url, key = db.execute("SELECT url, job_key FROM VideoJob WHERE id = ?", (job_id,)).fetchone()
+        if not claimed:
+            return
+
+        ctx = {'job_id': job_id, 'url': url, 'key': key}
+        timings = {}
+        beating = threading.Event()
+        threading.Thread(target=self._heartbeat, args=(job_id, beating), name='video-job-heartbeat', daemon=True).start()
+        try:
+            for name, stage in self.stages:
+                self._update(job_id, stage=name)
+                started = time.perf_counter()
+                stage(ctx)
+                timings[name] = round(time.perf_counter() - started, 3)
+                self._update(job_id, timings=json.dumps(timings))
+            self._update(job_id, status='done', stage=None, summary=ctx.get('summary'))
+        except Exception as e:
+            logger.exception("Video job %s failed", job_id)
+            self._update(job_id, status='failed', error=str(e), timings=json.dumps(timings))
+        finally:
+            beating.set()
+            if self.cleanup is not None:
+                self.cleanup(ctx)
+            with self._finished:
+                self._finished.notify_all()
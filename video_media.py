@@ -0,0 +1,94 @@
+import html
+import os
+import re
+
+
+# Subtitle formats we know how to turn into plain text, in order of preference
+SUBTITLE_FORMATS = ('vtt',)
+
+# Audio-only streams are enough for a summary; the smallest video is the last resort
+MEDIA_FORMAT = 'bestaudio[ext=m4a]/bestaudio/worst'
+
+TAG_PATTERN = re.compile(r'<[^>]+>')
+
+
+class MediaTooLarge(ValueError):
+    """Raised when a video is longer or bigger than the configured caps."""
+
+
+# Function to read a video's metadata (duration, subtitle tracks) without downloading it
+def probe(url):
+    import yt_dlp  # Imported on first use; it takes a while to load
+    with yt_dlp.YoutubeDL({'quiet': True, 'no_warnings': True, 'noplaylist': True, 'skip_download': True}) as ydl:
+        return ydl.extract_info(url, download=False)
+
+
+# Function to turn a WebVTT subtitle file into plain transcript text
+def vtt_to_text(vtt):
+    lines = []
+    for line in vtt.splitlines():
+        line = line.strip()
+        if not line or line == 'WEBVTT' or '-->' in line or line.isdigit():
+            continue
+        if line.startswith(('Kind:', 'Language:', 'NOTE', 'STYLE')):
+            continue
+        text = html.unescape(TAG_PATTERN.sub('', line)).strip()
+        # Auto-captions repeat the previous line at the start of every cue
+        if text and (not lines or lines[-1] != text):
+            lines.append(text)
+    return '\n'.join(lines)
+
+
+# Function to pick the best subtitle track for the preferred languages
+def _subtitle_track(info, languages):
+    # Uploaded subtitles are more accurate than automatic captions, so try them first
+    for tracks in (info.get('subtitles') or {}, info.get('automatic_captions') or {}):
+        for language in languages:
+            candidates = [lang for lang in tracks if lang == language or lang.startswith(language + '-')]
+            for lang in candidates:
+                for track in tracks[lang]:
+                    if track.get('ext') in SUBTITLE_FORMATS and track.get('url'):
+                        return track
+    return None
+
+
+# Function to fetch a transcript from existing subtitles or auto-captions
+def fetch_transcript(info, languages=('en',)):
+    """Returns the video's transcript as plain text, or None if it has no usable captions."""
+    track = _subtitle_track(info, languages)
+    if track is None:
+        return None
+
+    import yt_dlp
+    with yt_dlp.YoutubeDL({'quiet': True, 'no_warnings': True}) as ydl:
+        vtt = ydl.urlopen(track['url']).read().decode('utf-8', errors='replace')
+    return vtt_to_text(vtt) or None
+
+
+# Function to check a video against the duration cap before spending bandwidth on it
+def check_duration(info, max_duration):
+    duration = info.get('duration')
+    if max_duration and duration and duration > max_duration:
+        raise MediaTooLarge(f"Video is {duration // 60} minutes long; the limit is {max_duration // 60} minutes")
+
+
+# Function to download the smallest usable media stream into the given directory
+def download_media(url, directory, max_bytes):
+    """Downloads an audio-only (or lowest resolution) stream and returns its path."""
+    options = {
+        'quiet': True,
+        'no_warnings': True,
+        'noplaylist': True,
+        'format': MEDIA_FORMAT,
+        'outtmpl': os.path.join(directory, 'media.%(ext)s'),
+        'max_filesize': max_bytes,
+    }
+    import yt_dlp
+    with yt_dlp.YoutubeDL(options) as ydl:
+        info = ydl.extract_info(url, download=True)
+        path = ydl.prepare_filename(info)
+
+    # yt-dlp silently skips files over max_filesize instead of failing
+    if not os.path.exists(path):
+        raise MediaTooLarge(f"Video is larger than the {max_bytes // (1024 * 1024)} MB download limit")
+    return path